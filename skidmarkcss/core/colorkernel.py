@@ -0,0 +1,119 @@
+# -*- coding: latin-1 -*-
+
+"""The batched color operations of the palette plugins: the colors of a whole
+batch (PackedColor) are computed together, in vectorized form when NumPy is
+installed, in pure Python otherwise"""
+
+# NumPy takes a while to import, it is imported on first use (see has_numpy)
+numpy = None
+
+from htmlcolors import PackedColor
+
+class ColorKernel(object):
+  """Classmethods computing batches of colors. The results are identical with
+  and without NumPy"""
+  
+  # None until the first batch, then whether NumPy is used
+  use_numpy = None
+  
+  @classmethod
+  def has_numpy(cls):
+    """Imports NumPy, returns False if it is not installed"""
+    
+    global numpy
+    
+    try:
+      import numpy
+    except ImportError:
+      return False
+    
+    return True
+  
+  @classmethod
+  def mix(cls, colors_a, colors_b, weights):
+    """Returns the list of the colors mixing each color of colors_a with the
+    color of colors_b found at the same position, weights being the weight of
+    the colors of colors_b (0.0 to 1.0). The alpha is mixed as well"""
+    
+    if not colors_a:
+      return []
+    
+    if cls.use_numpy is None:
+      cls.use_numpy = cls.has_numpy()
+    
+    if cls.use_numpy:
+      return cls._mix_numpy(colors_a, colors_b, weights)
+    
+    return cls._mix_python(colors_a, colors_b, weights)
+  
+  @classmethod
+  def _mix_python(cls, colors_a, colors_b, weights):
+    """Helper function for mix(), one color at a time"""
+    
+    colors = []
+    for color_a, color_b, weight in zip(colors_a, colors_b, weights):
+      packed = 0
+      for shift in COMPONENT_SHIFTS:
+        a = (color_a >> shift) & 0xFF
+        b = (color_b >> shift) & 0xFF
+        packed |= int(a + (b - a) * weight + 0.5) << shift
+      colors.append(PackedColor(packed))
+    
+    return colors
+  
+  @classmethod
+  def _mix_numpy(cls, colors_a, colors_b, weights):
+    """Helper function for mix(), the whole batch at once: one row per color,
+    one column per component"""
+    
+    shifts = numpy.array(COMPONENT_SHIFTS, dtype=numpy.int64)
+    a = (numpy.array(colors_a, dtype=numpy.int64)[:, None] >> shifts) & 0xFF
+    b = (numpy.array(colors_b, dtype=numpy.int64)[:, None] >> shifts) & 0xFF
+    w = numpy.array(weights, dtype=numpy.float64)[:, None]
+    
+    mixed = numpy.floor(a + (b - a) * w + 0.5).astype(numpy.int64)
+    packed = numpy.bitwise_or.reduce(mixed << shifts, axis=1)
+    
+    return [ PackedColor(int(value)) for value in packed ]
+  
+  @classmethod
+  def scale(cls, scales):
+    """Returns the scale of colors (list) of each tuple of scales: ( color,
+    steps ). A scale goes from a tint of the color (mixed with white) to a
+    shade (mixed with black) in evenly spaced steps, the color itself being in
+    the middle when the number of steps is odd. The colors of all the scales
+    are mixed in a single batch"""
+    
+    colors_a, colors_b, weights = [], [], []
+    for color, steps in scales:
+      white = PackedColor.from_rgb(255, 255, 255, color.a)
+      black = PackedColor.from_rgb(0, 0, 0, color.a)
+      
+      for step in range(1, steps + 1):
+        position = 2.0 * step / (steps + 1)
+        if position <= 1.0:
+          colors_a.append(white)
+          colors_b.append(color)
+          weights.append(position)
+        else:
+          colors_a.append(color)
+          colors_b.append(black)
+          weights.append(position - 1.0)
+    
+    colors = cls.mix(colors_a, colors_b, weights)
+    
+    results = []
+    start = 0
+    for color, steps in scales:
+      results.append(colors[start:start + steps])
+      start += steps
+    
+    return results
+
+
+#
+# Constants
+#
+
+# Positions of the components in a PackedColor: red, green, blue, alpha
+COMPONENT_SHIFTS = ( 24, 16, 8, 0 )
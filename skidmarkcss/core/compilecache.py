@@ -0,0 +1,79 @@
+# -*- coding: latin-1 -*-
+
+"""The CSS of the sources compiled before, reused when an identical source is
+compiled again with the same config (see skidmark.compile_bytes)"""
+
+import hashlib
+
+from lrucache import LRUCache
+from plugincache import PluginCache
+
+class CompileCache(object):
+  """The CSS (bytes) of the compiled sources, keyed by the hash of the source
+  and the config. At most size entries and max_bytes bytes of CSS are kept,
+  the least recently used being removed first. The CSS must depend on nothing
+  else, the key excludes:
+    the global scope (variables, templates): the cached compilations start
+    from an empty one, or from the prelude snapshot of the config
+    the results of the plugins: the sources calling plugins that aren't pure
+    must not be cached"""
+  
+  def __init__(self, size=None, max_bytes=None):
+    self.entries = LRUCache(size or COMPILE_CACHE_SIZE, max_bytes or COMPILE_CACHE_BYTES)
+  
+  def __len__(self):
+    return len(self.entries)
+  
+  @classmethod
+  def get_key(cls, src, config):
+    """Returns the key of the source (string or unicode) compiled with the
+    config (dict), or None if the config can't be hashed"""
+    
+    if isinstance(src, unicode):
+      digest = "u" + hashlib.sha1(src.encode("utf-8")).digest()
+    else:
+      digest = hashlib.sha1(src).digest()
+    
+    key = ( digest, PluginCache.get_key(config) )
+    try:
+      hash(key)
+    except TypeError:
+      return None
+    
+    return key
+  
+  def get(self, key):
+    """Returns the CSS of the key, or None if it is not cached"""
+    
+    return self.entries.get(key)
+  
+  def set(self, key, css):
+    """Keeps the CSS of the key"""
+    
+    self.entries.set(key, css)
+    
+    return
+  
+  def get_stats(self):
+    """Returns the statistics of the cache, a dict with the keys: entries,
+    bytes, hits, misses and evictions"""
+    
+    return self.entries.get_stats()
+  
+  def clear(self):
+    """Removes the cached CSS"""
+    
+    self.entries.clear()
+    
+    return
+
+
+#
+# Constants
+#
+
+# Maximum number of compiled sources kept
+COMPILE_CACHE_SIZE = 1000
+
+# Maximum number of bytes of CSS kept
+COMPILE_CACHE_BYTES = 16 * 1024 * 1024
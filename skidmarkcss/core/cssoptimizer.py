@@ -0,0 +1,184 @@
+# -*- coding: latin-1 -*-
+
+"""Optimizer passes that run on the rendered entries of a SkidmarkCSS object.
+The entries are those returned by SkidmarkCSS._generate_css_get_entries():
+strings (text nodes and media queries) or ( selectors, declaration block )"""
+
+import re
+
+from propertyexpandables import ShorthandHandler
+from skidmarknodes import n_DeclarationBlock
+
+re_selector_compound = re.compile(r"\s*[>+~]\s*|\s+")
+re_selector_simple = re.compile(r"(\[[^\]]*\]|::?[-_A-Za-z0-9]+(?:\([^)]*\))?|[#.][-_A-Za-z0-9]+|[^#.:\[]+)")
+
+LEGACY_PSEUDO_ELEMENTS = ( ":before", ":after", ":first-line", ":first-letter" )
+CONDITIONAL_VALUE_MARKERS = ( "-moz-", "-webkit-", "-o-", "-ms-", "-khtml-", "progid:", "expression(" )
+
+class SelectorHandler(object):
+  """Classmethods used to compare selectors and compute their specificity"""
+  
+  CANONICAL_SELECTORS = {}
+  
+  def __init__(self):
+    pass
+  
+  @classmethod
+  def split_compound(cls, compound):
+    """Returns the simple selectors (list) of a compound selector.
+    Example: "a.x:hover" -> [ "a", ".x", ":hover" ]"""
+    
+    return [ simple for simple in re_selector_simple.findall(compound) if simple ]
+  
+  @classmethod
+  def get_specificity(cls, selector):
+    """Returns the specificity of the selector as a tuple: ( ids, classes,
+    elements ). Attributes and pseudo-classes count as classes, pseudo-elements
+    count as elements"""
+    
+    ids, classes, elements = 0, 0, 0
+    
+    for compound in re_selector_compound.split(selector.strip()):
+      for simple in cls.split_compound(compound):
+        if simple.startswith("#"):
+          ids += 1
+        elif simple.startswith("::") or simple in LEGACY_PSEUDO_ELEMENTS:
+          elements += 1
+        elif simple[0] in ".[:":
+          classes += 1
+        elif simple != "*":
+          elements += 1
+    
+    return ids, classes, elements
+  
+  @classmethod
+  def get_canonical(cls, selector):
+    """Returns the canonical form of a selector. The simple selectors of each
+    compound are sorted (after the element name) so that 'a.y.x' and 'a.x.y',
+    which match the same elements, share the same canonical form"""
+    
+    canonical = cls.CANONICAL_SELECTORS.get(selector)
+    
+    if canonical is None:
+      combinators = [ c.strip() or " " for c in re_selector_compound.findall(selector.strip()) ] + [ "" ]
+      compounds = []
+      
+      for compound, combinator in zip(re_selector_compound.split(selector.strip()), combinators):
+        simples = cls.split_compound(compound)
+        if simples and simples[0][0] not in "#.[:":
+          simples = simples[:1] + sorted(simples[1:])
+        else:
+          simples = sorted(simples)
+        compounds.append("".join(simples) + combinator)
+      
+      canonical = "".join(compounds)
+      cls.CANONICAL_SELECTORS[selector] = canonical
+    
+    return canonical
+
+
+class DeadDeclarationEliminator(object):
+  """Removes the declarations that are provably dead: a declaration is dead if
+  a later rule, within the same media scope, sets the same property for every
+  one of its selectors with a selector that matches the same elements with the
+  same specificity.
+  
+  Only unconditional declarations may override: the later declaration must not
+  be part of a vendor prefix group (a value such as '-webkit-gradient(...)', or
+  the same property set several times in the block as a fallback) and must be
+  '!important' if the dead declaration is."""
+  
+  def __init__(self):
+    pass
+  
+  @classmethod
+  def is_important(cls, value):
+    """Returns True if the property value is flagged as '!important'"""
+    
+    return value.replace(" ", "").lower().endswith("!important")
+  
+  @classmethod
+  def is_conditional(cls, value):
+    """Returns True if the value may not be understood by every browser (it
+    would then not override a declaration set beforehand)"""
+    
+    value = value.lower()
+    
+    for marker in CONDITIONAL_VALUE_MARKERS:
+      if marker in value:
+        return True
+    return False
+  
+  @classmethod
+  def get_overridden_properties(cls, prop_name):
+    """Returns the property names (set) that a property overrides. A shorthand
+    overrides all the properties it expands to"""
+    
+    overridden = set([ prop_name ])
+    
+    for p_name in ShorthandHandler.get_all_expand_properties(prop_name):
+      overridden.update(cls.get_overridden_properties(p_name))
+    
+    return overridden
+  
+  @classmethod
+  def eliminate(cls, entries, render=None):
+    """Walks the entries from the last to the first, removing the declarations
+    that are overridden by those found further down. The 'render' function
+    (selectors, properties) -> string is used to compute the bytes saved.
+    Returns a tuple: ( entries, declarations removed, bytes saved )"""
+    
+    overrides = {}
+    kept_entries = []
+    removed_count = 0
+    bytes_saved = 0
+    
+    for entry in reversed(entries):
+      if isinstance(entry, basestring):
+        kept_entries.append(entry)
+        continue
+      
+      all_selectors, blk = entry
+      specificities = [ SelectorHandler.get_specificity(selector) for selector in all_selectors ]
+      keys = [ SelectorHandler.get_canonical(selector) for selector in all_selectors ]
+      
+      properties = [ ( property, ) + n_DeclarationBlock.get_property_parts(property) for property in blk.properties ]
+      name_count = {}
+      for property, p_name, p_value in properties:
+        name_count[p_name] = name_count.get(p_name, 0) + 1
+      
+      kept = []
+      for property, p_name, p_value in properties:
+        level = cls.is_important(p_value) and 1 or 0
+        
+        overriding = [ overrides.get((key, p_name)) for key in keys ]
+        if None not in overriding and not [ o for o, specificity in zip(overriding, specificities) if o[0] < level or o[1] < specificity ]:
+          removed_count += 1
+          continue
+        
+        kept.append(( property, p_name, p_value ))
+      
+      # This block's unconditional declarations override those found above
+      for property, p_name, p_value in kept:
+        if name_count[p_name] != 1 or cls.is_conditional(p_value):
+          continue
+        
+        level = cls.is_important(p_value) and 1 or 0
+        for overridden_name in cls.get_overridden_properties(p_name):
+          for key, specificity in zip(keys, specificities):
+            current = overrides.get((key, overridden_name))
+            if current is None or current[0] < level:
+              overrides[(key, overridden_name)] = ( level, specificity )
+      
+      if len(kept) != len(properties):
+        before = render and len(render(all_selectors, blk.properties)) or 0
+        blk.properties = [ property for property, p_name, p_value in kept ]
+        after = blk.properties and render and len(render(all_selectors, blk.properties)) or 0
+        bytes_saved += before - after
+      
+      if blk.properties:
+        kept_entries.append(entry)
+    
+    kept_entries.reverse()
+    
+    return kept_entries, removed_count, bytes_saved
@@ -0,0 +1,69 @@
+# -*- coding: latin-1 -*-
+
+"""The numeric values of the math expressions: a number and its unit, parsed
+once and only formatted back to a string for the final result"""
+
+import re
+
+re_dimension = re.compile(r"^\s*([-+]?(?:\d+(?:\.\d+)?|\d+))(.*)$", re.S)
+
+class Dimension(object):
+  """A number (int or float) along with its unit (string, empty for numbers
+  without one)"""
+  
+  __slots__ = ( "value", "unit" )
+  
+  CACHE = {}
+  CACHE_SIZE = 10000
+  
+  def __init__(self, value, unit=""):
+    self.value = value
+    self.unit = unit
+  
+  def __repr__(self):
+    return "Dimension(%r, %r)" % ( self.value, self.unit )
+  
+  def __eq__(self, other):
+    return isinstance(other, Dimension) and self.value == other.value and self.unit == other.unit
+  
+  def __ne__(self, other):
+    return not self.__eq__(other)
+  
+  @classmethod
+  def parse(cls, text):
+    """Returns the Dimension of a string such as '12px' or '-1.5'. A string that
+    does not start with a number is 0, without unit. The results are cached
+    per distinct string, the Dimension objects must not be modified"""
+    
+    dimension = cls.CACHE.get(text)
+    
+    if dimension is None:
+      mo = re_dimension.match(text)
+      if mo:
+        number = mo.group(1)
+        if "." in number:
+          dimension = cls(float(number), mo.group(2).strip())
+        else:
+          dimension = cls(int(number), mo.group(2).strip())
+      else:
+        dimension = cls(0)
+      
+      if len(cls.CACHE) >= cls.CACHE_SIZE:
+        cls.CACHE.clear()
+      cls.CACHE[text] = dimension
+    
+    return dimension
+  
+  def format(self, precision=None):
+    """Returns the string of the dimension. Floats are rounded to the number
+    of decimals given by precision (the trailing zeros being removed), or
+    converted by str() when it is None"""
+    
+    if precision is not None and isinstance(self.value, float):
+      number = ("%.*f" % ( precision, self.value )).rstrip("0").rstrip(".")
+      if number in ( "", "-", "-0" ):
+        number = "0"
+    else:
+      number = str(self.value)
+    
+    return "%s%s" % ( number, self.unit )
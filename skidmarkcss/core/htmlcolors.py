@@ -2,9 +2,50 @@
 
 """Defines the HTML colour names along with their values"""
 
+from lrucache import LRUCache
+
 class InvalidColorException(Exception):
   pass
 
+class PackedColor(int):
+  """An RGBA color packed in an int: 0xRRGGBBAA. The components are only
+  formatted as a string for the output (see HTMLColors.format)"""
+  
+  __slots__ = ()
+  
+  @classmethod
+  def from_rgb(cls, r, g, b, a=255):
+    return cls((r << 24) | (g << 16) | (b << 8) | a)
+  
+  def __repr__(self):
+    return "PackedColor(0x%08x)" % ( self, )
+  
+  @property
+  def r(self):
+    return (self >> 24) & 0xFF
+  
+  @property
+  def g(self):
+    return (self >> 16) & 0xFF
+  
+  @property
+  def b(self):
+    return (self >> 8) & 0xFF
+  
+  @property
+  def a(self):
+    return self & 0xFF
+  
+  def get_rgb(self):
+    """Returns the tuple: ( r, g, b )"""
+    
+    return ( (self >> 24) & 0xFF, (self >> 16) & 0xFF, (self >> 8) & 0xFF )
+  
+  def get_hex(self):
+    """Returns the hex value of the color (#rrggbb, lower case)"""
+    
+    return "#%06x" % ( self >> 8, )
+
 class HTMLColors(object):
   htmlcolors = {
     'aliceblue': '#F0F8FF',
@@ -155,18 +196,48 @@ class HTMLColors(object):
     'yellow': '#FFFF00',
     'yellowgreen': '#9ACD32'
   }
-
+  
+  # Precomputed tables (see init_tables): the value of each name, the name of
+  # each value (upper case hex) and the shortest form of each name and value
+  name_values = {}
+  value_names = {}
+  shortest_forms = {}
+  
+  # The parsed colors (string -> PackedColor) and the shortest forms of the
+  # strings and of the computed colors (PackedColor -> string), along with
+  # the HSL components of the colors (PackedColor -> ( h, s, l ))
+  parse_cache = None
+  shortest_cache = None
+  format_cache = None
+  hsl_cache = None
+  
+  @classmethod
+  def init_tables(cls):
+    """Builds the lookup tables of the named colors and the caches, done once
+    on import"""
+    
+    cls.parse_cache = LRUCache(COLOR_CACHE_SIZE)
+    cls.shortest_cache = LRUCache(COLOR_CACHE_SIZE)
+    cls.format_cache = LRUCache(COLOR_CACHE_SIZE)
+    cls.hsl_cache = LRUCache(COLOR_CACHE_SIZE)
+    
+    for name, value in cls.htmlcolors.iteritems():
+      cls.name_values[name] = PackedColor.from_rgb(*cls._parse_rgb(value))
+      cls.value_names.setdefault(value, name)
+    
+    for name, value in cls.htmlcolors.iteritems():
+      for color in ( name, value, value.lower() ):
+        cls.shortest_forms[color] = cls._get_color_shortest(color)
+    
+    return
+  
   @classmethod
   def get_color_name(cls, color_value):
     """Returns the color name matching this value. Returns an empty string
     if no suitable match is found"""
     
     if isinstance(color_value, basestring):
-      value = color_value.upper()
-      
-      for col, val in HTMLColors.htmlcolors.iteritems():
-        if val == value:
-          return col
+      return cls.value_names.get(color_value.upper(), "")
     
     return ""
 
@@ -176,10 +247,7 @@ class HTMLColors(object):
     if no suitable match is found"""
     
     if isinstance(color_name, basestring):
-      color = color_name.lower()
-      
-      if color in HTMLColors.htmlcolors:
-        return HTMLColors.htmlcolors[color]
+      return cls.htmlcolors.get(color_name.lower(), "")
     
     return ""
 
@@ -188,14 +256,27 @@ class HTMLColors(object):
     """Attempts to retrieve by name and value and returns the shortest
     string. Returns the input string if nothing is found"""
     
+    shortest = cls.shortest_forms.get(color_name_or_value)
+    
+    if shortest is None:
+      shortest = cls.shortest_cache.get(color_name_or_value)
+      
+      if shortest is None:
+        shortest = cls._get_color_shortest(color_name_or_value)
+        cls.shortest_cache.set(color_name_or_value, shortest)
+    
+    return shortest
+  
+  @classmethod
+  def _get_color_shortest(cls, color_name_or_value):
+    """Helper function for get_color_shortest(), not cached"""
+    
     name = cls.get_color_name(color_name_or_value) or color_name_or_value
     value = cls.get_color_value(color_name_or_value) or color_name_or_value
     
     if value:
-      if len(value) == 7:
-        condensed = [ value[v] for v in range(1, 7, 2) if value[v] == value[v + 1] ]
-        if len(condensed) == 3:
-          value = "#" + "".join(condensed)
+      if len(value) == 7 and value[1] == value[2] and value[3] == value[4] and value[5] == value[6]:
+        value = "#" + value[1] + value[3] + value[5]
     
     l_name = len(name)
     l_value = len(value)
@@ -228,8 +309,42 @@ class HTMLColors(object):
     
     return not invalid
   
+  @classmethod
+  def parse(cls, color):
+    """Returns the PackedColor of a color name or value (string). The results
+    are cached, raises InvalidColorException if the color is invalid"""
+    
+    packed = cls.parse_cache.get(color)
+    
+    if packed is None:
+      packed = cls.name_values.get(color)
+      if packed is None:
+        packed = PackedColor.from_rgb(*cls._parse_rgb(color))
+      cls.parse_cache.set(color, packed)
+    
+    return packed
+  
+  @classmethod
+  def format(cls, packed):
+    """Returns the shortest string of a PackedColor, its name or its hex
+    value. The results are cached"""
+    
+    color = cls.format_cache.get(packed)
+    
+    if color is None:
+      color = cls.get_color_shortest(packed.get_hex())
+      cls.format_cache.set(packed, color)
+    
+    return color
+  
   @classmethod
   def get_rgb(cls, color):
+    return cls.parse(color).get_rgb()
+  
+  @classmethod
+  def _parse_rgb(cls, color):
+    """Helper function for parse(), returns the tuple: ( r, g, b )"""
+    
     if not color.startswith("#"):
       # Are we passing a color, if this doens't work, we can't do anything!
       c_value = cls.get_color_value(color)
@@ -253,30 +368,31 @@ class HTMLColors(object):
   def get_color_from_rgb(cls, r, g, b):
     """Return an html color from rgb"""
     
-    value = "#" + "".join([ ("0" + hex(i)[2:])[-2:] for i in (r, g, b) ])
-    return cls.get_color_shortest(value)
+    return cls.format(PackedColor.from_rgb(r, g, b))
   
   @classmethod
   def lighten(cls, color, percentage=25):
     """Lightens a HTML color by the percentage specified"""
     
-    r, g, b = cls.get_rgb(color)
+    packed = cls.parse(color)
     
     if percentage:
-      r, g, b = [ int(i + (percentage * (255 - i + 1) / 100.0)) for i in (r, g, b) ]
+      r, g, b = [ min(int(i + (percentage * (255 - i + 1) / 100.0)), 255) for i in packed.get_rgb() ]
+      packed = PackedColor.from_rgb(r, g, b, packed.a)
     
-    return cls.get_color_from_rgb(r, g, b)
+    return cls.format(packed)
 
   @classmethod
   def darken(cls, color, percentage=25):
     """Darkens a HTML colour by the percentage specified"""
     
-    r, g, b = cls.get_rgb(color)
+    packed = cls.parse(color)
     
     if percentage:
-      r, g, b = [ int(i - (percentage * i / 100.0)) for i in (r, g, b) ]
+      r, g, b = [ max(int(i - (percentage * i / 100.0)), 0) for i in packed.get_rgb() ]
+      packed = PackedColor.from_rgb(r, g, b, packed.a)
     
-    return cls.get_color_from_rgb(r, g, b)
+    return cls.format(packed)
   
   @classmethod
   def get_rgb_from_hsl(cls, h, s, l):
@@ -356,9 +472,23 @@ class HTMLColors(object):
     
     return (h, s, l)
   
+  @classmethod
+  def get_hsl(cls, color):
+    """Returns the tuple (hue, saturation, lightness) of a color name or value.
+    The results are cached"""
+    
+    packed = cls.parse(color)
+    hsl = cls.hsl_cache.get(packed)
+    
+    if hsl is None:
+      hsl = cls.get_hsl_from_rgb(*packed.get_rgb())
+      cls.hsl_cache.set(packed, hsl)
+    
+    return hsl
+  
   @classmethod
   def get_hue_from_color(cls, color):
-    return cls.get_hue_from_rgb(*cls.get_rgb(color))
+    return cls.get_hsl(color)[0]
   
   @classmethod
   def get_hue_from_rgb(cls, r, g, b):
@@ -366,7 +496,7 @@ class HTMLColors(object):
   
   @classmethod
   def get_saturation_from_color(cls, color):
-    return cls.get_saturation_from_rgb(*cls.get_rgb(color))
+    return cls.get_hsl(color)[1]
   
   @classmethod
   def get_saturation_from_rgb(cls, r, g, b):
@@ -374,8 +504,18 @@ class HTMLColors(object):
   
   @classmethod
   def get_lightness_from_color(cls, color):
-    return cls.get_lightness_from_rgb(*cls.get_rgb(color))
+    return cls.get_hsl(color)[2]
   
   @classmethod
   def get_lightness_from_rgb(cls, r, g, b):
-    return cls.get_hsl_from_rgb(r, g, b)[2]    
+    return cls.get_hsl_from_rgb(r, g, b)[2]
+
+
+#
+# Constants
+#
+
+# Number of entries of each cache of HTMLColors
+COLOR_CACHE_SIZE = 4096
+
+HTMLColors.init_tables()
@@ -0,0 +1,173 @@
+# -*- coding: latin-1 -*-
+
+"""Classes used by the incremental compilation: the source is split into its
+top-level items, which are compiled separately so that only those that changed
+(or that depend on something that changed) are compiled again"""
+
+import bisect
+import re
+
+re_item_token = re.compile(r"""/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|[{}();]""", re.S)
+
+class SourceSplitter(object):
+  """Classmethods used to split a source into its top-level items, without
+  parsing it"""
+  
+  def __init__(self):
+    pass
+  
+  @classmethod
+  def split(cls, src):
+    """Returns the top-level items of the source, a list of tuples: ( line
+    number, text ). An item ends with a ';' or a '}' found outside of any
+    braces, parentheses, string or comment. A top-level comment is an item"""
+    
+    items = []
+    braces, parens = 0, 0
+    start, line, line_pos = 0, 1, 0
+    
+    for mo in re_item_token.finditer(src):
+      token = mo.group()
+      end = None
+      
+      if token.startswith("/*"):
+        if braces == 0 and parens == 0 and not src[start:mo.start()].strip():
+          end = mo.end()
+      elif token[0] in "\"'":
+        pass
+      elif token == "{":
+        braces += 1
+      elif token == "}":
+        braces = max(braces - 1, 0)
+        if braces == 0 and parens == 0:
+          end = mo.end()
+      elif token == "(":
+        parens += 1
+      elif token == ")":
+        parens = max(parens - 1, 0)
+      elif braces == 0 and parens == 0:
+        end = mo.end()
+      
+      if end is not None:
+        text = src[start:end]
+        item_start = start + len(text) - len(text.lstrip())
+        line += src.count("\n", line_pos, item_start)
+        line_pos = item_start
+        
+        items.append(( line, text.strip() ))
+        start = end
+    
+    text = src[start:]
+    if text.strip():
+      item_start = start + len(text) - len(text.lstrip())
+      items.append(( line + src.count("\n", line_pos, item_start), text.strip() ))
+    
+    return items
+  
+  @classmethod
+  def get_nesting_depth(cls, src):
+    """Returns the deepest nesting of the braces and parentheses found in the
+    source outside of any string or comment, without parsing it"""
+    
+    depth, max_depth = 0, 0
+    
+    for mo in re_item_token.finditer(src):
+      token = mo.group()
+      if token == "{" or token == "(":
+        depth += 1
+        if depth > max_depth:
+          max_depth = depth
+      elif token == "}" or token == ")":
+        depth = max(depth - 1, 0)
+    
+    return max_depth
+
+
+class CompiledItem(object):
+  """A top-level item of the source, along with the result of its compilation:
+  its AST, its processed tree, its CSS rules, the global variables and
+  templates it defines and those it reads (its dependencies), and the custom
+  properties its plugin results share. The values read
+  from the global scope are kept (reads: dependency -> value), so that the item
+  can be processed again without the items that precede it"""
+  
+  def __init__(self, text, line):
+    self.text = text
+    self.line = line
+    self.ast = None
+    self.data = []
+    self.css = []
+    self.variables = {}
+    self.templates = {}
+    self.dependencies = set()
+    self.reads = {}
+    self.custom_properties = {}
+  
+  def get_definitions(self):
+    """Returns the variables and templates (set of dependencies) the item defines"""
+    
+    definitions = set([ ( DEPENDENCY_VARIABLE, name ) for name in self.variables ])
+    definitions.update([ ( DEPENDENCY_TEMPLATE, name ) for name in self.templates ])
+    
+    return definitions
+
+
+class DependencyGraph(object):
+  """The dependency graph of the compiled items of a source: for each variable
+  and template (dependency), the indexes of the items that read it and of
+  those that define it, in order"""
+  
+  def __init__(self, items):
+    self.readers = {}
+    self.definers = {}
+    
+    for idx, item in enumerate(items):
+      self.add_item(idx, item)
+  
+  def add_item(self, idx, item):
+    """Adds the dependencies and definitions of the item found at idx"""
+    
+    for dependency in item.dependencies:
+      bisect.insort(self.readers.setdefault(dependency, []), idx)
+    
+    for dependency in item.get_definitions():
+      bisect.insort(self.definers.setdefault(dependency, []), idx)
+    
+    return
+  
+  def remove_item(self, idx, item):
+    """Removes the dependencies and definitions of the item found at idx"""
+    
+    for dependency in item.dependencies:
+      self.readers[dependency].remove(idx)
+    
+    for dependency in item.get_definitions():
+      self.definers[dependency].remove(idx)
+    
+    return
+  
+  def get_readers(self, dependency):
+    """Returns the indexes of the items reading the dependency (list)"""
+    
+    return self.readers.get(dependency, [])
+  
+  def get_definer(self, dependency, idx):
+    """Returns the index of the last item defining the dependency before the
+    item found at idx, or None if there is none"""
+    
+    definers = self.definers.get(dependency, [])
+    pos = bisect.bisect_left(definers, idx)
+    
+    if pos:
+      return definers[pos - 1]
+    
+    return None
+
+
+#
+# Constants
+#
+
+# Types of the dependencies of an item, they are tuples: ( type, name )
+DEPENDENCY_VARIABLE = "variable"
+DEPENDENCY_TEMPLATE = "template"
@@ -0,0 +1,115 @@
+# -*- coding: latin-1 -*-
+
+"""A bounded cache that evicts its least recently used entries"""
+
+import threading
+
+# Positions in the links of the entries: [ previous link, next link, key, value, size ]
+PREV, NEXT, KEY, VALUE, SIZE = 0, 1, 2, 3, 4
+
+class LRUCache(object):
+  """A dict-like cache of at most size entries. Reading an entry makes it the
+  most recently used, the least recently used entry is removed when a new one
+  is added to a full cache. With max_bytes, the least recently used entries
+  are also removed to keep the total size of the values (sizeof(value)) within
+  it. The cache may be shared by several threads.
+  The entries are kept in a circular doubly linked list, from the least to the
+  most recently used, along with a dict: key -> link"""
+  
+  def __init__(self, size, max_bytes=None, sizeof=len):
+    self.size = size
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof
+    self.entries = {}
+    self.root = []
+    self.root[:] = [ self.root, self.root, None, None, 0 ]
+    self.lock = threading.Lock()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+  
+  def __len__(self):
+    return len(self.entries)
+  
+  def __contains__(self, key):
+    return key in self.entries
+  
+  def get(self, key, default=None):
+    """Returns the value of the key, or the default if it is not cached"""
+    
+    self.lock.acquire()
+    try:
+      link = self.entries.get(key)
+      if link is None:
+        self.misses += 1
+        return default
+      
+      self.hits += 1
+      
+      # Move the link to the most recently used end
+      link_prev, link_next, key, value, size = link
+      link_prev[NEXT] = link_next
+      link_next[PREV] = link_prev
+      last = self.root[PREV]
+      last[NEXT] = self.root[PREV] = link
+      link[PREV] = last
+      link[NEXT] = self.root
+    finally:
+      self.lock.release()
+    
+    return value
+  
+  def set(self, key, value):
+    """Adds (or replaces) the value of the key. A value larger than max_bytes
+    is not kept"""
+    
+    size = self.max_bytes is not None and self.sizeof(value) or 0
+    
+    self.lock.acquire()
+    try:
+      link = self.entries.pop(key, None)
+      if link is not None:
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+        self.bytes -= link[SIZE]
+      
+      if self.max_bytes is not None and size > self.max_bytes:
+        return
+      
+      while self.entries and (len(self.entries) >= self.size or (self.max_bytes is not None and self.bytes + size > self.max_bytes)):
+        # Remove the least recently used entry
+        oldest = self.root[NEXT]
+        self.root[NEXT] = oldest[NEXT]
+        oldest[NEXT][PREV] = self.root
+        del self.entries[oldest[KEY]]
+        self.bytes -= oldest[SIZE]
+        self.evictions += 1
+      
+      last = self.root[PREV]
+      link = [ last, self.root, key, value, size ]
+      last[NEXT] = self.root[PREV] = self.entries[key] = link
+      self.bytes += size
+    finally:
+      self.lock.release()
+    
+    return
+  
+  def clear(self):
+    """Removes all the entries"""
+    
+    self.lock.acquire()
+    try:
+      self.entries.clear()
+      self.root[:] = [ self.root, self.root, None, None, 0 ]
+      self.bytes = 0
+    finally:
+      self.lock.release()
+    
+    return
+  
+  def get_stats(self):
+    """Returns the statistics of the cache, a dict with the keys: entries,
+    bytes (0 without max_bytes), hits, misses and evictions"""
+    
+    return dict(entries=len(self.entries), bytes=self.bytes, hits=self.hits, misses=self.misses, evictions=self.evictions)
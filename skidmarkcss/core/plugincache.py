@@ -0,0 +1,213 @@
+# -*- coding: latin-1 -*-
+
+"""Memoization of the plugin results. Only the plugins declared pure (see
+SkidmarkCSSPlugin.pure) are memoized, the calls of every plugin are counted"""
+
+import cPickle
+
+class PluginCache(object):
+  """The results of the pure plugins, keyed by the plugin name and class (a
+  plugin replacing another of the same name has its own results), its
+  normalized arguments and its options, along with the number of calls and cache hits of
+  each plugin (stats: name -> [ calls, hits ]). The results of the calls
+  evaluated ahead of time (see prefetch) are kept until clear_prefetched()"""
+  
+  def __init__(self, size=None):
+    self.size = size or PLUGIN_CACHE_SIZE
+    self.results = {}
+    self.prefetched = {}
+    self.stats = {}
+  
+  def call(self, plugin, args, options):
+    """Returns the result of plugin.eval(*args, **options), memoized if the
+    plugin is pure, or evaluated ahead of time (see prefetch)"""
+    
+    stats = self.stats.setdefault(plugin.name, [ 0, 0 ])
+    stats[0] += 1
+    
+    pure = plugin.is_pure()
+    if not pure and not self.prefetched:
+      return plugin.eval(*args, **options)
+    
+    key = self.get_call_key(plugin, args, options)
+    try:
+      prefetched = key in self.prefetched
+      cached = not prefetched and pure and key in self.results
+    except TypeError:
+      # An argument can't be hashed, the result is not memoized
+      return plugin.eval(*args, **options)
+    
+    if cached:
+      stats[1] += 1
+      return self.results[key]
+    
+    if prefetched:
+      result = self.prefetched[key]
+    else:
+      result = plugin.eval(*args, **options)
+    
+    if pure:
+      self._add_result(key, result)
+    
+    return result
+  
+  def _add_result(self, key, result):
+    """Memoizes the result of a call"""
+    
+    if len(self.results) >= self.size:
+      self.results.clear()
+    self.results[key] = result
+    
+    return
+  
+  def prefetch(self, calls, workers):
+    """Evaluates calls ahead of time, a list of tuples: ( plugin, args, options ).
+    The calls are deduplicated, and the batch of each plugin is split among a
+    pool of threads (see SkidmarkCSSPlugin.eval_batch). A batch that raises an
+    exception is ignored, the exception is raised again by call().
+    Returns the number of calls evaluated"""
+    
+    keys = set()
+    batches = {}
+    for plugin, args, options in calls:
+      key = self.get_call_key(plugin, args, options)
+      try:
+        if key in keys or key in self.prefetched or key in self.results:
+          continue
+      except TypeError:
+        continue
+      
+      keys.add(key)
+      batches.setdefault(plugin.name, ( plugin, [] ))[1].append(( key, args, options ))
+    
+    tasks = []
+    for name in sorted(batches):
+      plugin, batch = batches[name]
+      chunk_size = max(1, -(-len(batch) // max(workers, 1)))
+      for idx in range(0, len(batch), chunk_size):
+        tasks.append(( plugin, batch[idx:idx + chunk_size] ))
+    
+    if len(tasks) > 1 and workers > 1:
+      # Only imported when a batch is split among threads
+      import multiprocessing.pool
+      
+      pool = multiprocessing.pool.ThreadPool(min(workers, len(tasks)))
+      try:
+        results = pool.map(self._eval_batch, tasks)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [ self._eval_batch(task) for task in tasks ]
+    
+    for batch_results in results:
+      self.prefetched.update(batch_results)
+    
+    return len(keys)
+  
+  @classmethod
+  def _eval_batch(cls, task):
+    """Evaluates a task of prefetch(): ( plugin, list of ( key, args, options ) ).
+    Returns the list of tuples: ( key, result ), empty if the batch raised"""
+    
+    plugin, batch = task
+    
+    try:
+      results = plugin.eval_batch([ ( args, options ) for key, args, options in batch ])
+    except Exception:
+      return []
+    
+    return zip([ key for key, args, options in batch ], results)
+  
+  def clear_prefetched(self):
+    """Removes the results of the calls evaluated ahead of time"""
+    
+    self.prefetched.clear()
+    
+    return
+  
+  @classmethod
+  def get_call_key(cls, plugin, args, options):
+    """Returns the key of a call: the plugin name, the module and name of its
+    class, and the normalized arguments and options"""
+    
+    plugin_class = plugin.__class__
+    
+    return ( plugin.name, plugin_class.__module__, plugin_class.__name__, cls.get_key(args), cls.get_key(options) )
+  
+  @classmethod
+  def get_key(cls, value):
+    """Returns the normalized (hashable) form of the arguments or options: the
+    whitespace around the strings is ignored"""
+    
+    if isinstance(value, basestring):
+      return value.strip()
+    
+    if isinstance(value, dict):
+      return tuple(sorted([ ( k, cls.get_key(v) ) for k, v in value.iteritems() ]))
+    
+    if isinstance(value, (list, tuple)):
+      return tuple([ cls.get_key(item) for item in value ])
+    
+    return value
+  
+  def get_report(self):
+    """Returns the calls of each plugin, a list of tuples: ( plugin name, calls,
+    cache hits, hit rate (percentage) )"""
+    
+    report = []
+    for name in sorted(self.stats):
+      calls, hits = self.stats[name]
+      report.append(( name, calls, hits, calls and hits * 100.0 / calls or 0.0 ))
+    
+    return report
+  
+  def reset_stats(self):
+    """Resets the number of calls and cache hits"""
+    
+    self.stats.clear()
+    
+    return
+  
+  def clear(self):
+    """Removes the memoized results"""
+    
+    self.results.clear()
+    
+    return
+  
+  def save(self, filename):
+    """Serializes the memoized results to a file, keyed by the plugin classes
+    too: the results of another plugin of the same name are not reused"""
+    
+    f = open(filename, "wb")
+    try:
+      cPickle.dump(self.results, f, cPickle.HIGHEST_PROTOCOL)
+    finally:
+      f.close()
+    
+    return
+  
+  def load(self, filename):
+    """Adds the results serialized to the file by save()"""
+    
+    f = open(filename, "rb")
+    try:
+      results = cPickle.load(f)
+    finally:
+      f.close()
+    
+    if not isinstance(results, dict):
+      raise ValueError("'%s' is not a plugin cache" % ( filename, ))
+    
+    self.results.update(results)
+    
+    return
+
+
+#
+# Constants
+#
+
+# Maximum number of memoized results, the cache is cleared when it is reached
+PLUGIN_CACHE_SIZE = 10000
@@ -1,44 +1,56 @@
 # -*- coding: latin-1 -*-
 
-import time
+import hashlib
 
-from pluginmanager import SkidmarkCSSPlugin, Color, Unit, pluginargs
+from pluginmanager import SkidmarkCSSPlugin, SharedValue, Color, Unit, pluginargs
 from htmlcolors import HTMLColors
+from colorkernel import ColorKernel
+from propertyexpandables import VENDOR_MOZ, VENDOR_WEBKIT, VENDOR_OPERA, VENDOR_MS, VENDOR_MS_FILTER, VENDOR_SVG
 
 class PropertyDarken(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'darken')
   
-  @pluginargs(Color, Unit(25, type='%'))
+  @pluginargs(Color, Unit(25, type='%'), pure=True)
   def eval(self, color, percent):
-    color = HTMLColors.get_color_shortest(color.value)
-    return HTMLColors.darken(color, int(percent.value or 0))
+    return HTMLColors.darken(color.value, int(percent.value or 0))
 
 class PropertyLighten(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'lighten')
   
-  @pluginargs(Color, Unit(25, type='%'))
+  @pluginargs(Color, Unit(25, type='%'), pure=True)
   def eval(self, color, percent):
-    color = HTMLColors.get_color_shortest(color.value)
-    return HTMLColors.lighten(color, int(percent.value or 0))
+    return HTMLColors.lighten(color.value, int(percent.value or 0))
 
 class PropertyGradient(SkidmarkCSSPlugin):
+  options = ( "vendors", "gradient_mode" )
+  pure = True
+  
+  # The data URI of the SVG documents, per gradient id
+  SVG_CACHE = {}
+  SVG_CACHE_SIZE = 1000
+  
+  color_arg = Color()
+  
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'gradient')
 
-  def eval(self, direction, *args):
+  def eval(self, direction, *args, **kw):
+    vendors = kw.get("vendors")
+    gradient_mode = kw.get("gradient_mode") or GRADIENT_MODE_INLINE
+    
     # Validate the direction
     if direction == "vertical":
-      direction_type = ( "top", "linear, left top, left bottom", "top", "top", "top", "top", 0, "linear" )
+      direction_type = ( "top", "linear, left top, left bottom", "top", "top", "top", "top", 0, "linear", "to bottom" )
     elif direction == "horizontal":
-      direction_type = ( "left", "linear, left top, right top", "left", "left", "left", "left", 1, "linear" )
+      direction_type = ( "left", "linear, left top, right top", "left", "left", "left", "left", 1, "linear", "to right" )
     elif direction == "diag-down":
-      direction_type = ( "-45deg", "linear, left top, right bottom", "-45deg", "-45deg", "-45deg", "-45deg", 1, "linear" )
+      direction_type = ( "-45deg", "linear, left top, right bottom", "-45deg", "-45deg", "-45deg", "-45deg", 1, "linear", "135deg" )
     elif direction == "diag-up":
-      direction_type = ( "45deg", "linear, left bottom, right top", "45deg", "45deg", "45deg", "45deg", 1, "linear" )
+      direction_type = ( "45deg", "linear, left bottom, right top", "45deg", "45deg", "45deg", "45deg", 1, "linear", "45deg" )
     elif direction == "radial":
-      direction_type = ( "center, ellipse cover", "radial, center center 0%, center center 100%", "center, ellipse cover", "center, ellipse cover", "center, ellipse cover", "center, ellipse cover", 1, "radial" )
+      direction_type = ( "center, ellipse cover", "radial, center center 0%, center center 100%", "center, ellipse cover", "center, ellipse cover", "center, ellipse cover", "center, ellipse cover", 1, "radial", "ellipse farthest-corner at center" )
     else:
       raise Exception("Invalid 'direction' for %s plugin, got '%s'" % ( self.name, direction ))
     
@@ -66,10 +78,72 @@ class PropertyGradient(SkidmarkCSSPlugin):
     
     # validate all the colors. If it doesn't raise, we're all good!
     for color, stop in color_stops:
-      clr = Color()
-      clr.validate(color)
+      self.color_arg.coerce(color)
+    
+    color_stops_style1 = ",".join([ "%s %s" % ( color, stop ) for color, stop in color_stops ])
+    color_stops_style2 = ",".join([ "color-stop(%s,%s)" % ( stop, color ) for color, stop in color_stops ])
+    
+    formats = dict(
+      color_stop1=color_stop1,
+      color_stop_last=color_stops[-1][0],
+      color_stops_style1=color_stops_style1,
+      color_stops_style2=color_stops_style2,
+      gradient_type=direction_type[7],
+      direction_moz=direction_type[0],
+      direction_webkit_legacy=direction_type[1],
+      direction_webkit=direction_type[2],
+      direction_o=direction_type[3],
+      direction_ms=direction_type[4],
+      direction=direction_type[5],
+      direction_ie=direction_type[6],
+      direction_standard=direction_type[8]
+    )
+    
+    gradient_id = self.get_gradient_id(direction, color_stops)
+    
+    if gradient_mode == GRADIENT_MODE_CUSTOM_PROPERTY:
+      # The browsers supporting the custom properties support the standard
+      # gradients (an invalid value would only be detected once substituted,
+      # losing the first color too), the others use the first color
+      return [ formats["color_stop1"], SharedValue("--%s" % ( gradient_id, ), GRADIENT_STANDARD % formats) ]
+    
+    properties = []
+    for vendor, variant in GRADIENT_VARIANTS:
+      if vendor is None or vendors is None or vendor in vendors:
+        if vendor == VENDOR_SVG:
+          properties.append(self.get_svg_data_uri(color_stops, gradient_id))
+        else:
+          properties.append(variant % formats)
+    
+    return properties
+  
+  @classmethod
+  def get_gradient_id(cls, direction, color_stops):
+    """Returns the id of a gradient, derived from its content: the same
+    gradient always gets the same id"""
     
-    uniqueid = "grad-smcss-generated-%s" % ( str(time.time()).replace(".", "-"), )
+    content = "%s|%s" % ( direction, ",".join([ "%s %s" % ( color, stop ) for color, stop in color_stops ]) )
+    
+    return "grad-smcss-%s" % ( hashlib.md5(content.encode("utf-8")).hexdigest()[:GRADIENT_ID_LENGTH], )
+  
+  def get_svg_data_uri(self, color_stops, gradient_id):
+    """Returns the url() of the SVG document of the gradient (base64 data URI),
+    built once per gradient"""
+    
+    data_uri = PropertyGradient.SVG_CACHE.get(gradient_id)
+    
+    if data_uri is None:
+      data_uri = "url(data:image/svg+xml;base64,%s)" % ( self.get_svg(color_stops, gradient_id).encode("base64").replace("\n", ""), )
+      
+      if len(PropertyGradient.SVG_CACHE) >= PropertyGradient.SVG_CACHE_SIZE:
+        PropertyGradient.SVG_CACHE.clear()
+      PropertyGradient.SVG_CACHE[gradient_id] = data_uri
+    
+    return data_uri
+  
+  def get_svg(self, color_stops, uniqueid):
+    """Returns the SVG document (string) of the gradient, used by the browsers
+    that do not support the CSS gradients (IE9)"""
     
     svg = ["""<?xml version="1.0" ?>"""]
     svg.append("""<svg xmlns="http://www.w3.org/2000/svg" width="100%" height="100%" viewBox="0 0 1 1" preserveAspectRatio="none">""")
@@ -82,27 +156,13 @@ class PropertyGradient(SkidmarkCSSPlugin):
     svg.append("""<rect x="0" y="0" width="1" height="1" fill="url(#%s)" />""" % ( uniqueid, ))
     svg.append("""</svg>""")
     
-    color_stops_style1 = ",".join([ "%s %s" % ( color, stop ) for color, stop in color_stops ])
-    color_stops_style2 = ",".join([ "color-stop(%s,%s)" % ( stop, color ) for color, stop in color_stops ])
-    
-    properties = []
-    properties.append("%s" % ( color_stop1, ))
-    properties.append("url(data:image/svg+xml;base64,%s)" % ( ("\n".join(svg)).encode("base64").replace("\n", ""), ))
-    properties.append("-moz-%s-gradient(%s, %s)" % ( direction_type[7], direction_type[0], color_stops_style1 ))
-    properties.append("-webkit-gradient(%s, %s)" % ( direction_type[1], color_stops_style2 ))
-    properties.append("-webkit-%s-gradient(%s, %s)" % ( direction_type[7], direction_type[2], color_stops_style1 ))
-    properties.append("-o-%s-gradient(%s, %s)" % ( direction_type[7], direction_type[3], color_stops_style1 ))
-    properties.append("-ms-%s-gradient(%s, %s)" % ( direction_type[7], direction_type[4], color_stops_style1 ))
-    properties.append("%s-gradient(%s, %s)" % ( direction_type[7], direction_type[5], color_stops_style1 ))
-    properties.append("filter: progid:DXImageTransform.Microsoft.gradient(startColorstr='%s',endColorstr='%s',GradientType=%s)" % ( color_stop1, color_stops[-1][0], direction_type[6] ))
-    
-    return properties
+    return "\n".join(svg)
 
 class ColorFromHSL(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'color_from_hsl')
   
-  @pluginargs(Unit(cast=int), Unit(cast=int), Unit(cast=int))
+  @pluginargs(Unit(cast=int), Unit(cast=int), Unit(cast=int), pure=True)
   def eval(self, h, s, l):
     h, s, l = [ v.value for v in (h, s, l) ]
     s, l = [ v / 100.0 for v in (s, l) ]
@@ -112,7 +172,7 @@ class Hue(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'hue')
   
-  @pluginargs(Color)
+  @pluginargs(Color, pure=True)
   def eval(self, color):
     return str(HTMLColors.get_hue_from_color(color.value))
 
@@ -120,7 +180,7 @@ class Saturation(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'saturation')
   
-  @pluginargs(Color)
+  @pluginargs(Color, pure=True)
   def eval(self, color):
     return str(HTMLColors.get_saturation_from_color(color.value))
 
@@ -128,6 +188,97 @@ class Lightness(SkidmarkCSSPlugin):
   def __init__(self):
     SkidmarkCSSPlugin.__init__(self, 'lightness')
   
-  @pluginargs(Color)
+  @pluginargs(Color, pure=True)
   def eval(self, color):
     return str(HTMLColors.get_lightness_from_color(color.value))
+
+class PaletteScale(SkidmarkCSSPlugin):
+  """A scale of tints and shades of a color (list), see ColorKernel.scale. The
+  calls are evaluated in batches, a variable set to the scale defines one
+  variable per step: $name_1 ... $name_N"""
+  
+  batch = True
+  defines_variables = True
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'scale')
+  
+  @pluginargs(Color, Unit(10, cast=int), pure=True)
+  def eval(self, color, steps):
+    return self.get_scales([ ( color, steps ) ])[0]
+  
+  def eval_batch(self, calls):
+    return self.get_scales([ self.eval.coerce_args(args) for args, options in calls ])
+  
+  @classmethod
+  def get_scales(cls, calls):
+    """Returns the scale of each call (tuples: ( color, steps ))"""
+    
+    scales = []
+    for color, steps in calls:
+      if not 0 < steps.value <= PALETTE_MAX_STEPS:
+        raise Exception("The number of steps of a scale must be between 1 and %d, got %s" % ( PALETTE_MAX_STEPS, steps.value ))
+      scales.append(( HTMLColors.parse(color.value), steps.value ))
+    
+    return [ [ HTMLColors.format(color) for color in scale ] for scale in ColorKernel.scale(scales) ]
+
+class PaletteMix(SkidmarkCSSPlugin):
+  """The mix of two colors, the percentage being the weight of the second one.
+  The calls are evaluated in batches"""
+  
+  batch = True
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'mix')
+  
+  @pluginargs(Color, Color, Unit(50, type='%', cast=float), pure=True)
+  def eval(self, color_a, color_b, percent):
+    return self.get_mixes([ ( color_a, color_b, percent ) ])[0]
+  
+  def eval_batch(self, calls):
+    return self.get_mixes([ self.eval.coerce_args(args) for args, options in calls ])
+  
+  @classmethod
+  def get_mixes(cls, calls):
+    """Returns the mix of each call (tuples: ( color_a, color_b, percent ))"""
+    
+    colors_a = [ HTMLColors.parse(color_a.value) for color_a, color_b, percent in calls ]
+    colors_b = [ HTMLColors.parse(color_b.value) for color_a, color_b, percent in calls ]
+    weights = [ min(max(percent.value / 100.0, 0.0), 1.0) for color_a, color_b, percent in calls ]
+    
+    return [ HTMLColors.format(color) for color in ColorKernel.mix(colors_a, colors_b, weights) ]
+
+
+# The plugins registered by SkidmarkCSS (see SkidmarkCSS.load_plugins)
+BUILTIN_PLUGINS = [ PropertyDarken, PropertyLighten, PropertyGradient, ColorFromHSL, Hue, Saturation, Lightness, PaletteScale, PaletteMix ]
+
+# Maximum number of steps of a scale (see PaletteScale)
+PALETTE_MAX_STEPS = 100
+
+# The gradient modes: the gradients are inlined in the properties (with all the
+# variants required by the browser targets), or defined once as custom
+# properties of the :root rule, the properties using var()
+GRADIENT_MODE_INLINE = "inline"
+GRADIENT_MODE_CUSTOM_PROPERTY = "custom-property"
+GRADIENT_MODES = ( GRADIENT_MODE_INLINE, GRADIENT_MODE_CUSTOM_PROPERTY )
+
+# Number of hexadecimal digits of the content hash in the gradient ids
+GRADIENT_ID_LENGTH = 12
+
+# The variants of a gradient, tagged with the vendor that requires them (None
+# for those always generated). The SVG variant is built by get_svg().
+GRADIENT_VARIANTS = (
+  ( None, "%(color_stop1)s" ),
+  ( VENDOR_SVG, None ),
+  ( VENDOR_MOZ, "-moz-%(gradient_type)s-gradient(%(direction_moz)s, %(color_stops_style1)s)" ),
+  ( VENDOR_WEBKIT, "-webkit-gradient(%(direction_webkit_legacy)s, %(color_stops_style2)s)" ),
+  ( VENDOR_WEBKIT, "-webkit-%(gradient_type)s-gradient(%(direction_webkit)s, %(color_stops_style1)s)" ),
+  ( VENDOR_OPERA, "-o-%(gradient_type)s-gradient(%(direction_o)s, %(color_stops_style1)s)" ),
+  ( VENDOR_MS, "-ms-%(gradient_type)s-gradient(%(direction_ms)s, %(color_stops_style1)s)" ),
+  ( None, "%(gradient_type)s-gradient(%(direction)s, %(color_stops_style1)s)" ),
+  ( VENDOR_MS_FILTER, "filter: progid:DXImageTransform.Microsoft.gradient(startColorstr='%(color_stop1)s',endColorstr='%(color_stop_last)s',GradientType=%(direction_ie)s)" ),
+)
+
+# The gradient in the standard syntax (CSS Images Level 3), the direction being
+# the side it goes to rather than the one it starts from
+GRADIENT_STANDARD = "%(gradient_type)s-gradient(%(direction_standard)s, %(color_stops_style1)s)"
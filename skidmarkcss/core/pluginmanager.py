@@ -1,6 +1,7 @@
 # -*- coding: latin-1 -*-
 
-import inspect
+import collections
+import copy
 import re
 
 from htmlcolors import HTMLColors
@@ -8,13 +9,77 @@ from htmlcolors import HTMLColors
 r_unit = re.compile(r"^\s*(\d+(?:\.\d*)?)(px|em|%|pt)?\s*$")
 
 class SkidmarkCSSPlugin(object):
+  # Names of the SkidmarkCSS options the plugin needs. They are passed as
+  # keyword arguments to the eval method (ex: 'vendors', see BROWSER_TARGETS)
+  options = ()
+  
+  # A pure plugin returns the same result for the same arguments and options,
+  # its results are memoized (see PluginCache). This may also be declared with
+  # the pluginargs decorator: @pluginargs(Color, pure=True)
+  pure = False
+  
+  # The calls of a batch plugin whose arguments are constants are collected
+  # before the AST is processed, and evaluated by eval_batch in a pool of
+  # threads (see PluginCache.prefetch)
+  batch = False
+  
+  # The list result of a plugin that defines variables, assigned to a variable,
+  # defines one variable per value: $name_1 ... $name_N
+  defines_variables = False
+  
   def __init__(self, name):
     self.name = name
     
   def eval(self, *args):
     raise Exception("eval method must be overwritten")
+  
+  def eval_batch(self, calls):
+    """Evaluates a batch of calls, a list of tuples: ( args, options ). Returns
+    the list of the results, in the same order. Override it when the calls are
+    cheaper together (a single request for many images...). The arguments
+    are not converted, see eval.coerce_args when eval uses @pluginargs"""
+    
+    return [ self.eval(*args, **options) for args, options in calls ]
+  
+  def is_pure(self):
+    """Returns True if the results of the plugin may be memoized"""
+    
+    return self.pure or getattr(self.eval, "pure", False)
+
+class SharedValue(unicode):
+  """A plugin result defined once for the whole stylesheet, as a custom property
+  of the :root rule, the property value being a reference to it: var(--name).
+  SkidmarkCSS collects the definitions of the results it is given"""
+  
+  def __new__(cls, name, value):
+    shared_value = unicode.__new__(cls, "var(%s)" % ( name, ))
+    shared_value.definition = ( name, value )
+    return shared_value
+  
+  def __getnewargs__(self):
+    return self.definition
+
+class PluginValue(collections.namedtuple("PluginValue", "value type")):
+  """The value of a plugin argument given to the eval method (see pluginargs).
+  It is immutable, the same object may be given to many calls and threads"""
+  
+  __slots__ = ()
+  
+  def __str__(self):
+    return self.value
+
+class UnitValue(PluginValue):
+  """The value of a Unit argument"""
+  
+  __slots__ = ()
+  
+  def __str__(self):
+    return "%s%s" % ( self.value, self.type or "" )
 
 class PluginArg(object):
+  # Number of values whose conversion is cached, per argument
+  CACHE_SIZE = 1000
+  
   def __init__(self, default=None, type=None):
     """Initialize the object"""
     
@@ -25,13 +90,70 @@ class PluginArg(object):
     self.default_type = type
     self.default_value = default
     self.value = None
+    self.cache = {}
+    
+    # A subclass overriding validate() below the class that defines convert()
+    # validates its copies instead (they are not cached)
+    validate_class = self._get_defining_class("validate")
+    convert_class = self._get_defining_class("convert")
+    self.uses_validate = validate_class is not convert_class and issubclass(validate_class, convert_class)
+  
+  @classmethod
+  def _get_defining_class(cls, name):
+    """Returns the class of the MRO that defines the method"""
+    
+    for klass in cls.__mro__:
+      if name in klass.__dict__:
+        return klass
+    
+    return None
+  
+  def coerce(self, value):
+    """Returns the validated value of the argument (see convert), a new object
+    the argument keeps no reference to. The conversions are cached per distinct
+    value. Raises an exception if the value is invalid"""
+    
+    if self.uses_validate:
+      arg = copy.copy(self)
+      arg.validate(value)
+      return arg
+    
+    try:
+      result = self.cache.get(value)
+    except TypeError:
+      return self.convert(value)
+    
+    if result is None:
+      result = self.convert(value)
+      
+      if isinstance(result, PluginValue):
+        if len(self.cache) >= self.CACHE_SIZE:
+          self.cache.clear()
+        self.cache[value] = result
+    
+    return result
+  
+  def convert(self, value):
+    """Returns the PluginValue of a value, raises an exception if it is invalid"""
+    
+    return PluginValue(value, self.default_type)
   
   def validate(self, value):
-    """Validate the object. Will set the value property when validated"""
+    """Validate the object. Will set the value property when validated.
+    The argument is modified, the plugins use coerce()"""
     
     self.value = value
     return
   
+  def _set_converted(self, value):
+    """Sets the value (and type) of the argument to those of convert(value)"""
+    
+    result = self.convert(value)
+    self.value = result.value
+    if result.type is not None:
+      self.type = result.type
+    return
+  
   @classmethod
   def int_caster(cls, value):
     try:
@@ -54,7 +176,7 @@ class Unit(PluginArg):
     self.cast = cast if cast is not int else PluginArg.int_caster
     super(Unit, self).__init__(default, type)
   
-  def validate(self, value):
+  def convert(self, value):
     mo = r_unit.match(value)
     
     if not mo:
@@ -64,15 +186,16 @@ class Unit(PluginArg):
     
     if self.default_type:
       if mo_type is not None and self.default_type != mo_type:
-        raise Exception("Incorrect Unit Type. Got %s, but expected %s" % ( mo_type, self.type ))
-    else:
-      self.type = mo_type
+        raise Exception("Incorrect Unit Type. Got %s, but expected %s" % ( mo_type, self.default_type ))
+      mo_type = self.default_type
     
     if self.cast:
-      self.value = self.cast(mo_value)
-    else:
-      self.value = mo_value
+      mo_value = self.cast(mo_value)
     
+    return UnitValue(mo_value, mo_type)
+  
+  def validate(self, value):
+    self._set_converted(value)
     return
   
   def __str__(self):
@@ -81,47 +204,57 @@ class Unit(PluginArg):
 class String(PluginArg):
   def __init__(self, default=None, type=None):
     self.type = type
-    super(Unit, self).__init__(default, type)
+    super(String, self).__init__(default, type)
   
-  def validate(self, value):
+  def convert(self, value):
     """String validator"""
     
     if not isinstance(value, basestring):
-      raise Exception()
-      
-    return super(String, self).validate(value)    
+      raise Exception("%s is not a valid String" % ( value, ))
+    
+    return PluginValue(value, self.type)
+  
+  def validate(self, value):
+    self._set_converted(value)
+    return
 
 class Color(PluginArg):
   def __init__(self, default=None, type=None):
     self.type = type
     super(Color, self).__init__(default, type)
   
-  def validate(self, value):
+  def convert(self, value):
     """Color validator"""
     
     is_valid = False
     if isinstance(value, basestring):
       if value.startswith("#"):
-        rgb = HTMLColors.get_rgb(value) # will raise if the color is invalid
+        HTMLColors.parse(value) # will raise if the color is invalid
         is_valid = True
       else:
         # This must be a color name, see if we know about it!
-        is_valid = HTMLColors.htmlcolors.has_key(value.lower())
+        is_valid = value.lower() in HTMLColors.name_values
     
     if not is_valid:
       raise Exception("%s is not a valid Color" % ( value, ))
     
-    return super(Color, self).validate(value)    
+    return PluginValue(value, self.type)
+  
+  def validate(self, value):
+    self._set_converted(value)
+    return
 
-def pluginargs(*params):
-  """Decorator for SkidmarkCSS Plugin Arguments"""
+def pluginargs(*params, **kw):
+  """Decorator for SkidmarkCSS Plugin Arguments. The plugin is declared pure
+  with the pure=True keyword argument (see SkidmarkCSSPlugin.pure)"""
   
   params = list(params)
+  pure = kw.get("pure", False)
   
   for idx, pluginarg in enumerate(params):
     invalid_param = False
     
-    if inspect.isclass(pluginarg):
+    if isinstance(pluginarg, type):
       if not issubclass(pluginarg, PluginArg):
         invalid_param = True
       else:
@@ -134,21 +267,30 @@ def pluginargs(*params):
       pluginarg_type = type(pluginarg) is type and pluginarg.__name__ or type(pluginarg).__name__
       raise Exception("Arguments must be subclasses of PluginArg. Got '%s'" % ( pluginarg_type, ))
   
+  # The arguments missing from a call are given their default value
+  coercers = [ pluginarg.coerce for pluginarg in params ]
+  defaults = [ pluginarg.default_value for pluginarg in params ]
+  
+  def coerce_args(args):
+    """Returns the converted arguments of a call, as given to the plugin (see
+    SkidmarkCSSPlugin.eval_batch)"""
+    
+    if len(args) > len(params):
+      raise Exception("Too many arguments")
+    
+    args = list(args) + defaults[len(args):]
+    
+    return [ coerce(arg) for coerce, arg in zip(coercers, args) ]
+  
   def outer(func):
     def inner(self, *args):
-      if len(args) > len(params):
-        raise Exception("Too many arguments")
-      
-      newargs = []      
-      for idx, expected in enumerate(params):
-        expected.validate(args[idx] if idx < len(args) else expected.default_value)
-        newargs.append(expected)
-      
-      return func(self, *newargs)
+      return func(self, *coerce_args(args))
     
     inner.__doc__ = func.__doc__
     inner.__name__ = func.__name__
     inner.params = params
+    inner.pure = pure
+    inner.coerce_args = coerce_args
     
     return inner
   return outer
@@ -0,0 +1,82 @@
+# -*- coding: latin-1 -*-
+
+"""The prelude snapshot: the compiler state obtained once the files included by
+every source (variables, templates, plugins setup) are compiled. The
+compilations started from a snapshot skip the @include of these files"""
+
+import copy
+import cPickle
+import os
+
+class PreludeSnapshot(object):
+  """The compiler state after a prelude: the variable stack, the templates, the
+  plugins (dict: name -> plugin) and the config, along with the processed tree
+  of the prelude and the files it is made of (dict: path -> modification time)"""
+  
+  def __init__(self, variable_stack, templates, plugins, config, data, files):
+    self.variable_stack = copy.deepcopy(variable_stack)
+    self.templates = dict(templates)
+    self.plugins = dict(plugins)
+    self.config = dict(config)
+    self.data = data
+    self.files = dict(files)
+  
+  def get_data(self):
+    """Returns a copy of the processed tree of the prelude"""
+    
+    return copy.deepcopy(self.data)
+  
+  def includes(self, filename):
+    """Returns True if the file is part of the prelude"""
+    
+    return self.get_path(filename) in self.files
+  
+  def is_current(self):
+    """Returns False if a file of the prelude was modified (or removed) since
+    the snapshot was taken"""
+    
+    for path, mtime in self.files.iteritems():
+      if not os.path.exists(path) or os.stat(path).st_mtime != mtime:
+        return False
+    
+    return True
+  
+  def save(self, filename):
+    """Serializes the snapshot to a file"""
+    
+    f = open(filename, "wb")
+    try:
+      cPickle.dump(self, f, cPickle.HIGHEST_PROTOCOL)
+    finally:
+      f.close()
+    
+    return
+  
+  @classmethod
+  def load(cls, filename):
+    """Returns the snapshot serialized to the file by save()"""
+    
+    f = open(filename, "rb")
+    try:
+      snapshot = cPickle.load(f)
+    finally:
+      f.close()
+    
+    if not isinstance(snapshot, cls):
+      raise ValueError("'%s' is not a prelude snapshot" % ( filename, ))
+    
+    return snapshot
+  
+  @classmethod
+  def get_path(cls, filename):
+    """Returns the normalized path of a file, used to identify the files"""
+    
+    return os.path.normcase(os.path.abspath(filename))
+
+
+#
+# Constants
+#
+
+# Extension of the serialized snapshots
+PRELUDE_SNAPSHOT_EXTENSION = ".smp"
@@ -15,6 +15,7 @@ class ShorthandHandler(object):
   be able to do so are present"""
   
   PROPERTIES_AVAILABLE_FOR_SHORTHAND = None
+  PROPERTY_FAMILIES = {}
   output_format = skidmarkoutputs.CSS_OUTPUT_COMPRESSED
   
   def __init__(self):
@@ -79,6 +80,32 @@ class ShorthandHandler(object):
     
     return list(properties)
   
+  @classmethod
+  def get_property_families(cls, prop_name):
+    """Returns the families (frozenset) a property belongs to. The family is the
+    root of the property name, without the vendor prefix or IE hack, along with
+    the roots of the shorthands that may set it. Two properties whose families
+    intersect may override one another ('margin' and 'margin-top', 'font' and
+    'line-height')."""
+    
+    families = cls.PROPERTY_FAMILIES.get(prop_name)
+    
+    if families is None:
+      name = prop_name.lstrip("*_")
+      if name.startswith("-"):
+        name = name.split("-", 2)[-1]
+      
+      families = set([ name.split("-")[0] ])
+      for shorthand, blocks in PROPERTY_SHORTHANDS.iteritems():
+        for block in blocks:
+          if name in block[1:]:
+            families.add(shorthand.split("-")[0])
+      
+      families = frozenset(families)
+      cls.PROPERTY_FAMILIES[prop_name] = families
+    
+    return families
+  
   
   #
   # Processors: From long to short
@@ -175,6 +202,30 @@ class ExpandableHandler(object):
   def __init__(self):
     pass
   
+  @classmethod
+  def get_target_vendors(cls, targets):
+    """Returns the vendors (frozenset) required by the browser targets (a list
+    or a comma separated string of BROWSER_TARGETS names). None is returned,
+    meaning every vendor, if there are no targets or if 'all' is targeted.
+    Raises a ValueError for unknown targets"""
+    
+    if isinstance(targets, basestring):
+      targets = targets.split(",")
+    
+    targets = [ target.strip().lower() for target in targets or [] if target.strip() ]
+    if not targets or "all" in targets:
+      return None
+    
+    unknown_targets = [ target for target in targets if target not in BROWSER_TARGETS ]
+    if unknown_targets:
+      raise ValueError("Unknown browser target%s: %s" % ( len(unknown_targets) != 1 and "s" or "", ", ".join(unknown_targets) ))
+    
+    vendors = set()
+    for target in targets:
+      vendors.update(BROWSER_TARGETS[target])
+    
+    return frozenset(vendors)
+  
   @classmethod
   def ie_opacity(cls, value):
     value = float(value)
@@ -189,33 +240,61 @@ PROPERTY_SHORTHAND_TYPE_STANDARD4 = "standard4"
 PROPERTY_SHORTHAND_TYPE_PASSTHRU = "passthru"
 PROPERTY_SHORTHAND_TYPE_CUSTOM = "custom"
 
+# Vendors: the prefixed variants of a property (or value) are tagged with the
+# vendor that requires them, see BROWSER_TARGETS
+VENDOR_MOZ = "moz"
+VENDOR_WEBKIT = "webkit"
+VENDOR_KHTML = "khtml"
+VENDOR_OPERA = "o"
+VENDOR_MS = "ms"
+VENDOR_MS_FILTER = "ms-filter"
+VENDOR_SVG = "svg"
+
+# The vendors required by each browser target. The unprefixed properties are
+# always generated.
+BROWSER_TARGETS = {
+  "ie6": [ VENDOR_MS_FILTER ],
+  "ie7": [ VENDOR_MS_FILTER ],
+  "ie8": [ VENDOR_MS_FILTER ],
+  "ie9": [ VENDOR_MS_FILTER, VENDOR_SVG ],
+  "ie10": [ VENDOR_MS ],
+  "firefox3": [ VENDOR_MOZ ],
+  "firefox15": [ VENDOR_MOZ ],
+  "safari4": [ VENDOR_WEBKIT ],
+  "safari6": [ VENDOR_WEBKIT ],
+  "chrome20": [ VENDOR_WEBKIT ],
+  "opera11": [ VENDOR_OPERA, VENDOR_SVG ],
+  "konqueror": [ VENDOR_KHTML ],
+  "modern": []
+}
+
 PROPERTY_EXPANDABLES = {
   #
   # border-radius
   #
   "border-radius": [
-    "-moz-border-radius",
-    "-webkit-border-radius"
+    ( VENDOR_MOZ, "-moz-border-radius" ),
+    ( VENDOR_WEBKIT, "-webkit-border-radius" )
   ],
   
   "border-top-left-radius": [
-    "-moz-border-radius-topleft",
-    "-webkit-border-top-left-radius"
+    ( VENDOR_MOZ, "-moz-border-radius-topleft" ),
+    ( VENDOR_WEBKIT, "-webkit-border-top-left-radius" )
   ],
   
   "border-top-right-radius": [
-    "-moz-border-radius-topright",
-    "-webkit-border-top-right-radius"
+    ( VENDOR_MOZ, "-moz-border-radius-topright" ),
+    ( VENDOR_WEBKIT, "-webkit-border-top-right-radius" )
   ],
   
   "border-bottom-left-radius": [
-    "-moz-border-radius-bottomleft",
-    "-webkit-border-bottom-left-radius"
+    ( VENDOR_MOZ, "-moz-border-radius-bottomleft" ),
+    ( VENDOR_WEBKIT, "-webkit-border-bottom-left-radius" )
   ],
   
   "border-bottom-right-radius": [
-    "-moz-border-radius-bottomright",
-    "-webkit-border-bottom-right-radius"
+    ( VENDOR_MOZ, "-moz-border-radius-bottomright" ),
+    ( VENDOR_WEBKIT, "-webkit-border-bottom-right-radius" )
   ],
   
   #
@@ -223,9 +302,9 @@ PROPERTY_EXPANDABLES = {
   #
   
   "transition": [
-    "-webkit-transition",
-    "-moz-transition",
-    "-o-transition"
+    ( VENDOR_WEBKIT, "-webkit-transition" ),
+    ( VENDOR_MOZ, "-moz-transition" ),
+    ( VENDOR_OPERA, "-o-transition" )
   ],
   
   #
@@ -233,9 +312,9 @@ PROPERTY_EXPANDABLES = {
   #
   
   "opacity": [
-    "-moz-opacity",
-    "-khtml-opacity",
-    ExpandableHandler.ie_opacity
+    ( VENDOR_MOZ, "-moz-opacity" ),
+    ( VENDOR_KHTML, "-khtml-opacity" ),
+    ( VENDOR_MS_FILTER, ExpandableHandler.ie_opacity )
   ]
 }
 
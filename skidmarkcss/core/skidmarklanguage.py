@@ -34,37 +34,35 @@ t_comment = r"/\*([^*]|[\r\n]|(\*+([^*/]|[\r\n])))*\*+/"
 t_param = "[a-zA-Z0-9#.]+%?|" + t_string + "|" + t_variable
 t_pnmchar = "[A-Za-z0-9-]|" + p(t_nonascii) + "|" + p(t_escape)
 t_pname = p(p("\*?" + t_pnmchar) + "+" + "|[*_]?[A-Za-z0-9-]+")
-
-# Compiled RegExp
-rec = re.compile
-re_attrib_type = rec("~?=")
-re_class = rec(t_class)
-re_combinator = rec("[+>]")
-re_comment = rec(t_comment)
-re_constant = rec(t_constant)
-re_mathconstant = rec(t_mathconstant)
-re_element_name = rec(p(t_ident) + "|\\*")
-re_hash = rec(t_hash)
-re_ident = rec(t_ident)
-re_import_rule = rec(t_import_rule)
-re_charset_rule = rec(t_charset_rule)
-re_math = rec(t_math)
-re_name = rec(t_name)
-re_pname = rec(t_pname)
-re_param = rec(t_param)
-re_propertyvalue = rec(r"[^;}]*")
-re_string = rec(t_string)
-re_variable = rec(t_variable)
-re_property_value_start = re.compile("[a-zA-Z0-9_:#=().,%-]+")
-re_simple_property = re.compile("[a-zA-Z0-9]+")
-re_css_func = re.compile("[a-zA-Z0-9-]+\([^\r\n}]*\)")
+t_attrib_type = "~?="
+t_combinator = "[+>]"
+t_element_name = p(t_ident) + "|\\*"
+t_propertyvalue = r"[^;}]*"
+t_property_value_start = "[a-zA-Z0-9_:#=().,%-]+"
+t_simple_property = "[a-zA-Z0-9]+"
+t_css_func = "[a-zA-Z0-9-]+\([^\r\n}]*\)"
+t_mediaquery = "@media\s+[^{]*"
+
+# Compiled RegExp, compiled on first use (see rec)
+COMPILED = {}
+
+def rec(pattern):
+  """Returns the compiled regex of the pattern, it is compiled the first time
+  it is used by the grammar"""
+  
+  regex = COMPILED.get(pattern)
+  
+  if regex is None:
+    regex = COMPILED[pattern] = re.compile(pattern)
+  
+  return regex
 
 
 def import_rule():
-  return re_import_rule
+  return rec(t_import_rule)
 
 def charset_rule():
-  return re_charset_rule
+  return rec(t_charset_rule)
 
 def builtin_css_directives():
   return [ import_rule, charset_rule ]
@@ -73,13 +71,13 @@ def variable_set():
   return variable(), "=", [ math_group, plugin, constant, variable ], ";"
 
 def variable():
-  return re_variable
+  return rec(t_variable)
 
 def constant():
-  return re_constant
+  return rec(t_constant)
 
 def mathconstant():
-  return re_mathconstant
+  return rec(t_mathconstant)
 
 def math_operation():
   return [ math_var(), math_group ], math_op(), [ math_var(), math_group ], ZERO_OR_MORE, (math_op(), [ math_var(), math_group ])
@@ -91,7 +89,7 @@ def math_group():
   return "(", math_operation(), ")"
 
 def math_op():
-  return re_math
+  return rec(t_math)
 
 def template():
   return "@@template ", function_declaration(), declarationblock
@@ -100,19 +98,19 @@ def use():
   return "@@use ", function(), ";"
   
 def hash():
-  return re_hash
+  return rec(t_hash)
 
 def string():
-  return re_string
+  return rec(t_string)
 
 def ident():
-  return re_ident
+  return rec(t_ident)
 
 def class_():
-  return re_class
+  return rec(t_class)
 
 def element_name():
-  return re_element_name
+  return rec(t_element_name)
 
 def function():
   return ident(), "(", ZERO_OR_ONE, param_list(), ")"
@@ -130,10 +128,10 @@ def param_list_declaration():
   return ZERO_OR_ONE, param, ZERO_OR_MORE, (",", param)
   
 def param():
-  return re_param
+  return rec(t_param)
 
 def comment():
-  return re_comment
+  return rec(t_comment)
 
 def pseudo():
   return ":", [ function, ident ]
@@ -145,13 +143,13 @@ def attrib():
   return "[", ident, ZERO_OR_ONE, (attrib_type, [ ident, string ]), "]"
 
 def attrib_type():
-  return re_attrib_type
+  return rec(t_attrib_type)
   
 def simple_selector():
   return [ (element_name, ZERO_OR_MORE, [hash, class_, attrib, pseudo, css3pseudo]), (ONE_OR_MORE, [hash, class_, attrib, pseudo, css3pseudo]) ]
 
 def combinator():
-  return re_combinator
+  return rec(t_combinator)
 
 def selector():
   return simple_selector(), ZERO_OR_ONE, (ZERO_OR_ONE, combinator, selector)
@@ -175,16 +173,16 @@ def plugin():
   return "~", function()
 
 def propertyname():
-  return re_pname
+  return rec(t_pname)
 
 def propertyvalue():
-  return ZERO_OR_MORE, [ math_group, propertyvalue_pluginextended, plugin, re_css_func, re_property_value_start, re_simple_property ], re_propertyvalue
+  return ZERO_OR_MORE, [ math_group, propertyvalue_pluginextended, plugin, rec(t_css_func), rec(t_property_value_start), rec(t_simple_property) ], rec(t_propertyvalue)
 
 def pre_plugin_text():
   return rec("[^~;]*")
   
 def propertyvalue_pluginextended():
-  return re_simple_property, plugin, ZERO_OR_MORE, propertyvalue_pluginextended
+  return rec(t_simple_property), plugin, ZERO_OR_MORE, propertyvalue_pluginextended
 
 def property():
   return property_unterminated(), ";"
@@ -193,7 +191,7 @@ def property_unterminated():
   return propertyname, ":", propertyvalue
 
 def mediaquery():
-  return re.compile("@media\s+[^{]*"), "{", language, "}"
+  return rec(t_mediaquery), "{", language, "}"
 
 def declarationblock():
   return "{", ZERO_OR_MORE, [ property, directive, comment, declaration, use, expansion, variable_set ], ZERO_OR_ONE, property_unterminated, "}"
@@ -201,5 +199,8 @@ def declarationblock():
 def declaration():
   return full_selector(), declarationblock
   
+def _language_item():
+  return [ comment, builtin_css_directives(), declaration, directive, template, variable_set, mediaquery ]
+
 def language():
-  return ZERO_OR_MORE, [ comment, builtin_css_directives(), declaration, directive, template, variable_set, mediaquery ]
+  return ZERO_OR_MORE, _language_item
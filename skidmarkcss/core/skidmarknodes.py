@@ -6,7 +6,7 @@ import copy
 
 import skidmarkoutputs
 from propertyexpandables import PROPERTY_EXPANDABLES, PROPERTY_SHORTHANDS, ShorthandHandler, ExpandableHandler
-from skidmarklanguage import re_pname
+from skidmarklanguage import rec, t_pname
 
 class SkidmarkHierarchy(object):
   """This is the master class for all skidmark objects.
@@ -148,11 +148,12 @@ class n_Selector(SkidmarkHierarchy):
 class n_DeclarationBlock(SkidmarkHierarchy):
   """Defines a CSS declaration block"""
   
-  def __init__(self, parent, simplify_output, output_format):
+  def __init__(self, parent, simplify_output, output_format, vendors=None):
     SkidmarkHierarchy.__init__(self, parent)
     self.properties = []
     self.simplify_output = simplify_output
     self.output_format = output_format
+    self.vendors = vendors
     self.requires_shorthand_check = False
     
     ShorthandHandler.set_output_format(output_format)
@@ -163,9 +164,10 @@ class n_DeclarationBlock(SkidmarkHierarchy):
     return len(self.properties) > 0
   
   def _expand_property(self, property_name):
-    """Returns a list of alias property names that should also be set to the same value"""
+    """Returns a list of alias property names that should also be set to the same value.
+    Only the aliases required by the vendors (see BROWSER_TARGETS) are returned"""
     
-    expandables = [ property_name ] + PROPERTY_EXPANDABLES.get(property_name, [])
+    expandables = [ property_name ] + [ expandable for vendor, expandable in PROPERTY_EXPANDABLES.get(property_name, []) if self.vendors is None or vendor in self.vendors ]
     return expandables
   
   def add_property(self, property, bypass_expand=False, position=-1):
@@ -291,9 +293,14 @@ class n_DeclarationBlock(SkidmarkHierarchy):
         self.properties.pop(idx)
         processed.pop(idx)
     
-    # Create the shorthand if it's possible (removing the originals)
+    # Create the shorthand if it's possible (removing the originals). Every
+    # property of a block is required, the blocks missing one are skipped early.
+    property_names = set(processed)
     for shorthand, shorthand_blocks in PROPERTY_SHORTHANDS.iteritems():
       for blk in shorthand_blocks:
+        if not property_names.issuperset(blk[1:]):
+          continue
+        
         style = blk[0]
         block_values = [ self.has_property(property_name) for property_name in blk[1:] ]
         shorthand_property = ShorthandHandler.process(style, shorthand, block_values)
@@ -303,10 +310,23 @@ class n_DeclarationBlock(SkidmarkHierarchy):
           
           self.add_property(shorthand_property, bypass_expand=True, position=positions[0])
           self.remove_property(blk)
+          property_names = set([ n_DeclarationBlock.get_property_parts(p)[0] for p in self.properties ])
           break
     
     return
   
+  def minify_properties(self):
+    """Shortens the values of the properties (see ValueMinifier). This method
+    will take care of updating the properties itself and does not return anything."""
+    
+    # Only imported when the values are minified
+    from valueminifier import ValueMinifier
+    
+    sep = skidmarkoutputs.OUTPUT_TEMPLATE_PROPERTY_VALUE_SEPARATOR[self.output_format]
+    self.properties = [ ValueMinifier.minify_property(property, sep) for property in self.properties ]
+    
+    return
+  
   def _transfer_data(self, declaration_block_dest):
     """Transfer all properties to another declaration block"""
     
@@ -334,7 +354,7 @@ class n_DeclarationBlock(SkidmarkHierarchy):
     name, value = [ ps.strip() for ps in prop.split(":", 1) ]
     
     # Validate the property name
-    if re_pname.match(name).group() != name:
+    if rec(t_pname).match(name).group() != name:
       raise ValueError("Unable to obtain property parts for '%s'" % ( prop, ))
     
     return name, value
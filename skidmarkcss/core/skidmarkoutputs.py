@@ -55,3 +55,24 @@ OUTPUT_TEMPLATE_MEDIAQUERY = {
   CSS_OUTPUT_COMPACT: "%s { %s }",
   CSS_OUTPUT_CLEAN: "%%s {\n%s%%s\n}\n" % ( " " * SPACING_CLEAN, )
 }
+
+INDENTED_TEMPLATES = {}
+
+def get_template(templates, output_format, level=0):
+  """Returns the template of the output format (from one of the OUTPUT_TEMPLATE
+  dicts) indented for the nesting level. The content of a media query is
+  rendered one level deeper than the media query itself."""
+  
+  template = templates[output_format]
+  
+  if not level:
+    return template
+  
+  key = ( id(templates), output_format, level )
+  indented_template = INDENTED_TEMPLATES.get(key)
+  
+  if indented_template is None:
+    indented_template = template.replace("\n", "\n" + " " * SPACING_CLEAN * level)
+    INDENTED_TEMPLATES[key] = indented_template
+  
+  return indented_template
@@ -0,0 +1,118 @@
+# -*- coding: latin-1 -*-
+
+"""Loads the SkidmarkCSS sources. Each source is decoded a single time, the
+large files being memory-mapped so that their bytes are never copied"""
+
+import codecs
+import mmap
+import os
+import re
+
+re_charset = re.compile(r"""^@charset\s+["']([-_A-Za-z0-9.:]+)["']\s*;""")
+
+class SourceReader(object):
+  """Classmethods used to read and decode a source, given a filename or a
+  file-like object"""
+  
+  def __init__(self):
+    pass
+  
+  @classmethod
+  def read_file(cls, filename, encoding=None):
+    """Returns the decoded content of the file and its encoding (tuple). The
+    files of MMAP_THRESHOLD bytes or more are memory-mapped"""
+    
+    f = open(filename, "rb")
+    
+    try:
+      size = os.fstat(f.fileno()).st_size
+      if size < MMAP_THRESHOLD:
+        return cls.decode(f.read(), encoding)
+      
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        return cls.decode(data, encoding)
+      finally:
+        data.close()
+    finally:
+      f.close()
+  
+  @classmethod
+  def read_stream(cls, stream, encoding=None):
+    """Returns the decoded content of a file-like object and its encoding (tuple)"""
+    
+    data = stream.read()
+    
+    if isinstance(data, unicode):
+      return data, encoding or DEFAULT_ENCODING
+    
+    return cls.decode(data, encoding)
+  
+  @classmethod
+  def decode(cls, data, encoding=None):
+    """Decodes the data (string or buffer) in a single pass. Returns the text
+    (unicode) and the encoding used (tuple)"""
+    
+    encoding = cls.detect_encoding(data, encoding)
+    
+    return codecs.getdecoder(encoding)(data)[0], encoding
+  
+  @classmethod
+  def detect_encoding(cls, data, encoding=None):
+    """Returns the encoding of the data, following the CSS precedence: the BOM
+    (byte order mark), the encoding specified (configuration), the @charset
+    rule at the very start of the data, and finally DEFAULT_ENCODING"""
+    
+    head = data[:CHARSET_DETECTION_SIZE]
+    
+    for bom, bom_encoding in BOM_ENCODINGS:
+      if head.startswith(bom):
+        return bom_encoding
+    
+    if encoding:
+      return codecs.lookup(encoding).name
+    
+    mo = re_charset.match(head)
+    if mo:
+      try:
+        return codecs.lookup(mo.group(1)).name
+      except LookupError:
+        pass
+    
+    return DEFAULT_ENCODING
+  
+  @classmethod
+  def get_output_encoding(cls, encoding):
+    """Returns the encoding of the CSS generated from a source in the given
+    encoding (the byte order mark of UTF-8 sources is not kept)"""
+    
+    return OUTPUT_ENCODINGS.get(encoding, encoding or DEFAULT_ENCODING)
+
+
+#
+# Constants
+#
+
+# Files of this size (bytes) or more are memory-mapped
+MMAP_THRESHOLD = 1024 * 1024
+
+# Encoding of the sources that do not specify it
+DEFAULT_ENCODING = "utf-8"
+
+# Number of bytes inspected to find the @charset rule
+CHARSET_DETECTION_SIZE = 128
+
+# The byte order marks, the 32 bits ones are tested first as the UTF-32 LE mark
+# starts with the UTF-16 LE one
+BOM_ENCODINGS = (
+  ( codecs.BOM_UTF8, "utf-8-sig" ),
+  ( codecs.BOM_UTF32_LE, "utf-32" ),
+  ( codecs.BOM_UTF32_BE, "utf-32" ),
+  ( codecs.BOM_UTF16_LE, "utf-16" ),
+  ( codecs.BOM_UTF16_BE, "utf-16" )
+)
+
+# Encoding of the output, when it differs from the source encoding
+OUTPUT_ENCODINGS = {
+  "utf-8-sig": "utf-8"
+}
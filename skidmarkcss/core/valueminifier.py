@@ -0,0 +1,164 @@
+# -*- coding: latin-1 -*-
+
+"""Shortens property values for the compressed output formats. Every rule is
+defined in the tables at the bottom of this file"""
+
+import re
+
+from htmlcolors import HTMLColors
+
+re_protected = re.compile(r"""("[^"]*"|'[^']*'|url\([^)]*\))""", re.I)
+re_number = re.compile(r"(?<![\w#.+-])(-?)(\d*\.?\d+)([a-zA-Z%]*)")
+re_math_function = re.compile(r"(?<![\w-])(?:-[a-zA-Z]+-)?(?:calc|min|max|clamp)\(", re.I)
+re_hex_color = re.compile(r"(?<![\w&])#[0-9a-fA-F]{6}(?![\w-])")
+re_word = re.compile(r"(?<![\w#.-])[a-zA-Z]+(?![\w(-])")
+
+class ValueMinifier(object):
+  """Classmethods used to minify property values. The results are cached per
+  distinct property string so that the values repeated throughout a stylesheet
+  are only minified once"""
+  
+  CACHE = {}
+  CACHE_SIZE = 10000
+  
+  def __init__(self):
+    pass
+  
+  @classmethod
+  def minify_property(cls, property, separator=":"):
+    """Returns the property (string) with its value minified"""
+    
+    minified = cls.CACHE.get(property)
+    
+    if minified is None:
+      prop_name, prop_value = [ ps.strip() for ps in property.split(":", 1) ]
+      minified = "%s%s%s" % ( prop_name, separator, cls.minify(prop_name, prop_value) )
+      
+      if len(cls.CACHE) >= cls.CACHE_SIZE:
+        cls.CACHE.clear()
+      cls.CACHE[property] = minified
+    
+    return minified
+  
+  @classmethod
+  def minify(cls, prop_name, prop_value):
+    """Returns the minified value of a property"""
+    
+    return cls._minify(prop_name.lower(), prop_value)
+  
+  @classmethod
+  def _minify(cls, prop_name, prop_value):
+    """Applies the rules of the tables to the value, leaving the strings and
+    urls untouched"""
+    
+    if prop_name in MINIFIER_SKIP_PROPERTIES or prop_value.lower().startswith("progid:"):
+      return prop_value
+    
+    keywords = MINIFIER_KEYWORDS.get(prop_name, {})
+    if prop_value.lower() in keywords:
+      return keywords[prop_value.lower()]
+    
+    segments = re_protected.split(prop_value)
+    for idx in range(0, len(segments), 2):
+      # The units of the zeros are required within the math functions
+      parts = cls._split_math_functions(segments[idx])
+      for part_idx in range(len(parts)):
+        keep_unit = part_idx % 2 == 1
+        parts[part_idx] = re_number.sub(lambda mo: cls._minify_number(mo, keep_unit), parts[part_idx])
+      
+      segment = "".join(parts)
+      segment = re_hex_color.sub(cls._minify_color, segment)
+      
+      if prop_name not in MINIFIER_SKIP_COLOR_NAMES:
+        segment = re_word.sub(cls._minify_color, segment)
+      
+      segments[idx] = segment
+    
+    return "".join(segments)
+  
+  @classmethod
+  def _split_math_functions(cls, segment):
+    """Returns the segment split around the math functions (calc()...), along
+    with their arguments: [ outside, function, outside, ... ]"""
+    
+    parts = []
+    start = 0
+    
+    mo = re_math_function.search(segment)
+    while mo is not None:
+      depth = 0
+      for end in range(mo.end() - 1, len(segment)):
+        if segment[end] == "(":
+          depth += 1
+        elif segment[end] == ")":
+          depth -= 1
+          if not depth:
+            break
+      
+      parts.append(segment[start:mo.start()])
+      parts.append(segment[mo.start():end + 1])
+      start = end + 1
+      
+      mo = re_math_function.search(segment, start)
+    
+    parts.append(segment[start:])
+    
+    return parts
+  
+  @classmethod
+  def _minify_number(cls, mo, keep_unit=False):
+    """Shortens a number: trims the redundant decimals, drops the leading zero
+    and the unit of lengths that are zero (unless keep_unit is True)"""
+    
+    sign, number, unit = mo.groups()
+    
+    if "." in number:
+      number = ("%.*f" % ( MINIFIER_PRECISION, float(number) )).rstrip("0").rstrip(".")
+      if number.startswith("0."):
+        number = number[1:]
+    else:
+      number = number.lstrip("0") or "0"
+    
+    if not number or number == "0":
+      number = "0"
+      sign = ""
+      if not keep_unit and unit.lower() in MINIFIER_ZERO_UNITS:
+        unit = ""
+    
+    return "%s%s%s" % ( sign, number, unit )
+  
+  @classmethod
+  def _minify_color(cls, mo):
+    """Replaces the color by its shortest form"""
+    
+    color = mo.group()
+    
+    if color.startswith("#") or color.lower() in HTMLColors.htmlcolors:
+      return HTMLColors.get_color_shortest(color)
+    return color
+
+
+#
+# Constants
+#
+
+# Number of decimals kept in numbers (computed math results may have many)
+MINIFIER_PRECISION = 5
+
+# Units that may be dropped when the value is zero. Times, angles and
+# percentages are kept, '0' is not valid (or not the same) for all of them.
+MINIFIER_ZERO_UNITS = set([ "px", "em", "ex", "ch", "rem", "vw", "vh", "vmin", "vmax", "pt", "pc", "cm", "mm", "in" ])
+
+# Properties left untouched
+MINIFIER_SKIP_PROPERTIES = set([ "filter", "-ms-filter", "content" ])
+
+# Properties where words are not colors, even if they share the name
+MINIFIER_SKIP_COLOR_NAMES = set([ "font", "font-family", "animation", "animation-name", "transition", "transition-property", "counter-reset", "counter-increment", "list-style-type" ])
+
+# Keywords that have a shorter equivalent, per property
+MINIFIER_KEYWORDS = {
+  "font-weight": {
+    "normal": "400",
+    "bold": "700"
+  }
+}
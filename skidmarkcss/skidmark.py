@@ -2,11 +2,14 @@
 
 """The SkidmarkCSS preprocessor"""
 
+import codecs
 import copy
+import heapq
 import itertools
 import os
 import re
 import sys
+import threading
 import time
 import StringIO
 
@@ -14,8 +17,17 @@ from pypeg import pyPEG
 
 from core import skidmarklanguage
 from core import skidmarkoutputs
+from core.compilecache import CompileCache
+from core.dimension import Dimension
+from core.lrucache import LRUCache
+from core.incremental import SourceSplitter, CompiledItem, DependencyGraph, DEPENDENCY_VARIABLE, DEPENDENCY_TEMPLATE
+from core.plugincache import PluginCache
+from core.prelude import PreludeSnapshot, PRELUDE_SNAPSHOT_EXTENSION
+from core.propertyexpandables import ShorthandHandler, ExpandableHandler, BROWSER_TARGETS
+from core.sourcereader import SourceReader
 from core.skidmarknodes import SkidmarkHierarchy, n_Declaration, n_Selector, n_DeclarationBlock, n_TextNode, n_Template, n_MediaQuery
-from core.plugindefaults import SkidmarkCSSPlugin, PropertyDarken, PropertyLighten, PropertyGradient, ColorFromHSL, Hue, Saturation, Lightness
+from core.pluginmanager import SkidmarkCSSPlugin, SharedValue
+from core.plugindefaults import BUILTIN_PLUGINS, GRADIENT_MODES, GRADIENT_MODE_INLINE
 
 re_combinator = re.compile(r"(?:[^ ])([+>]{1}\s+)")
 
@@ -65,6 +77,31 @@ class InvalidArgumentException(Exception):
   """An invalid argument was passed to SkidmarkCSS"""
   pass
 
+class BudgetExceeded(Exception):
+  """The compilation exceeded one of its budgets (see the max_* parameters)"""
+  pass
+
+class SelectorBudgetExceeded(BudgetExceeded):
+  """A rule expands to more selectors than max_selectors"""
+  pass
+
+class DepthBudgetExceeded(BudgetExceeded):
+  """The templates used by templates, or the files included by included files,
+  go deeper than max_depth"""
+  pass
+
+class NestingBudgetExceeded(BudgetExceeded):
+  """The blocks or parentheses of the source are nested deeper than max_nesting"""
+  pass
+
+class OutputBudgetExceeded(BudgetExceeded):
+  """The CSS generated is larger than max_output_bytes"""
+  pass
+
+class TimeBudgetExceeded(BudgetExceeded):
+  """The compilation (parse included) took more than max_time seconds"""
+  pass
+
 
 #
 # Variables and Constants
@@ -73,15 +110,67 @@ class InvalidArgumentException(Exception):
 TEMPLATES = {}
 VARIABLE_STACK = []
 
+# The value of a dependency that wasn't read from the global scope (see
+# SkidmarkCSS._add_dependency)
+NOT_READ = object()
+
+# The compiler state (variables, templates) is global: the compilations of a
+# process, whatever started them (execute_sm, compile_bytes, the worker, the
+# WSGI application, smfuture), run one at a time. Reentrant as the entry
+# points call each other
+COMPILE_LOCK = threading.RLock()
+
+# The exceptions reported by execute_sm (see get_error_report)
+REPORTED_ERRORS = ( Unimplemented, UnrecognizedParsedTree, UnexpectedTreeFormat, ErrorInFile, UnrecognizedSelector, FileNotFound, UndefinedTemplate, InvalidTemplateUse, VariableNotFound, BudgetExceeded )
+
+# Options that require the whole processed tree, unavailable in the streaming
+# and incremental modes
+WHOLE_TREE_OPTIONS = [ "unify_selectors", "merge_declarations", "eliminate_dead_declarations", "merge_mediaqueries" ]
+
+# Size of the buffer used when writing the output file
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+# Number of threads evaluating the calls of the batch plugins (0: disabled)
+PLUGIN_WORKERS = 4
+
+# The entry points of the packages providing plugins, the name of an entry
+# point being the name of its plugin (see SkidmarkCSS.get_plugin)
+PLUGIN_ENTRY_POINT_GROUP = "skidmarkcss.plugins"
+
+# Number of seconds between the checks for changes in watch mode
+WATCH_INTERVAL = 0.5
+
+# Number of parsed sources whose AST is kept in worker mode (see SkidmarkWorker)
+AST_CACHE_SIZE = 100
+
+# Maximum number of characters of the sources whose AST is kept
+AST_CACHE_BYTES = 16 * 1024 * 1024
+
+# Size of the reads of the worker mode requests (see SkidmarkWorker)
+WORKER_READ_SIZE = 64 * 1024
+
+# The default budgets of a compilation (None: unlimited), the limits beyond
+# which a source is rejected (see BudgetExceeded)
+MAX_SELECTORS = 10000
+MAX_DEPTH = 32
+MAX_NESTING = 64
+MAX_OUTPUT_BYTES = None
+MAX_TIME = None
+
+# Number of patterns matched by the parser between two checks of max_time
+PARSER_TIME_CHECK = 1000
+
 
 #
 # The Class that makes it all happen!
 #
 
 class SkidmarkCSS(object):
-  re_variable = re.compile(skidmarklanguage.t_variable)
-  re_number = re.compile("^([-+]?(?:\d+(?:\.\d+)?|\d+))")
   plugins = {}
+  plugins_loaded = False
+  plugin_cache = PluginCache()
+  ast_cache = None
+  compile_cache = None
   
   def __init__(self, config_dict, s_infile, s_outfile=None, parent=None, plugins=None):
     """Create the object by specifying a filename (s_infile) as an argument (string).
@@ -95,48 +184,90 @@ class SkidmarkCSS(object):
     
     start_time = time.time()
     self.src = ""
+    self.source_encoding = None
     self.log_indent_level = 0
     self.math_ops = None
     self.current_template_definition = None
     self.include_base_path = ""
     self.plugins = plugins
+    self.local_plugins = {}
+    self.dead_declarations_removed = 0
+    self.dead_declarations_bytes_saved = 0
+    self.compiled_item = parent is not None and parent.compiled_item or None
+    self.items = []
+    self.items_processed = 0
+    self.items_rendered = 0
+    self.overrides = {}
+    self.dependency_graph = None
+    self.source_files = {}
+    self.custom_properties = {}
+    self.depth = 0
+    self.deadline = self.max_time is not None and start_time + self.max_time or None
     
-    self.add_plugin(PropertyDarken)
-    self.add_plugin(PropertyLighten)
-    self.add_plugin(PropertyGradient)
-    self.add_plugin(ColorFromHSL)
-    self.add_plugin(Hue)
-    self.add_plugin(Saturation)
-    self.add_plugin(Lightness)
+    try:
+      self.vendors = ExpandableHandler.get_target_vendors(self.browser_targets)
+    except ValueError, e:
+      raise InvalidArgumentException(str(e))
     
-    if plugins is not None and type(plugins) is list:
-      for plugin in plugins:
-        SkidmarkCSS.add_plugin(plugin)
+    if self.gradient_mode not in GRADIENT_MODES:
+      raise InvalidArgumentException("Unknown gradient mode: %s (%s)" % ( self.gradient_mode, ", ".join(GRADIENT_MODES) ))
+    
+    if self.streaming and self.incremental:
+      raise InvalidArgumentException("The streaming and incremental modes can't be used together")
+    
+    for mode in ( "streaming", "incremental" ):
+      whole_tree_options = [ option for option in WHOLE_TREE_OPTIONS if getattr(self, option) ]
+      if getattr(self, mode) and whole_tree_options:
+        raise InvalidArgumentException("The %s mode processes one top-level item at a time, it can't be used with: %s" % ( mode, ", ".join(whole_tree_options) ))
+    
+    SkidmarkCSS.load_plugins()
+    
+    if self.prelude is not None and parent is None:
+      self._restore_prelude()
     
     if parent is not None:
       if not isinstance(parent, SkidmarkCSS):
         raise Unimplemented("SkidmarkCSS may only have another SkidmarkCSS as a parent")
       self.log_indent_level = parent.log_indent_level + 1
+      self.depth = parent.depth + 1
+      self.deadline = parent.deadline
+      self.local_plugins = parent.local_plugins
+      
+      if self.max_depth is not None and self.depth > self.max_depth:
+        raise DepthBudgetExceeded("The included files go deeper than %d levels, including '%s'" % ( self.max_depth, s_infile ))
       
       parent_src = os.path.join(*os.path.split(parent.s_infile))
       self.include_base_path = os.path.dirname(parent_src)
     
-    self.ast = self._parse_file()
-    ast_stop = time.time()
-    
-    self.processed_tree = self._process()
+    if plugins is not None and type(plugins) is list:
+      for plugin in plugins:
+        self._add_local_plugin(plugin)
     
-    if self.unify_selectors:
-      self._unite_common_declarations()
+    if self.streaming:
+      self.ast = None
+      self.processed_tree = None
+      
+      ast_time = self._process_stream()
+    elif self.incremental:
+      self.ast = None
+      self.initial_state = self._get_state()
+      
+      ast_time = self._process_incremental()
+    else:
+      self.ast = self._parse_file()
+      ast_time = time.time() - start_time
+      
+      self.processed_tree = self._process()
+      
+      self._process_output()
     
-    self._process_output()
+    self.ast_time = ast_time
     
     if self.timer and self.log_indent_level == 0:
       verbose = self.verbose
       self.verbose = True
       
       full_time = time.time() - start_time
-      ast_time = ast_stop - start_time
       
       ast_perc = ast_time * 100.0 / full_time
       
@@ -155,6 +286,23 @@ class SkidmarkCSS(object):
     self.show_hierarchy = False
     self.simplify_output = True
     self.unify_selectors = False
+    self.merge_declarations = False
+    self.eliminate_dead_declarations = False
+    self.minify_values = False
+    self.merge_mediaqueries = False
+    self.browser_targets = None
+    self.streaming = False
+    self.incremental = False
+    self.encoding = None
+    self.prelude = None
+    self.math_precision = None
+    self.plugin_workers = PLUGIN_WORKERS
+    self.gradient_mode = GRADIENT_MODE_INLINE
+    self.max_selectors = MAX_SELECTORS
+    self.max_depth = MAX_DEPTH
+    self.max_nesting = MAX_NESTING
+    self.max_output_bytes = MAX_OUTPUT_BYTES
+    self.max_time = MAX_TIME
     self.timer = False
     
     return
@@ -173,6 +321,11 @@ class SkidmarkCSS(object):
         ", ".join(invalid_params)
       ))
     
+    # A prelude snapshot provides the defaults of the config it was taken with
+    prelude = config_dict.get("prelude")
+    if prelude is not None:
+      self.__dict__.update(prelude.config)
+    
     self.__dict__.update(config_dict)
     
     return
@@ -183,44 +336,104 @@ class SkidmarkCSS(object):
     If the source file is fully parsed, then err == None, else err is a tuple with
     the following information: (textline_err_pos, line_no, line_err_pos)"""
     
-    lines = []
-    lineNo = 0
     err = None
-    orig = u""
-
-    for lineno, line in enumerate(textline.split("\n")):
-      lines.append((len(orig), lineno))
-      orig += unicode(line) + "\n"
-    textlen = len(orig)
     
-    p = pyPEG.parser()
+    p = self._get_parser()
     p.packrat = packrat
     text = pyPEG.skip(p.skipper, textline, pattern, skipWS, skipComments)
     ast, text = p.parseLine(text, pattern, resultSoFar, skipWS, skipComments)
+    self._check_time()
     
     if p.restlen:
-      error_pos = len(textline) - p.restlen
-      line_no = [ data[1] for data in lines if data[0] < error_pos ][-1]
-      
-      char_pos = error_pos - lines[line_no][0] - 1
-      if line_no + 1 >= len(lines):
-        err = ( textline[lines[line_no][0]:], line_no + 1, char_pos)
-      else:
-        err = ( textline[lines[line_no][0]:lines[line_no + 1][0]], line_no + 1, char_pos)
+      err = self._get_parse_error(textline, p.restlen)
       
     return ast, err
   
+  def _iter_ast(self, textline, pattern, skipWS=True, skipComments=None):
+    """Calls pyPEG to obtain the AST of the items matching the pattern, one at a
+    time, until the textline is fully parsed. This is a generator, yielding the
+    AST of each item. Raises ErrorInFile if an item can't be parsed"""
+    
+    p = self._get_parser()
+    text = pyPEG.skip(p.skipper, textline, pattern, skipWS, skipComments)
+    
+    while text:
+      self._check_time()
+      
+      try:
+        ast, text = p.parseLine(text, pattern, [], skipWS, skipComments)
+      except SyntaxError:
+        ast = None
+      
+      if not ast:
+        self._raise_parse_error(self._get_parse_error(textline, p.restlen))
+      
+      for item in ast:
+        yield item
+  
+  def _get_parser(self):
+    """Returns the pyPEG parser of the source, checking max_time while it
+    parses when there is one (see BudgetParser)"""
+    
+    if self.deadline is None:
+      return pyPEG.parser()
+    
+    return BudgetParser(self)
+  
+  def _get_parse_error(self, textline, restlen):
+    """Returns the parse error tuple: (textline_err_pos, line_no, line_err_pos),
+    given the length of the unparsed text"""
+    
+    lines = []
+    line_start = 0
+    for lineno, line in enumerate(textline.split("\n")):
+      lines.append((line_start, lineno))
+      line_start += len(line) + 1
+    
+    error_pos = len(textline) - restlen
+    line_no = [ data[1] for data in lines if data[0] < error_pos ][-1]
+    
+    char_pos = error_pos - lines[line_no][0] - 1
+    if line_no + 1 >= len(lines):
+      err = ( textline[lines[line_no][0]:], line_no + 1, char_pos)
+    else:
+      err = ( textline[lines[line_no][0]:lines[line_no + 1][0]], line_no + 1, char_pos)
+    
+    return err
+  
+  def _raise_parse_error(self, err):
+    """Raises the ErrorInFile exception describing the parse error"""
+    
+    raise ErrorInFile("Error parsing '%s'\nLine %d: %s\n%s^" % ( self.s_infile, err[1], err[0], " " * (len(str(err[1])) + 6 + err[2]) ))
+  
   def get_config_dict(self, **kw):
     """Returns a config dictionary, using the current config values and
     not necesarily those passed to the __init__ method"""
     
     config = dict(
       verbose=self.verbose,
-      printcss=self.purintcss,
+      printcss=self.printcss,
       output_format=self.output_format,
       show_hierarchy=self.show_hierarchy,
       simplify_output=self.simplify_output,
       unify_selectors=self.unify_selectors,
+      merge_declarations=self.merge_declarations,
+      eliminate_dead_declarations=self.eliminate_dead_declarations,
+      minify_values=self.minify_values,
+      merge_mediaqueries=self.merge_mediaqueries,
+      browser_targets=self.browser_targets,
+      streaming=self.streaming,
+      incremental=self.incremental,
+      encoding=self.encoding,
+      prelude=self.prelude,
+      math_precision=self.math_precision,
+      plugin_workers=self.plugin_workers,
+      gradient_mode=self.gradient_mode,
+      max_selectors=self.max_selectors,
+      max_depth=self.max_depth,
+      max_nesting=self.max_nesting,
+      max_output_bytes=self.max_output_bytes,
+      max_time=self.max_time,
       timer=self.timer
     )
     
@@ -269,16 +482,30 @@ class SkidmarkCSS(object):
     self._log("-" * 72)
     self._log("Loading '%s'" % ( self.s_infile, ))
     self.src = self._get_file_src()
+    self._check_nesting(self.src)
     
     self._update_log_indent(+1)
-    self._log("%ld bytes" % ( len(self.src), ))
-    self._log("Using pyPEG to obtain the AST")
+    self._log("%ld characters, %s" % ( len(self.src), self.source_encoding ))
+    
+    # The AST is not modified by the processing, with an AST cache (worker
+    # mode) the ASTs of the sources compiled before (includes...) are reused
+    cached = SkidmarkCSS.ast_cache is not None and SkidmarkCSS.ast_cache.get(self.src) or None
+    if cached is None:
+      self._log("Using pyPEG to obtain the AST")
+      ast = self._get_ast(self.src, skidmarklanguage.language, resultSoFar=[], skipWS=True)
+      if SkidmarkCSS.ast_cache is not None:
+        SkidmarkCSS.ast_cache.set(self.src, ( ast, len(self.src) ))
+    else:
+      self._log("Reusing the AST of an identical source")
+      ast = cached[0]
+    
     self._update_log_indent(-1)
     
-    return self._get_ast(self.src, skidmarklanguage.language, resultSoFar=[], skipWS=True)
+    return ast
   
   def _get_file_src(self):
-    """Reads the byte content of self.s_infile and returns it as a string"""
+    """Reads the content of self.s_infile and returns it as a unicode string,
+    decoded once (see SourceReader). Sets self.source_encoding"""
     
     if isinstance(self.s_infile, basestring):
       src_dir, src_filename = os.path.split(self.s_infile)
@@ -307,44 +534,494 @@ class SkidmarkCSS(object):
       self._log("Reading file contents")
       
       try:
-        src = open(self.s_infile, "rb").read()
+        src, self.source_encoding = SourceReader.read_file(self.s_infile, self.encoding)
       except IOError:
         raise FileNotFound(self.s_infile)
+      except LookupError, e:
+        raise InvalidArgumentException(str(e))
+      
+      self.source_files[PreludeSnapshot.get_path(self.s_infile)] = os.stat(self.s_infile).st_mtime
       
       self._update_log_indent(-1)
       
       return src
 
     if hasattr(self.s_infile, 'read') and callable(self.s_infile.read):
-      return self.s_infile.read()
+      try:
+        src, self.source_encoding = SourceReader.read_stream(self.s_infile, self.encoding)
+      except LookupError, e:
+        raise InvalidArgumentException(str(e))
+      
+      return src
 
     raise TypeError("s_infile must be a filename (string) or file-like object.")
+  
+  def _check_nesting(self, src):
+    """Raises NestingBudgetExceeded if the blocks or parentheses of the source
+    are nested deeper than max_nesting, before the parser recurses through them"""
+    
+    if self.max_nesting is not None and SourceSplitter.get_nesting_depth(src) > self.max_nesting:
+      raise NestingBudgetExceeded("The blocks of %s are nested deeper than %d levels" % ( self._get_source_name(), self.max_nesting ))
+    
+    return
+  
+  def _get_source_name(self):
+    """Returns the name of the source in the messages: its filename, quoted"""
+    
+    if isinstance(self.s_infile, basestring):
+      return "'%s'" % ( self.s_infile, )
+    
+    return "the source"
+  
+  def _check_time(self):
+    """Raises TimeBudgetExceeded once the compilation took more than max_time"""
+    
+    if self.deadline is not None and time.time() > self.deadline:
+      raise TimeBudgetExceeded("The compilation of %s took more than %s seconds" % ( self._get_source_name(), self.max_time ))
+    
+    return
 
   def _process(self):
     """Processes the AST that has been generated in __init__"""
     
     tree, err = self.ast
     if err:
-      raise ErrorInFile("Error parsing '%s'\nLine %d: %s\n%s^" % ( self.s_infile, err[1], err[0], " " * (len(str(err[1])) + 6 + err[2]) ))
+      self._raise_parse_error(err)
     
     tree_len = len(tree)
     if tree_len != 1:
       raise UnrecognizedParsedTree("Root element should have a single element, not %d" % ( tree_len, ))
     
     self._log("Walking through the AST to create an object tree")
-    data = self._process_node(tree[0])
+    data = self._process_tree(tree[0])
     self._log("Walking through AST has completed")
     
+    return self._clean_processed_tree(data)
+  
+  def _clean_processed_tree(self, data):
+    """Returns the processed tree without its empty items"""
+    
     # We may not get anything valuable back (an include file may simply have variable
     # definitions... no tree in that case).  Clean this up if this is the case.
     data = [ type(item) is list and len(item) == 1 and item[0] or item for item in data if item ]
     
     return data
   
-  def _process_output(self):
-    """Using the processed tree, generate the output data"""
+  def _process_stream(self):
+    """Streaming mode: parses, processes and outputs the top-level items of the
+    source one at a time, their AST and objects being released as soon as their
+    CSS is generated. Returns the time spent obtaining the AST"""
     
-    data = self.get_processed_tree()
+    self._log("-" * 72)
+    self._log("Loading '%s'" % ( self.s_infile, ))
+    self.src = self._get_file_src()
+    self._check_nesting(self.src)
+    
+    self._update_log_indent(+1)
+    self._log("%ld characters, %s" % ( len(self.src), self.source_encoding ))
+    self._log("Streaming the AST with pyPEG, one item at a time")
+    self._update_log_indent(-1)
+    
+    self.ast_time = 0.0
+    
+    self._write_output(self._generate_stream_css())
+    self.src = ""
+    
+    return self.ast_time
+  
+  def _generate_stream_css(self):
+    """Helper function for _process_stream().
+    This is a generator, yielding the CSS rules (string) of each top-level item"""
+    
+    ast_start = time.time()
+    
+    for item in self._iter_ast(self.src, skidmarklanguage._language_item):
+      self.ast_time += time.time() - ast_start
+      
+      data = self._clean_processed_tree(self._process_tree(( "language", [ item ] )))
+      self._log_hierarchy(data)
+      
+      for css_str in self._generate_css(data):
+        yield css_str
+      
+      ast_start = time.time()
+    
+    self.ast_time += time.time() - ast_start
+  
+  def _process_incremental(self):
+    """Incremental mode: compiles the top-level items of the source separately,
+    keeping the result of each (self.items) so that update() only compiles the
+    items affected by a change. Returns the time spent obtaining the AST"""
+    
+    self._log("-" * 72)
+    self._log("Loading '%s'" % ( self.s_infile, ))
+    self.src = self._get_file_src()
+    self._check_nesting(self.src)
+    
+    self._update_log_indent(+1)
+    self._log("%ld characters, %s" % ( len(self.src), self.source_encoding ))
+    self._update_log_indent(-1)
+    
+    self.ast_time = 0.0
+    
+    self.items = self._compile_items(self.src)
+    self.dependency_graph = None
+    self.processed_tree = list(itertools.chain(*[ item.data for item in self.items ]))
+    self.src = ""
+    
+    self._log_hierarchy(self.processed_tree)
+    self._write_output(itertools.chain(*[ item.css for item in self.items ]))
+    
+    return self.ast_time
+  
+  def update(self, src):
+    """Compiles the new source (string) of an object created in incremental
+    mode, and writes its output again. Only the top-level items that changed,
+    or that read a variable or template defined by an item that changed, are
+    compiled; the CSS of the others is reused. An included file is compiled
+    again only if its @include item has to be.
+    Returns the number of items compiled"""
+    
+    if not self.incremental:
+      raise InvalidArgumentException("update() requires the incremental mode")
+    
+    start_time = time.time()
+    
+    if not isinstance(src, unicode):
+      src, self.source_encoding = SourceReader.decode(src, self.encoding)
+    
+    self._check_nesting(src)
+    self.deadline = self.max_time is not None and start_time + self.max_time or None
+    
+    self.ast_time = 0.0
+    self.dead_declarations_removed = 0
+    
+    self.items = self._compile_items(src, self.items)
+    self.dependency_graph = None
+    self.processed_tree = list(itertools.chain(*[ item.data for item in self.items ]))
+    
+    self._write_output(itertools.chain(*[ item.css for item in self.items ]))
+    
+    if self.timer:
+      verbose = self.verbose
+      self.verbose = True
+      self._log("-> Updated '%s' in %.04f seconds, compiled %d of %d items" % ( self.s_infile, time.time() - start_time, self.items_processed, len(self.items) ))
+      self.verbose = verbose
+    
+    return self.items_processed
+  
+  def _compile_items(self, src, previous=None):
+    """Compiles the top-level items of the source (see SourceSplitter). The
+    items of the previous compilation (list of CompiledItem) found at the same
+    place are reused, unless they depend on a variable or template defined by
+    an item that was compiled or removed. Returns the list of CompiledItem"""
+    
+    texts = SourceSplitter.split(src)
+    previous = previous or []
+    
+    # Match the unchanged items, in order: an item that moved may see other values
+    import difflib
+    
+    reused = {}
+    matcher = difflib.SequenceMatcher(None, [ item.text for item in previous ], [ text for line, text in texts ], autojunk=False)
+    for prev_idx, idx, size in matcher.get_matching_blocks():
+      for offset in range(size):
+        reused[idx + offset] = previous[prev_idx + offset]
+    
+    reused_ids = set([ id(item) for item in reused.itervalues() ])
+    
+    dirty = set()
+    for item in previous:
+      if id(item) not in reused_ids:
+        dirty.update(item.get_definitions())
+    
+    self._set_state(self.initial_state)
+    self._apply_overrides(self.overrides)
+    self.items_processed = 0
+    
+    items = []
+    for idx, ( line, text ) in enumerate(texts):
+      item = reused.get(idx)
+      
+      if item is None or item.dependencies & dirty:
+        item = self._compile_item(text, line)
+        dirty.update(item.get_definitions())
+        self.items_processed += 1
+      else:
+        item.line = line
+        self._apply_definitions(item)
+      
+      if self.overrides and [ name for name in item.variables if name in self.overrides ]:
+        self._apply_overrides(self.overrides)
+      
+      items.append(item)
+    
+    self._log("Compiled %d of %d items" % ( self.items_processed, len(items) ))
+    
+    return items
+  
+  def _compile_item(self, text, line):
+    """Parses, processes and renders a single top-level item, recording its
+    definitions and dependencies. Returns a CompiledItem"""
+    
+    item = CompiledItem(text, line)
+    
+    ast_start = time.time()
+    ast, err = self._get_ast(text, skidmarklanguage.language, resultSoFar=[], skipWS=True)
+    self.ast_time += time.time() - ast_start
+    
+    if err:
+      self._raise_parse_error(( err[0], err[1] + line - 1, err[2] ))
+    
+    item.ast = ast[0]
+    self._process_item(item)
+    
+    return item
+  
+  def _process_item(self, item):
+    """Processes and renders the AST of a compiled item, recording its
+    definitions and dependencies"""
+    
+    self.compiled_item = item
+    item.custom_properties = {}
+    try:
+      item.data = self._clean_processed_tree(self._process_tree(item.ast))
+    finally:
+      self.compiled_item = None
+    
+    item.css = list(self._generate_css(item.data))
+    
+    return
+  
+  def render(self, variables, outfile):
+    """Renders the CSS of an object created in incremental mode with some of
+    its global variables overridden (dict, the names may omit the leading '$'),
+    writing it to the outfile (a filename or an object with a write method).
+    The AST of the items is kept: only the items that read an overridden
+    variable (or a variable defined from one) are processed again, the CSS of
+    the others is reused. The object itself is left unchanged (see override).
+    Returns the number of items processed"""
+    
+    if not self.incremental:
+      raise InvalidArgumentException("render() requires the incremental mode")
+    
+    start_time = time.time()
+    
+    overrides = self._get_overrides(variables)
+    applied_overrides = dict(self.overrides)
+    applied_overrides.update(overrides)
+    
+    self._set_state(self.initial_state)
+    self._apply_overrides(applied_overrides)
+    
+    self.items_rendered = 0
+    self._write_output(self._render_items(overrides, applied_overrides), outfile)
+    
+    if self.timer:
+      verbose = self.verbose
+      self.verbose = True
+      self._log("-> Rendered '%s' in %.04f seconds, processed %d of %d items" % ( outfile, time.time() - start_time, self.items_rendered, len(self.items) ))
+      self.verbose = verbose
+    
+    return self.items_rendered
+  
+  def render_themes(self, themes, outfile_pattern):
+    """Renders the CSS of each theme (dict: theme name -> variables, see
+    render). The output filenames are given by the pattern, where '%s' is
+    replaced by the name of the theme. Returns the list of files written"""
+    
+    outfiles = []
+    
+    for name in sorted(themes):
+      outfile = outfile_pattern % ( name, )
+      self.render(themes[name], outfile)
+      outfiles.append(outfile)
+    
+    return outfiles
+  
+  def _render_items(self, overrides, applied_overrides):
+    """Helper function for render(), the items reading the overrides are
+    processed again with all the applied_overrides set.
+    This is a generator, yielding the CSS rules (string) of each item"""
+    
+    dirty = set([ ( DEPENDENCY_VARIABLE, name ) for name in overrides ])
+    
+    for item in self.items:
+      if item.dependencies & dirty:
+        rendered_item = CompiledItem(item.text, item.line)
+        rendered_item.ast = item.ast
+        self._process_item(rendered_item)
+        
+        dirty.update(rendered_item.get_definitions())
+        self.items_rendered += 1
+      else:
+        rendered_item = item
+        self._apply_definitions(item)
+      
+      if applied_overrides and [ name for name in rendered_item.variables if name in applied_overrides ]:
+        self._apply_overrides(applied_overrides)
+      
+      for css_str in rendered_item.css:
+        yield css_str
+  
+  def override(self, variables):
+    """Overrides some global variables (dict, the names may omit the leading
+    '$') of an object created in incremental mode, until they are overridden
+    again, and writes its output again. Using the dependency graph of the items,
+    only the items that read an overridden variable, or a variable defined from
+    one, are processed again: each of them with the global values it read (see
+    CompiledItem.reads), without going through the items that precede it.
+    Returns the indexes of the items processed (list)"""
+    
+    if not self.incremental:
+      raise InvalidArgumentException("override() requires the incremental mode")
+    
+    start_time = time.time()
+    
+    overrides = self._get_overrides(variables)
+    self.overrides.update(overrides)
+    
+    graph = self._get_dependency_graph()
+    
+    pending = []
+    for name in overrides:
+      pending.extend(graph.get_readers(( DEPENDENCY_VARIABLE, name )))
+    heapq.heapify(pending)
+    
+    # Values defined by the items processed: ( item index, name ) -> value
+    values = {}
+    processed = []
+    
+    while pending:
+      idx = heapq.heappop(pending)
+      if processed and processed[-1] == idx:
+        continue
+      
+      item = self.items[idx]
+      
+      variables, templates = {}, {}
+      for ( dependency_type, name ), value in item.reads.iteritems():
+        if dependency_type == DEPENDENCY_TEMPLATE:
+          templates[name] = value
+        elif name in self.overrides:
+          variables[name] = self.overrides[name]
+        else:
+          definer = graph.get_definer(( DEPENDENCY_VARIABLE, name ), idx)
+          variables[name] = values.get(( definer, name ), value)
+      
+      self._set_state(( [ variables ], templates ))
+      
+      processed_item = CompiledItem(item.text, item.line)
+      processed_item.ast = item.ast
+      self._process_item(processed_item)
+      
+      graph.remove_item(idx, item)
+      graph.add_item(idx, processed_item)
+      self.items[idx] = processed_item
+      processed.append(idx)
+      
+      # The items reading a variable this item defines differently are next
+      for name, value in processed_item.variables.iteritems():
+        if name in self.overrides or item.variables.get(name) == value:
+          continue
+        
+        values[( idx, name )] = value
+        for reader in graph.get_readers(( DEPENDENCY_VARIABLE, name )):
+          if reader > idx and graph.get_definer(( DEPENDENCY_VARIABLE, name ), reader) == idx:
+            heapq.heappush(pending, reader)
+    
+    self.processed_tree = list(itertools.chain(*[ item.data for item in self.items ]))
+    self._write_output(itertools.chain(*[ item.css for item in self.items ]))
+    
+    if self.timer:
+      verbose = self.verbose
+      self.verbose = True
+      self._log("-> Overridden %s in %.04f seconds, processed %d of %d items" % ( ", ".join(sorted(overrides)), time.time() - start_time, len(processed), len(self.items) ))
+      self.verbose = verbose
+    
+    return processed
+  
+  def _get_dependency_graph(self):
+    """Returns the dependency graph of the items, built when first needed"""
+    
+    if self.dependency_graph is None:
+      self.dependency_graph = DependencyGraph(self.items)
+    
+    return self.dependency_graph
+  
+  @classmethod
+  def _get_overrides(cls, variables):
+    """Returns the overridden variables (dict) without the leading '$' of their
+    names, their values being strings"""
+    
+    return dict([ ( name.lstrip("$"), unicode(value) ) for name, value in variables.iteritems() ])
+  
+  def _apply_overrides(self, overrides):
+    """Sets the global variables that are overridden (dict)"""
+    
+    if overrides:
+      if not VARIABLE_STACK:
+        VARIABLE_STACK.append({})
+      VARIABLE_STACK[0].update(overrides)
+    
+    return
+  
+  def _apply_definitions(self, item):
+    """Defines the global variables and templates of a compiled item again"""
+    
+    if item.variables:
+      if not VARIABLE_STACK:
+        VARIABLE_STACK.append({})
+      VARIABLE_STACK[0].update(item.variables)
+    
+    TEMPLATES.update(item.templates)
+    
+    return
+  
+  def _add_dependency(self, dependency_type, name, value=NOT_READ):
+    """Records that the item being compiled reads a variable or a template, and
+    the value it read from the global scope, if any"""
+    
+    if self.compiled_item is not None:
+      dependency = ( dependency_type, name )
+      self.compiled_item.dependencies.add(dependency)
+      if value is not NOT_READ:
+        self.compiled_item.reads.setdefault(dependency, value)
+    
+    return
+  
+  def _restore_prelude(self):
+    """Starts from the state of the prelude snapshot: its variables, templates
+    and plugins replace the current ones"""
+    
+    if not self.prelude.is_current():
+      raise InvalidArgumentException("The prelude snapshot is outdated, one of its files was modified: %s" % ( ", ".join(sorted(self.prelude.files)), ))
+    
+    self._set_state(( self.prelude.variable_stack, self.prelude.templates ))
+    self.local_plugins.update(self.prelude.plugins)
+    
+    self._log("Restored the prelude snapshot (%d files)" % ( len(self.prelude.files), ))
+    
+    return
+  
+  def _get_state(self):
+    """Returns the global state: the variable stack and the templates (tuple)"""
+    
+    return copy.deepcopy(VARIABLE_STACK), dict(TEMPLATES)
+  
+  def _set_state(self, state):
+    """Restores the global state returned by _get_state()"""
+    
+    variable_stack, templates = state
+    
+    VARIABLE_STACK[:] = copy.deepcopy(variable_stack)
+    TEMPLATES.clear()
+    TEMPLATES.update(templates)
+    
+    return
+  
+  def _log_hierarchy(self, data):
+    """Logs the hierarchy of the processed tree, if show_hierarchy is set"""
     
     if self.show_hierarchy:
       verbose_mode = self.verbose
@@ -362,25 +1039,81 @@ class SkidmarkCSS(object):
       
       self.verbose = verbose_mode
     
-    css = self._generate_css(data)
-    css_str = skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION_SEPARATOR[self.output_format].join(css)
+    return
+  
+  def _process_output(self):
+    """Using the processed tree, generate the output data"""
+    
+    data = self.get_processed_tree()
+    
+    self._log_hierarchy(data)
+    self._write_output(self._generate_css(data))
+    
+    return
+  
+  def _write_output(self, css, outfile=None):
+    """Writes the CSS rules (iterable of strings) to the outputs, or to the
+    outfile if specified (see _create_outfile)"""
+    
+    css = itertools.chain(css, self._generate_custom_properties_css())
+    css = self._join_css(css, skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION_SEPARATOR[self.output_format])
     
     if self.verbose and not self.printcss:
-      self._log("Generated CSS")
-      self._update_log_indent(+1)
-      self._log(css_str)
-      self._update_log_indent(-1)
+      css = self._log_css(css)
       
-    self._create_outfile(css_str)
+    css_len = self._create_outfile(css, outfile)
     
     self._log("=" * 72)
-    self._log("Completed processing %s, generated %d bytes" % ( self.s_infile, len(css_str) ))
+    self._log("Completed processing %s, generated %d bytes" % ( self.s_infile, css_len ))
+    
+    if self.eliminate_dead_declarations and (self.verbose or self.timer) and self.log_indent_level == 0:
+      verbose = self.verbose
+      self.verbose = True
+      self._log("-> Removed %d dead declaration%s, saving %d bytes" % ( self.dead_declarations_removed, self.dead_declarations_removed != 1 and "s" or "", self.dead_declarations_bytes_saved ))
+      self.verbose = verbose
     
     return
     
-  def _generate_css(self, tree=None):
-    """Builds the output CSS
-    Returns a list (each line of the CSS output)"""
+  def _generate_custom_properties_css(self):
+    """Yields the :root rule defining the custom properties shared by the
+    plugin results (see SharedValue), if there are any. Their order doesn't
+    matter, the rule is output last"""
+    
+    if self.items:
+      custom_properties = {}
+      for item in self.items:
+        custom_properties.update(item.custom_properties)
+    else:
+      custom_properties = self.custom_properties
+    
+    if custom_properties:
+      separator = skidmarkoutputs.OUTPUT_TEMPLATE_PROPERTY_VALUE_SEPARATOR[self.output_format]
+      yield self._render_declaration([ ":root" ], [ "%s%s%s" % ( name, separator, custom_properties[name] ) for name in sorted(custom_properties) ])
+  
+  def _join_css(self, css, separator):
+    """Yields the CSS rules (iterable of strings) with the separator between them"""
+    
+    for idx, css_str in enumerate(css):
+      if idx:
+        yield separator
+      yield css_str
+  
+  def _log_css(self, css):
+    """Logs the CSS rules (iterable of strings) as they are generated"""
+    
+    self._log("Generated CSS")
+    self._update_log_indent(+1)
+    
+    for css_str in css:
+      self._log(css_str)
+      yield css_str
+    
+    self._update_log_indent(-1)
+  
+  def _generate_css(self, tree=None, level=0):
+    """Builds the output CSS. The level is the nesting level of the tree (the
+    content of a media query is one level deeper than the media query)
+    This is a generator, yielding each rule of the CSS output (string)"""
     
     if tree is None:
       tree = self.get_processed_tree()
@@ -389,35 +1122,213 @@ class SkidmarkCSS(object):
     if type(tree) is not list:
       raise UnexpectedTreeFormat("The tree format passed to the _generate_css() method is not recognized")
     
-    css = []
-    for node in tree:
+    for entry in self._generate_css_get_entries(tree, level):
+      if isinstance(entry, basestring):
+        yield entry
+        continue
+      
+      all_selectors, blk = entry
+      yield self._render_declaration(all_selectors, blk.properties, level)
+  
+  def _render_declaration(self, all_selectors, properties, level=0):
+    """Returns the CSS (string) of a single rule, given its selectors and properties"""
+    
+    return skidmarkoutputs.get_template(skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION, self.output_format, level) % (
+      skidmarkoutputs.get_template(skidmarkoutputs.OUTPUT_TEMPLATE_SELECTOR_SEPARATORS, self.output_format, level).join(all_selectors),
+      skidmarkoutputs.get_template(skidmarkoutputs.OUTPUT_TEMPLATE_PROPERTY_SEPARATORS, self.output_format, level).join(properties)
+    )
+  
+  def _render_mediaquery(self, node, level=0):
+    """Returns the CSS (string) of a media query. Its content is rendered
+    directly at the indentation of the next level"""
+    
+    css = self._generate_css(node.blocks, level + 1)
+    css_str = skidmarkoutputs.get_template(skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION_SEPARATOR, self.output_format, level + 1).join(css)
+    
+    return skidmarkoutputs.get_template(skidmarkoutputs.OUTPUT_TEMPLATE_MEDIAQUERY, self.output_format, level) % ( node.media_query, css_str.rstrip() )
+  
+  def _generate_css_get_entries(self, tree, level=0):
+    """Helper function for _generate_css().
+    Walks the tree once, resolving the selectors of every declaration block a
+    single time. When unify_selectors is set, blocks sharing the same selectors
+    are united into the first block found for these selectors (the master block).
+    Returns a list of entries, in output order. An entry is either a string
+    (text nodes and media queries, already rendered) or a tuple containing the
+    selectors (list) and the declaration block"""
+    
+    entries = []
+    selector_index = {}
+    
+    nodes = self._iter_tree_nodes(tree)
+    if self.merge_mediaqueries:
+      nodes = self._merge_media_queries(nodes)
+    
+    for node in nodes:
       if isinstance(node, n_TextNode):
-        css.append(node.text)
+        entries.append(node.text)
         continue
       
       if isinstance(node, n_MediaQuery):
-        media_query_blocks = self._generate_css(node.blocks)
-        css_str = skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION_SEPARATOR[self.output_format].join(media_query_blocks)
-        css_str = ("\n".join([ "%s%s" % ( " " * skidmarkoutputs.SPACING_CLEAN * (0 if idx == 0 else 1), s ) for idx, s in enumerate(css_str.split("\n")) ])).strip()
-        css.append(skidmarkoutputs.OUTPUT_TEMPLATE_MEDIAQUERY[self.output_format] % ( node.media_query, css_str ))
+        entries.append(self._render_mediaquery(node, level))
+        continue
       
+      for all_selectors, blk in self._generate_css_get_blk_selectors(node):
+        if self.unify_selectors:
+          selector_key = tuple(all_selectors)
+          master_block = selector_index.get(selector_key)
+          
+          if master_block is not None:
+            blk._transfer_data(master_block)
+            continue
+          
+          selector_index[selector_key] = blk
+        
+        entries.append(( all_selectors, blk ))
+    
+    # Simplify once all the blocks have been united, the master blocks may have
+    # received properties from blocks found further down the tree
+    if self.simplify_output:
+      for entry in entries:
+        if not isinstance(entry, basestring):
+          entry[1].simplify_shorthandables()
+    
+    # Values are only minified for the compressed formats, the others are meant to be read
+    if self.minify_values and self.output_format in (skidmarkoutputs.CSS_OUTPUT_COMPRESSED, skidmarkoutputs.CSS_OUTPUT_SINGLELINE):
+      for entry in entries:
+        if not isinstance(entry, basestring):
+          entry[1].minify_properties()
+    
+    if self.eliminate_dead_declarations:
+      from core.cssoptimizer import DeadDeclarationEliminator
+      
+      render = lambda all_selectors, properties: self._render_declaration(all_selectors, properties, level)
+      entries, removed, bytes_saved = DeadDeclarationEliminator.eliminate(entries, render)
+      self.dead_declarations_removed += removed
+      self.dead_declarations_bytes_saved += bytes_saved
+    
+    if self.merge_declarations:
+      entries = self._merge_common_declarations(entries)
+    
+    return entries
+  
+  def _iter_tree_nodes(self, tree):
+    """Iterates through the nodes of a processed tree, flattening the lists
+    (the processed tree of an included file is a list)"""
+    
+    for node in tree:
       if type(node) is list:
-        blocks = []
-        for _node in node:
-          blocks.extend(self._generate_css_get_blk_selectors(_node))
+        for _node in self._iter_tree_nodes(node):
+          yield _node
       else:
-        blocks = self._generate_css_get_blk_selectors(node)
+        yield node
+    
+    return
+  
+  def _get_node_families(self, node):
+    """Returns the property families (set) of all the properties set by a node
+    and its descendants (see ShorthandHandler.get_property_families)"""
+    
+    families = set()
+    
+    if isinstance(node, n_MediaQuery):
+      for child in self._iter_tree_nodes(node.blocks):
+        families.update(self._get_node_families(child))
+    elif isinstance(node, SkidmarkHierarchy):
+      for blk in node.find_child_declaration_blocks([]):
+        for property in blk.properties:
+          families.update(ShorthandHandler.get_property_families(n_DeclarationBlock.get_property_parts(property)[0]))
+    
+    return families
+  
+  def _merge_media_queries(self, nodes):
+    """Merges the media queries that have the same condition. A media query is
+    moved up into the previous one if none of the nodes in between set a related
+    property, otherwise the previous media query is moved down into this one if
+    none of the nodes in between set a property related to its own. When neither
+    is possible the cascade order would change and both are kept.
+    Returns the list of nodes"""
+    
+    merged = []
+    candidates = {}
+    media_families = {}
+    last_set = {}
+    
+    for node in nodes:
+      families = self._get_node_families(node)
+      
+      if isinstance(node, n_MediaQuery):
+        media_key = " ".join(node.media_query.lower().split())
+        idx = candidates.get(media_key)
+        
+        if idx is not None:
+          previous = merged[idx]
+          
+          if not [ family for family in families if last_set.get(family, idx) > idx ]:
+            self._log("Merged '%s' into the previous media query" % ( media_key, ))
+            merged[idx] = n_MediaQuery(previous.parent, previous.media_query, previous.blocks + node.blocks)
+            media_families[idx].update(families)
+            for family in families:
+              last_set[family] = idx
+            continue
+          
+          if not [ family for family in media_families[idx] if last_set.get(family, idx) > idx ]:
+            self._log("Merged the previous media query into '%s'" % ( media_key, ))
+            merged[idx] = None
+            node = n_MediaQuery(node.parent, node.media_query, previous.blocks + node.blocks)
+            families.update(media_families.pop(idx))
+        
+        candidates[media_key] = len(merged)
+        media_families[len(merged)] = set(families)
+      
+      for family in families:
+        last_set[family] = len(merged)
+      merged.append(node)
+    
+    return [ node for node in merged if node is not None ]
+  
+  def _merge_common_declarations(self, entries):
+    """Merges the declaration blocks that have identical properties into a single
+    rule using the combined selectors. A block is only merged into an earlier one
+    if none of the blocks found in between set a related property (see
+    ShorthandHandler.get_property_families), which keeps the cascade order intact.
+    Text nodes and media queries are never crossed.
+    Returns the updated list of entries"""
+    
+    merged = []
+    candidates = {}
+    last_set = {}
+    
+    for entry in entries:
+      if isinstance(entry, basestring):
+        candidates = {}
+        merged.append(entry)
+        continue
+      
+      all_selectors, blk = entry
+      properties = tuple(blk.properties)
       
-      for all_selectors, blk in blocks:
-        if self.simplify_output:
-          blk.simplify_shorthandables()
+      families = set()
+      for property in properties:
+        families.update(ShorthandHandler.get_property_families(n_DeclarationBlock.get_property_parts(property)[0]))
+      
+      idx = candidates.get(properties)
+      if idx is not None and not [ family for family in families if last_set.get(family) != idx ]:
+        master_selectors = merged[idx][0]
+        for selector in all_selectors:
+          if selector not in master_selectors:
+            master_selectors.append(selector)
         
-        css.append(skidmarkoutputs.OUTPUT_TEMPLATE_DECLARATION[self.output_format] % (
-          skidmarkoutputs.OUTPUT_TEMPLATE_SELECTOR_SEPARATORS[self.output_format].join(all_selectors),
-          skidmarkoutputs.OUTPUT_TEMPLATE_PROPERTY_SEPARATORS[self.output_format].join(blk.properties)
-        ))
+        self._log("Merged the properties of '%s' into '%s'" % ( ", ".join(all_selectors), ", ".join(master_selectors) ))
+        continue
+      
+      idx = len(merged)
+      candidates[properties] = idx
+      for family in families:
+        last_set[family] = idx
+      
+      merged.append(( list(all_selectors), blk ))
     
-    return css
+    return merged
   
   def _generate_css_get_blk_selectors(self, node):
     """Helper function for _generate_css().
@@ -434,52 +1345,199 @@ class SkidmarkCSS(object):
       declarations.reverse()
       
       selectors = []
+      count = 1
       for dec in declarations:
         selectors.append([ selector.selector for selector in dec.selectors])
-        
+        count *= len(selectors[-1])
+      
+      if self.max_selectors is not None and count > self.max_selectors:
+        raise SelectorBudgetExceeded("A rule of %s expands to %d selectors, more than %d" % ( self._get_source_name(), count, self.max_selectors ))
+      
       all_selectors = [ " ".join(s) for s in self._simplyfy_selectors(itertools.product(*selectors)) ]
       blocks.append(( all_selectors, blk ))
     
-    return blocks
-  
-  def _simplyfy_selectors(self, selectors):
-    """Runs to the list of selectors and simplifies anything can can be simplified.
-    The simplest example is to transfer the "&" selectors to its parent."""
+    return blocks
+  
+  def _simplyfy_selectors(self, selectors):
+    """Runs to the list of selectors and simplifies anything can can be simplified.
+    The simplest example is to transfer the "&" selectors to its parent."""
+    
+    if not selectors:
+      return selectors
+    
+    groups = []
+    
+    selectors = list(selectors)
+    for selector_group in selectors:
+      selector_list = [ selector_group[0] ]
+      for selector in selector_group[1:]:
+        if selector.startswith("&"):
+          selector_list[-1] = "%s%s" % ( selector_list[-1], selector[1:] )
+        else:
+          selector_list.append(selector)
+      
+      groups.append(selector_list)
+    
+    return groups
+    
+  def _create_outfile(self, css, outfile=None):
+    """Generates the output file (self.s_outfile), streaming the CSS (iterable
+    of strings) to it and/or to stdout, encoded as the source. When an outfile
+    is specified, the CSS is only written to it. The output file is either a
+    filename or an object with a write method (StringIO, file, ...). A named
+    file is written atomically: the CSS goes to a temporary file that replaces
+    the output file once complete, unless their content is identical.
+    Returns the number of bytes generated"""
+    
+    printcss = self.printcss
+    if outfile is None:
+      outfile = self.s_outfile
+    else:
+      printcss = False
+    
+    if outfile or printcss:
+      self._log("Generating %s" % ( outfile or "CSS to stdout", ))
+    
+    sinks = []
+    tmp_file = None
+    
+    if outfile:
+      if hasattr(outfile, "write"):
+        sinks.append(outfile)
+      else:
+        import tempfile
+        
+        fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(outfile)))
+        tmp_file = os.fdopen(fd, "wt", OUTPUT_BUFFER_SIZE)
+        sinks.append(tmp_file)
+    
+    if printcss:
+      sinks.append(sys.stdout)
+    
+    encoder = codecs.getincrementalencoder(SourceReader.get_output_encoding(self.source_encoding))()
+    css_len = 0
+    
+    try:
+      for css_str in itertools.chain(css, [ "\n" ]):
+        css_str = encoder.encode(css_str)
+        css_len += len(css_str)
+        
+        if self.max_output_bytes is not None and css_len > self.max_output_bytes:
+          raise OutputBudgetExceeded("The CSS of %s is larger than %d bytes" % ( self._get_source_name(), self.max_output_bytes ))
+        if self.deadline is not None:
+          self._check_time()
+        
+        for sink in sinks:
+          sink.write(css_str)
+    except:
+      if tmp_file is not None:
+        tmp_file.close()
+        os.remove(tmp_path)
+      raise
+    
+    if tmp_file is not None:
+      tmp_file.close()
+      self._replace_outfile(tmp_path, outfile)
+    
+    return css_len - len(css_str)
+  
+  def _replace_outfile(self, tmp_path, path):
+    """Replaces the file (path) by the temporary file, unless both are identical"""
+    
+    import filecmp
+    
+    if os.path.isfile(path) and filecmp.cmp(tmp_path, path, shallow=False):
+      self._log("%s is unchanged" % ( path, ))
+      os.remove(tmp_path)
+      return
+    
+    os.chmod(tmp_path, os.path.isfile(path) and os.stat(path).st_mode & 07777 or 0644)
+    
+    try:
+      os.rename(tmp_path, path)
+    except OSError:
+      if os.name == "nt" and os.path.isfile(path):
+        # Windows does not allow renaming over an existing file
+        os.remove(path)
+        os.rename(tmp_path, path)
+      else:
+        os.remove(tmp_path)
+        raise
+    
+    return
+  
+  def _process_tree(self, node):
+    """Processes a node at the top of the AST (see _process_node), once the
+    calls of the batch plugins it contains are evaluated"""
+    
+    self._prefetch_plugins(node)
+    
+    try:
+      return self._process_node(node)
+    finally:
+      if self.parent is None:
+        SkidmarkCSS.plugin_cache.clear_prefetched()
+  
+  def _prefetch_plugins(self, node):
+    """Evaluates the calls of the batch plugins (see SkidmarkCSSPlugin.batch)
+    whose arguments are constants, in a pool of plugin_workers threads"""
+    
+    if not self.plugin_workers:
+      return
+    
+    plugins = self.get_plugins()
+    names = set([ name for name, plugin in plugins.iteritems() if plugin.batch ])
+    if not names:
+      return
     
-    if not selectors:
-      return selectors
+    calls = []
+    for plugin_name, arguments in self._find_plugin_calls(node, names):
+      plugin = plugins[plugin_name]
+      args = [ self._process_node(argument) for argument in arguments ]
+      options = dict([ ( option, getattr(self, option) ) for option in plugin.options ])
+      calls.append(( plugin, args, options ))
     
-    groups = []
+    if calls:
+      count = SkidmarkCSS.plugin_cache.prefetch(calls, self.plugin_workers)
+      self._log("Evaluated %d of %d plugin calls ahead of time" % ( count, len(calls) ))
     
-    selectors = list(selectors)
-    for selector_group in selectors:
-      selector_list = [ selector_group[0] ]
-      for selector in selector_group[1:]:
-        if selector.startswith("&"):
-          selector_list[-1] = "%s%s" % ( selector_list[-1], selector[1:] )
-        else:
-          selector_list.append(selector)
-      
-      groups.append(selector_list)
+    return
+  
+  @classmethod
+  def _find_plugin_calls(cls, node, names):
+    """Returns the calls of the plugins (set of names) found in the AST node
+    whose arguments are constants, a list of tuples: ( name, argument nodes )"""
     
-    return groups
+    calls = []
     
-  def _create_outfile(self, css_text):
-    """Generates the output file (self.s_outfile)"""
+    node_name, data = node
+    if node_name == "plugin":
+      if data[0] in names and not [ argument for argument in data[1:] if not cls._is_constant_node(argument) ]:
+        calls.append(( data[0], data[1:] ))
+        return calls
     
-    if self.s_outfile or self.printcss:
-      self._log("Generating %s" % ( self.s_outfile or "CSS to stdout", ))
+    if not isinstance(data, basestring):
+      for item in data:
+        if not isinstance(item, basestring):
+          calls.extend(cls._find_plugin_calls(item, names))
     
-    if self.s_outfile:
-      if isinstance(self.s_outfile, StringIO.StringIO):
-        self.s_outfile.write(css_text + "\n")
-      else:
-        open(self.s_outfile, "wt").write(css_text + "\n")
+    return calls
+  
+  @classmethod
+  def _is_constant_node(cls, node):
+    """Returns False if the AST node reads a variable or calls a plugin"""
     
-    if self.printcss:
-      sys.stdout.write(css_text + "\n")
+    if isinstance(node, basestring):
+      return not node.strip().startswith("$")
     
-    return
+    node_name, data = node
+    if node_name in ( "variable", "plugin" ):
+      return False
+    
+    if isinstance(data, basestring):
+      return not data.strip().startswith("$")
+    
+    return not [ item for item in data if not cls._is_constant_node(item) ]
   
   def _process_node(self, node, parent=None):
     """Process a single node from the AST"""
@@ -488,6 +1546,9 @@ class SkidmarkCSS(object):
     if node_len != 2:
       raise UnrecognizedParsedTree("Nodes should only have 2 elements, not %d: %s" % ( node_len, str(node) ))
     
+    if self.deadline is not None:
+      self._check_time()
+    
     self._update_log_indent(+1)
     fn_name = "".join([ "_nodeprocessor_", node[0] ])
     self._log("@%s -> P = %s" % ( fn_name, parent ))
@@ -521,24 +1582,27 @@ class SkidmarkCSS(object):
     if variable.startswith("$"):
       variable = variable[1:]
     
-    stack = copy.deepcopy(VARIABLE_STACK)
-    
-    while stack:
-      variable_set = stack.pop()
+    for idx in range(len(VARIABLE_STACK) - 1, -1, -1):
+      variable_set = VARIABLE_STACK[idx]
       if variable in variable_set:
-        return variable_set[variable]
+        value = variable_set[variable]
+        self._add_dependency(DEPENDENCY_VARIABLE, variable, value if idx == 0 else NOT_READ)
+        return value
+    
+    self._add_dependency(DEPENDENCY_VARIABLE, variable)
     
     raise VariableNotFound("Variable '$%s' is undefined" % ( variable, ))
   
   @classmethod
   def _get_variables_from_text(cls, text):
     variables = set()
+    re_variable = skidmarklanguage.rec(skidmarklanguage.t_variable)
     
-    mo = SkidmarkCSS.re_variable.search(text)
+    mo = re_variable.search(text)
     while mo:
       variables.add(text[mo.start():mo.end()])
       text = text[mo.end():]
-      mo = SkidmarkCSS.re_variable.search(text)
+      mo = re_variable.search(text)
     
     return list(variables)
   
@@ -564,52 +1628,6 @@ class SkidmarkCSS(object):
     
     return self.math_ops
   
-  @classmethod
-  def _get_number_parts(cls, number):
-    """Retrieve the number and measurement.
-    Example: "12px" -> ( "12", "px" )"""
-    
-    num_cast = { True: float, False: int }
-    
-    mo = SkidmarkCSS.re_number.match(number)
-    if mo and mo.group():
-      value = num_cast["." in mo.group()](mo.group())
-    else:
-      value = 0
-    
-    s = number.split(str(value))
-    if len(s) == 2:
-      return value, s[1].strip()
-    
-    return value, ""
-  
-  def _unite_common_declarations(self):
-    selector_sets = {}
-    tree = self.get_processed_tree()
-
-    for node in tree:
-      if not isinstance(node, n_TextNode):
-        if type(node) is list:
-          blocks = []
-          for _node in node:
-            blocks.extend(self._generate_css_get_blk_selectors(_node))
-        else:
-          blocks = self._generate_css_get_blk_selectors(node)
-        
-        for all_selectors, blk in blocks:
-          selectors = " ".join(all_selectors)
-          s_set = selector_sets.setdefault(selectors, [])
-          s_set.append(blk)
-    
-    for selectors, blocks in selector_sets.iteritems():
-      if len(blocks) > 1:
-        master_block = blocks[0]
-        for blk in blocks[1:]:
-          blk._transfer_data(master_block);
-    
-    return
-  
-  
   #
   # Node Processors: What runs through the AST
   #
@@ -663,6 +1681,8 @@ class SkidmarkCSS(object):
     selector_parts = []
     attribute = ""
     
+    # Work on a copy, the AST of the incremental mode items is processed again
+    data = list(data)
     while data:
       current_element = data.pop(0)
       selector_type, selector_item = current_element
@@ -725,7 +1745,7 @@ class SkidmarkCSS(object):
     self._log("V Creating a new variable set in the stack")
     VARIABLE_STACK.append({})
     
-    oDeclarationBlock = n_DeclarationBlock(parent, self.simplify_output, self.output_format)
+    oDeclarationBlock = n_DeclarationBlock(parent, self.simplify_output, self.output_format, self.vendors)
     
     for node_data in data:
       property = self._process_node(node_data, oDeclarationBlock)
@@ -883,6 +1903,9 @@ class SkidmarkCSS(object):
     
     TEMPLATES[template_name] = n_Template(None, template_name, params, declaration_node)
     
+    if self.compiled_item is not None:
+      self.compiled_item.templates[template_name] = TEMPLATES[template_name]
+    
     # If we are the top-level template, then keep track that we're done!
     if self.current_template_definition == template_name:
       self.current_template_definition = None
@@ -908,6 +1931,7 @@ class SkidmarkCSS(object):
       params = []
       
     template = TEMPLATES.get(template_name)
+    self._add_dependency(DEPENDENCY_TEMPLATE, template_name, template)
     
     # Verify that this template has been defined
     if not template:
@@ -926,7 +1950,15 @@ class SkidmarkCSS(object):
     # Clone the declaration block so that we do not alter the template
     self._update_log_indent(+1)
     self._log("T Preparing the declaration block for template '%s'" % ( template_name, ))
-    dec_block = template.get_declaration_block(self).clone(parent)
+    
+    self.depth += 1
+    try:
+      if self.max_depth is not None and self.depth > self.max_depth:
+        raise DepthBudgetExceeded("The templates used by '%s' go deeper than %d levels" % ( template_name, self.max_depth ))
+      dec_block = template.get_declaration_block(self).clone(parent)
+    finally:
+      self.depth -= 1
+    
     self._update_log_indent(-1)
     
     # Transfer the children to the proper parent
@@ -984,26 +2016,55 @@ class SkidmarkCSS(object):
     for node_data in elements:
       param_value = self._process_node(node_data, None)
       
-      if not isinstance(param_value, basestring):
-        # TODO find a cleaner way to display the type
-        raise Unimplemented("%s is not supported for variable assignments" % ( (str(type(param_value))[1:-1]).capitalize(), ))
-      
-      for quote_char in ('"', "'"):
-        if param_value.startswith(quote_char) and param_value.endswith(quote_char):
-          param_value = param_value.strip(quote_char)
-      
-      if len(VARIABLE_STACK) == 0:
-        # We have not created anything yet, create the first slot (globals)
-        self._log("V Created the globals space and added '%s' = '%s'" % ( param_name, param_value ))
-        VARIABLE_STACK.append({param_name: param_value})
+      if isinstance(param_value, (list, tuple)) and param_value and self._defines_variables(node_data):
+        # A plugin returning several values (~scale): $name_1 ... $name_N
+        for idx, value in enumerate(param_value):
+          self._set_variable("%s_%d" % ( param_name, idx + 1 ), value)
       else:
-        # A stack already exists, add the variable to the latest stack
-        VARIABLE_STACK[-1][param_name] = param_value
-        self._log("V Added '%s' = '%s' to stack #%d" % ( param_name, param_value, len(VARIABLE_STACK) ))
-      
-      self._log("V Current Stack: %s" % ( str(VARIABLE_STACK), ))
+        self._set_variable(param_name, param_value)
     
     return ""
+  
+  def _defines_variables(self, node):
+    """Returns True if the AST node is the call of a plugin whose list result
+    defines one variable per value (see SkidmarkCSSPlugin.defines_variables)"""
+    
+    if node[0] != "plugin":
+      return False
+    
+    plugin = self._get_plugin(node[1][0])
+    
+    return plugin is not None and plugin.defines_variables
+  
+  def _set_variable(self, param_name, param_value):
+    """Helper function for _nodeprocessor_variable_set().
+    Sets the variable in the latest scope of the stack"""
+    
+    if not isinstance(param_value, basestring):
+      # TODO find a cleaner way to display the type
+      raise Unimplemented("%s is not supported for variable assignments" % ( (str(type(param_value))[1:-1]).capitalize(), ))
+    
+    for quote_char in ('"', "'"):
+      if param_value.startswith(quote_char) and param_value.endswith(quote_char):
+        param_value = param_value.strip(quote_char)
+    
+    if len(VARIABLE_STACK) == 0:
+      # We have not created anything yet, create the first slot (globals)
+      self._log("V Created the globals space and added '%s' = '%s'" % ( param_name, param_value ))
+      VARIABLE_STACK.append({param_name: param_value})
+    else:
+      # A stack already exists, add the variable to the latest stack
+      VARIABLE_STACK[-1][param_name] = param_value
+      self._log("V Added '%s' = '%s' to stack #%d" % ( param_name, param_value, len(VARIABLE_STACK) ))
+    
+    if self.compiled_item is not None and len(VARIABLE_STACK) == 1:
+      self.compiled_item.variables[param_name] = param_value
+    
+    if self.verbose:
+      # The whole stack is formatted, only when it is logged
+      self._log("V Current Stack: %s" % ( str(VARIABLE_STACK), ))
+    
+    return
     
   def _nodeprocessor_variable(self, data, parent):
     """Return the value of this variable"""
@@ -1032,23 +2093,42 @@ class SkidmarkCSS(object):
     """A math expression parser -- does its best!"""
 
     sequence = self._nodeprocessor_math_operation_helper(data)
-    return self._get_math_ops().reduce_group(sequence)
+    return self._get_math_ops().compute(sequence).format(self.math_precision)
   
   def _nodeprocessor_math_group(self, data, parent):
-    """Processes a math group (math expressions found within parentheses)"""
+    """Processes a math group (math expressions found within parentheses).
+    The result is only converted to a string here, see math_precision"""
+    
+    return self._get_math_group_value(data).format(self.math_precision)
+  
+  def _get_math_group_value(self, data):
+    """Returns the value (Dimension) of a math group. A group made of constants
+    only is computed a single time (see MathOperations.get_constant)"""
     
-    math_seq = self._nodeprocessor_math_operation_helper(data)
-    return self._get_math_ops().reduce_group(math_seq)
+    key = MathOperations.get_constant_key(data)
+    if key is None:
+      return self._get_math_ops().compute(self._nodeprocessor_math_operation_helper(data))
+    
+    value = MathOperations.get_constant(key)
+    if value is None:
+      value = self._get_math_ops().compute(self._nodeprocessor_math_operation_helper(data))
+      MathOperations.add_constant(key, value)
+    
+    return value
   
   def _nodeprocessor_math_operation_helper(self, data):
-    """Helper Function: Returns a normalized sequence of operations (Python list)"""
+    """Helper Function: Returns a normalized sequence of operations (Python
+    list), the operands being Dimension values. The inner groups are computed
+    without going through a string"""
     
     seq = []
     for item in data:
       if isinstance(item, basestring):
-        seq.append(item)
+        seq.append(item.strip())
+      elif item[0] == "math_group":
+        seq.append(self._get_math_group_value(item[1]))
       else:
-        seq.append(self._process_node(item))
+        seq.append(Dimension.parse(self._process_node(item)))
     
     return seq
   
@@ -1058,12 +2138,33 @@ class SkidmarkCSS(object):
     plugin_name = data[0]
     arguments = data[1:]
     
-    if plugin_name not in SkidmarkCSS.plugins:
+    plugin = self._get_plugin(plugin_name)
+    if plugin is None:
       raise Unimplemented("No suitable plugins found for '%s'" % ( plugin_name, ))
     
     args = [ self._process_node(node) for node in arguments ]
+    options = dict([ ( option, getattr(self, option) ) for option in plugin.options ])
+    
+    result = SkidmarkCSS.plugin_cache.call(plugin, args, options)
+    self._add_custom_properties(result)
+    
+    return result
+  
+  def _add_custom_properties(self, result):
+    """Records the definitions of the shared values (see SharedValue) found in
+    a plugin result (string or list), output once in the :root rule"""
+    
+    if not isinstance(result, (list, tuple)):
+      result = [ result ]
+    
+    for value in result:
+      if isinstance(value, SharedValue):
+        name, definition = value.definition
+        self.custom_properties[name] = definition
+        if self.compiled_item is not None:
+          self.compiled_item.custom_properties[name] = definition
     
-    return SkidmarkCSS.plugins.get(plugin_name).eval(*args)
+    return
   
   def _nodeprocessor_propertyvalue_pluginextended(self, data, parent):
     """The concatenated rendered data is the property string"""
@@ -1101,11 +2202,18 @@ class SkidmarkCSS(object):
         filename = filename[1:-1]
       elif filename.startswith("'") and filename.endswith("'"):
         filename = filename[1:-1]
-        
-      # Include the file by instantiating a new object to process it
-      sm = SkidmarkCSS(self.get_config_dict(printcss=False), filename, parent=self)
       
-      tree = sm.get_processed_tree()
+      if self._is_prelude_file(filename):
+        # Its definitions were restored from the snapshot
+        self._log("'%s' is part of the prelude snapshot" % ( filename, ))
+        tree = self.prelude.get_data()
+      else:
+        # Include the file by instantiating a new object to process it
+        sm = SkidmarkCSS(self.get_config_dict(printcss=False, streaming=False, incremental=False), filename, parent=self)
+        self.source_files.update(sm.source_files)
+        self.custom_properties.update(sm.custom_properties)
+        
+        tree = sm.get_processed_tree()
       
       if tree:
         for branch in tree:
@@ -1115,6 +2223,17 @@ class SkidmarkCSS(object):
         return tree
     return []
   
+  def _is_prelude_file(self, filename):
+    """Returns True if the included file is part of the prelude snapshot"""
+    
+    if self.prelude is None:
+      return False
+    
+    if isinstance(self.s_infile, basestring):
+      filename = os.path.join(os.path.dirname(self.s_infile), filename)
+    
+    return self.prelude.includes(filename)
+  
   @classmethod
   def add_plugin(cls, plugin_class):
     """Use this method to add your own plugins. Give it your plugin class,
@@ -1126,6 +2245,80 @@ class SkidmarkCSS(object):
       raise Unimplemented("Plugins must be a SkidmarkCSSPlugin object")
     
     cls.plugins[plugin.name] = plugin
+  
+  @classmethod
+  def load_plugins(cls):
+    """Registers the built-in plugins, once: their objects are created with the
+    first SkidmarkCSS object. The plugins added before keep their name"""
+    
+    if not cls.plugins_loaded:
+      cls.plugins_loaded = True
+      
+      plugins = dict(cls.plugins)
+      for plugin_class in BUILTIN_PLUGINS:
+        cls.add_plugin(plugin_class)
+      cls.plugins.update(plugins)
+    
+    return
+  
+  @classmethod
+  def get_plugin(cls, name):
+    """Returns the plugin registered under the name. A plugin that is not
+    registered is looked up in the entry points of the installed packages (see
+    PLUGIN_ENTRY_POINT_GROUP), and registered. Returns None if it isn't found"""
+    
+    plugin = cls.plugins.get(name)
+    
+    if plugin is None:
+      for plugin_class in cls._load_entry_points(name):
+        cls.add_plugin(plugin_class)
+      plugin = cls.plugins.get(name)
+    
+    return plugin
+  
+  def get_plugins(self):
+    """Returns the plugins available to this compilation (dict: name ->
+    plugin), its own plugins replacing the registered ones"""
+    
+    plugins = dict(SkidmarkCSS.plugins)
+    plugins.update(self.local_plugins)
+    
+    return plugins
+  
+  def _get_plugin(self, name):
+    """Returns the plugin named name used by this compilation: one of its own
+    plugins (plugins=, prelude snapshot) or a registered one (see get_plugin)"""
+    
+    plugin = self.local_plugins.get(name)
+    if plugin is None:
+      plugin = SkidmarkCSS.get_plugin(name)
+    
+    return plugin
+  
+  def _add_local_plugin(self, plugin_class):
+    """Adds a plugin to this compilation (and its includes) only, it replaces
+    the registered plugin of the same name without changing the registry"""
+    
+    plugin = plugin_class()
+    
+    if not isinstance(plugin, SkidmarkCSSPlugin):
+      raise Unimplemented("Plugins must be a SkidmarkCSSPlugin object")
+    
+    self.local_plugins[plugin.name] = plugin
+    
+    return
+  
+  @classmethod
+  def _load_entry_points(cls, name):
+    """Returns the plugin classes of the entry points named after a plugin.
+    pkg_resources takes a while to import, it is only imported here"""
+    
+    try:
+      import pkg_resources
+    except ImportError:
+      return []
+    
+    return [ entry_point.load() for entry_point in pkg_resources.iter_entry_points(PLUGIN_ENTRY_POINT_GROUP, name) ]
 
 
 class MathOperations(object):
@@ -1137,6 +2330,10 @@ class MathOperations(object):
     "-": lambda a, b: a - b,
     "*": lambda a, b: a * b,
   }
+  
+  # Values of the math groups made of constants (see get_constant_key)
+  CONSTANTS = {}
+  CONSTANTS_SIZE = 10000
 
   def __init__(self, parent):
     """Initialize the object, setting the SkidmarkCSS object as a parent"""
@@ -1149,126 +2346,406 @@ class MathOperations(object):
     # Define the division operator (ignore floating point if it has no significance)
     def division(a, b):
       r = (a * 1.0) / b
-      if divmod(r, int(r))[1] == 0:
+      if r == int(r):
         return int(r)
       return r
     
     MathOperations.ops["/"] = division
   
   @classmethod
-  def reduce_group(cls, data):
-    """Reduces the groups by computing the elements it is able to handle at the
-    current moment. Recurses in order to process all it can.
-    Returns the computed value from the data provided."""
+  def compute(cls, seq):
+    """Processes the sequence, Dimension values separated by operators,
+    applying the multiplications and divisions first.
+    Returns the computed value (Dimension), including the measurement from
+    the data (if applicable)"""
     
-    seq = []
+    # Apply * and /, keeping the terms of the additions and subtractions
+    terms = [ seq[0] ]
+    for idx in range(1, len(seq), 2):
+      op = seq[idx].strip()
+      if op in ( "*", "/" ):
+        terms[-1] = cls.apply(op, terms[-1], seq[idx + 1])
+      else:
+        terms.extend([ op, seq[idx + 1] ])
+    
+    value = terms[0]
+    for idx in range(1, len(terms), 2):
+      value = cls.apply(terms[idx], value, terms[idx + 1])
+    
+    return value
+  
+  @classmethod
+  def apply(cls, op, L, R):
+    """Applies the operator to two Dimension values. Returns a Dimension"""
+    
+    if not (L.unit == R.unit or not L.unit or not R.unit):
+      raise Unimplemented("It is not possible to compute '%s %s %s'" % ( L.unit, op, R.unit ))
+    
+    if not op in cls.ops:
+      raise Unimplemented("Math expression %s is not implemented" % ( op, ))
+    
+    return Dimension(cls.ops.get(op)(L.value, R.value), L.unit or R.unit)
+  
+  @classmethod
+  def get_constant_key(cls, data):
+    """Returns the key identifying a math group made of constants only (tuple
+    of its tokens), or None if it reads a variable"""
+    
+    key = []
     for item in data:
-      if type(item) is list:
-        seq.append(cls.reduce_group(item))
+      if isinstance(item, basestring):
+        key.append(item.strip())
+      elif item[0] == "mathconstant":
+        key.append(item[1])
+      elif item[0] == "math_group":
+        group_key = cls.get_constant_key(item[1])
+        if group_key is None:
+          return None
+        key.append(group_key)
       else:
-        seq.append(item)
-    return cls.compute(seq)
+        return None
+    
+    return tuple(key)
   
   @classmethod
-  def compute(cls, seq):
-    """Processes the sequence, applying the math operations.
-    Returns a final computed data (string), including the measurement from
-    the data (if applicable)"""
+  def get_constant(cls, key):
+    """Returns the value (Dimension) of a constant math group that was already
+    computed, or None"""
     
-    loop_start = 1
-    if "*" in seq or "/" in seq:
-      loop_start = 2
+    return cls.CONSTANTS.get(key)
   
-    # Initialize the new sequence (for once we've processed * and /)
-    n_seq = []
+  @classmethod
+  def add_constant(cls, key, value):
+    """Keeps the value (Dimension) of a constant math group"""
     
-    for loop in map(lambda x: x - 1, range(loop_start, 0, -1)):
-      # loop=1 = process *, /
-      # loop=0 = process +, -
-      
-      L = seq.pop(0)
-      while seq:
-        op = seq.pop(0)
-        R = seq.pop(0)
-        
-        Li, Lmeasure = SkidmarkCSS._get_number_parts(L)
-        Ri, Rmeasure = SkidmarkCSS._get_number_parts(R)
-
-        if not (Lmeasure == Rmeasure or not Lmeasure or not Rmeasure):
-          raise Unimplemented("It is not possible to compute '%s %s %s'" % ( Lmeasure.strip(), op.strip(), Rmeasure.strip() ))
-        
-        if not op in cls.ops:
-          raise Unimplemented("Math expression %s is not implemented" % ( op, ))
-        
-        if loop == 1:
-          if op in ("*", "/"):
-            L = str(cls.ops.get(op)(Li, Ri)) + (Lmeasure or Rmeasure)
-            if not seq:
-              n_seq.append(L)
-          else:
-            n_seq.extend([L, op])
-            if not seq:
-              n_seq.append(R)
-            else:
-              L = R
-        else:
-          L = str(cls.ops.get(op)(Li, Ri)) + (Lmeasure or Rmeasure)
-        
-      if loop == 1:
-        seq = n_seq
+    if len(cls.CONSTANTS) >= cls.CONSTANTS_SIZE:
+      cls.CONSTANTS.clear()
+    cls.CONSTANTS[key] = value
     
-    return L
+    return
 
 
 # ----------------------------------------------------------------------------
 
+class BudgetParser(pyPEG.parser):
+  """A pyPEG parser checking the time budget of a compilation (see
+  SkidmarkCSS._check_time) every PARSER_TIME_CHECK patterns it tries. pyPEG
+  swallows the exceptions raised within a negative lookahead, the budget error
+  is raised again by the next check"""
+  
+  def __init__(self, sm):
+    pyPEG.parser.__init__(self)
+    self.sm = sm
+    self.patterns = 0
+  
+  def parseLine(self, textline, pattern, resultSoFar=[], skipWS=True, skipComments=None):
+    self.patterns += 1
+    if not self.patterns % PARSER_TIME_CHECK:
+      self.sm._check_time()
+    
+    return pyPEG.parser.parseLine(self, textline, pattern, resultSoFar, skipWS, skipComments)
+
+def reset_global_state(prelude=None):
+  """Empties the global scope (variables, templates) before a compilation that
+  must not see the state left by the others, unless it starts from a prelude
+  snapshot, which replaces it. The caller holds COMPILE_LOCK"""
+  
+  if prelude is None:
+    VARIABLE_STACK[:] = []
+    TEMPLATES.clear()
+  
+  return
+
+class OutputBuffer(object):
+  """Collects the CSS written by SkidmarkCSS, joined once by getvalue()"""
+  
+  def __init__(self):
+    self.parts = []
+    self.write = self.parts.append
+  
+  def getvalue(self):
+    return "".join(self.parts)
+
+def compile_bytes(src, **kw):
+  """Compiles the SkidmarkCSS source (string) and returns the CSS (string),
+  raising the exception of a failed compilation. When SkidmarkCSS.compile_cache
+  is set (see CompileCache), the CSS of an identical source compiled with the
+  same config is reused, and the source is compiled from an empty global scope
+  (or the prelude's): the variables and templates left by the compilations
+  before are not seen"""
+  
+  config = dict([ (k, v) for k, v in kw.iteritems() if k not in ["infile", "outfile"] ])
+  
+  cache = SkidmarkCSS.compile_cache
+  if config.get("printcss"):
+    cache = None
+  
+  key = None
+  if cache is not None:
+    key = cache.get_key(src, config)
+    css = key is not None and cache.get(key) or None
+    if css is not None:
+      return css
+  
+  outfile = OutputBuffer()
+  COMPILE_LOCK.acquire()
+  try:
+    if cache is not None:
+      reset_global_state(config.get("prelude"))
+    
+    SkidmarkCSS(config, StringIO.StringIO(src), outfile)
+  finally:
+    COMPILE_LOCK.release()
+  css = outfile.getvalue()
+  
+  if key is not None:
+    cache.set(key, css)
+  
+  return css
+
 def processFromString(src_str, **kw):
   """Parse the SkidmarkCSS supplied as a string and returns the CSS as a string"""
   
-  infile = StringIO.StringIO(src_str)
-  outfile = StringIO.StringIO()
-  params = dict([ (k, v) for k, v in kw.iteritems() if k not in ["infile", "outfile"] ])
-  err = execute_sm(params, infile=infile, outfile=outfile)
+  try:
+    return ( compile_bytes(src_str, **kw), "" )
+  except REPORTED_ERRORS, e:
+    return ( "", get_error_report(e) )
+
+def get_target_report(src_str, targets=None, **kw):
+  """Compiles the SkidmarkCSS string once for every browser target (all the
+  BROWSER_TARGETS by default) and returns a list of tuples: ( target, bytes,
+  bytes saved compared to targeting all the browsers ). Raises the exception
+  of a failed compilation"""
+  
+  if targets is None:
+    targets = sorted(BROWSER_TARGETS)
+  
+  params = dict([ (k, v) for k, v in kw.iteritems() if k != "browser_targets" ])
+  
+  css = compile_bytes(src_str, **params)
+  
+  report = []
+  for target in targets:
+    target_css = compile_bytes(src_str, browser_targets=target, **params)
+    report.append(( target, len(target_css), len(css) - len(target_css) ))
   
-  return ( outfile.getvalue(), err )
+  return report
+
+def create_prelude_snapshot(filename, plugins=None, **kw):
+  """Compiles the prelude, the file included by every source (variables,
+  templates...), and returns its PreludeSnapshot. The config parameters (kw)
+  become the defaults of the compilations started from the snapshot"""
+  
+  config = dict([ (k, v) for k, v in kw.iteritems() if k not in ["printcss", "prelude"] ])
+  
+  COMPILE_LOCK.acquire()
+  try:
+    reset_global_state()
+    
+    sm = SkidmarkCSS(dict(config, printcss=False, streaming=False, incremental=False), filename, plugins=plugins)
+    
+    return PreludeSnapshot(VARIABLE_STACK, TEMPLATES, sm.get_plugins(), config, sm.get_processed_tree(), sm.source_files)
+  finally:
+    COMPILE_LOCK.release()
 
 def execute_sm(config, **kw):
   infile = kw.get('infile')
   outfile = kw.get('outfile')
   
-  err = []
+  COMPILE_LOCK.acquire()
+  try:
+    if SkidmarkCSS.compile_cache is not None and hasattr(infile, "read") and hasattr(outfile, "write"):
+      outfile.write(compile_bytes(infile.read(), **config))
+    else:
+      sm = SkidmarkCSS(config, infile, outfile)
+  except REPORTED_ERRORS, e:
+    return get_error_report(e)
+  finally:
+    COMPILE_LOCK.release()
+  
+  return ""
+
+def get_error_report(e):
+  """Returns the report of a compilation error, as written by execute_sm"""
+  
+  separator = "-=" * (72/2)
+  
+  return "\n".join([ separator, "%s: %s" % ( e.__class__.__name__, str(e) ), separator ])
+
+def get_error_message(e):
+  """Returns the message of an exception (unicode), its repr() when it can't be
+  decoded"""
   
   try:
-    sm = SkidmarkCSS(config, infile, outfile)
-  except:
-    err.append("-=" * (72/2))
+    return unicode(e)
+  except Exception:
+    return unicode(repr(e))
+
+class SkidmarkWorker(object):
+  """The worker mode: compiles the requests read as JSON lines from instream,
+  and writes a JSON line with the result of each to outstream, in order.
+  A request is an object with these keys:
+    id: returned as is with the result (optional)
+    infile: the path of the source, or source: the source itself
+    outfile: the path of the output, the CSS is returned when omitted
+    config: the config parameters (see SkidmarkCSS._set_defaults)
+  A result has the keys: id, ok, css or outfile, error ({ type, message }) and
+  timings (milliseconds: total, ast). The parsed sources (ast_cache, used as
+  SkidmarkCSS.ast_cache while a request is compiled), the plugins, their
+  memoized results and the prelude snapshots are kept between the requests.
+  The worker stops at the end of instream, after max_requests requests, or
+  when no request comes for idle_timeout seconds"""
+  
+  def __init__(self, instream, outstream, config=None, max_requests=None, idle_timeout=None):
+    self.instream = instream
+    self.outstream = outstream
+    self.config = dict(config or {})
+    self.max_requests = max_requests
+    self.idle_timeout = idle_timeout
+    self.requests = 0
+    self.preludes = {}
+    self.buffer = ""
+    
+    # The entries are ( AST, length of the source )
+    self.ast_cache = LRUCache(AST_CACHE_SIZE, max_bytes=AST_CACHE_BYTES, sizeof=lambda entry: entry[1])
+  
+  def run(self):
+    """Processes the requests until the worker stops. Returns the number of
+    requests processed"""
+    
+    import json
+    
+    while self.max_requests is None or self.requests < self.max_requests:
+      line = self._read_line()
+      if line is None:
+        break
+      
+      if not line.strip():
+        continue
+      
+      self.requests += 1
+      
+      request_id = None
+      try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+          raise ValueError("A request must be a JSON object")
+        request_id = request.get("id")
+        
+        result = json.dumps(self.process_request(request))
+      except Exception, e:
+        # No request may stop the worker, the next ones are answered
+        result = json.dumps(dict(id=request_id, ok=False, error=self._get_error(e)))
+      
+      self.outstream.write(result + "\n")
+      self.outstream.flush()
+    
+    return self.requests
+  
+  def process_request(self, request):
+    """Compiles a request (dict), returns its result (dict)"""
+    
+    start_time = time.time()
+    result = dict(id=request.get("id"), ok=True)
+    
+    # Whatever the compiler prints (verbose...) must not mix with the results
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    
+    COMPILE_LOCK.acquire()
+    ast_cache = SkidmarkCSS.ast_cache
+    SkidmarkCSS.ast_cache = self.ast_cache
+    
     try:
-      raise
-    except Unimplemented, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except UnrecognizedParsedTree, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except UnexpectedTreeFormat, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except ErrorInFile, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except UnrecognizedSelector, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except FileNotFound, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except UndefinedTemplate, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except InvalidTemplateUse, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
-    except VariableNotFound, e:
-      err.append("%s: %s" % ( e.__class__.__name__, str(e) ))
+      config = self._get_config(request.get("config") or {})
+      
+      if "source" in request:
+        infile = StringIO.StringIO(request["source"].encode("utf-8"))
+      elif request.get("infile"):
+        infile = request["infile"]
+      else:
+        raise InvalidArgumentException("A request requires an infile or a source")
+      
+      outfile = request.get("outfile") or StringIO.StringIO()
+      
+      reset_global_state(config.get("prelude"))
+      
+      sm = SkidmarkCSS(config, infile, outfile)
+      
+      if isinstance(outfile, basestring):
+        result["outfile"] = outfile
+      else:
+        result["css"] = outfile.getvalue().decode(SourceReader.get_output_encoding(sm.source_encoding))
+      
+      result["timings"] = dict(ast=round(sm.ast_time * 1000.0, 3))
     except Exception, e:
-      raise
+      result["ok"] = False
+      result["error"] = self._get_error(e)
+      result["timings"] = dict()
     finally:
-      err.append("-=" * (72/2))
+      sys.stdout = stdout
+      SkidmarkCSS.ast_cache = ast_cache
+      COMPILE_LOCK.release()
+    
+    result["timings"]["total"] = round((time.time() - start_time) * 1000.0, 3)
+    
+    return result
+  
+  @classmethod
+  def _get_error(cls, e):
+    """Returns the error of a result (dict: type, message) for an exception"""
+    
+    return dict(type=e.__class__.__name__, message=get_error_message(e))
   
-  err = "\n".join(err)
-  return err
+  def _get_config(self, request_config):
+    """Returns the config of a request: the config of the worker updated with
+    the request's. A prelude (path) is compiled or loaded once, and again when
+    one of its files is modified"""
+    
+    config = dict(self.config)
+    config.update(request_config)
+    config["printcss"] = False
+    
+    prelude = config.get("prelude")
+    if isinstance(prelude, basestring):
+      snapshot = self.preludes.get(prelude)
+      
+      if snapshot is None or not snapshot.is_current():
+        if prelude.endswith(PRELUDE_SNAPSHOT_EXTENSION):
+          snapshot = PreludeSnapshot.load(prelude)
+        else:
+          snapshot = create_prelude_snapshot(prelude, **dict([ (k, v) for k, v in config.iteritems() if k != "prelude" ]))
+        self.preludes[prelude] = snapshot
+      
+      config["prelude"] = snapshot
+    
+    return config
+  
+  def _read_line(self):
+    """Returns the next line of instream, or None at its end or once the idle
+    timeout is reached. The idle timeout requires a stream with a file
+    descriptor (select), it is read without buffering beyond the lines"""
+    
+    if self.idle_timeout is None or not hasattr(self.instream, "fileno"):
+      return self.instream.readline() or None
+    
+    import select
+    
+    while "\n" not in self.buffer:
+      readable, writable, errors = select.select([ self.instream ], [], [], self.idle_timeout)
+      if not readable:
+        return None
+      
+      data = os.read(self.instream.fileno(), WORKER_READ_SIZE)
+      if not data:
+        line, self.buffer = self.buffer, ""
+        return line or None
+      
+      self.buffer += data
+    
+    line, self.buffer = self.buffer.split("\n", 1)
+    
+    return line
 
 def get_arguments():
   import argparse
@@ -1291,6 +2768,31 @@ def get_arguments():
   arg_parser.add_argument("--singleline", dest="format", help="Outputs the CSS in 'single line' format (ultra compressed)", action="store_const", const=skidmarkoutputs.CSS_OUTPUT_SINGLELINE)
   arg_parser.add_argument("-ns", "--nosimplify", dest="simplify_output", help="Do not simplify the output by using shorthand notions where possible", action="store_false")
   arg_parser.add_argument("-us", "--unifyselectors", dest="unify_selectors", help="Combine repeating selectors to reduce output size", action="store_true")
+  arg_parser.add_argument("-md", "--mergedeclarations", dest="merge_declarations", help="Combine the selectors of rules that have identical properties", action="store_true")
+  arg_parser.add_argument("-dd", "--deaddeclarations", dest="eliminate_dead_declarations", help="Remove the declarations that are always overridden by a later rule", action="store_true")
+  arg_parser.add_argument("-mv", "--minifyvalues", dest="minify_values", help="Shorten the property values (colors, numbers, keywords) in the compressed formats", action="store_true")
+  arg_parser.add_argument("-mm", "--mergemediaqueries", dest="merge_mediaqueries", help="Combine the media queries that have the same condition", action="store_true")
+  arg_parser.add_argument("-st", "--streaming", dest="streaming", help="Process and output the rules one at a time, using less memory (incompatible with -us, -md, -dd and -mm)", action="store_true")
+  arg_parser.add_argument("--themes", dest="themes", help="Write one CSS file per theme of the JSON file ({ theme: { variable: value } }), the input being parsed once. The theme name replaces '%%s' in the output filename", metavar="themes.json")
+  arg_parser.add_argument("-w", "--watch", dest="watch", help="Compile the input file again, incrementally, whenever it changes", action="store_true")
+  arg_parser.add_argument("--encoding", dest="encoding", help="The encoding of the source files, when they have no byte order mark (default: their @charset rule or utf-8)", metavar="encoding")
+  arg_parser.add_argument("--targets", dest="browser_targets", help="Only generate the vendor prefixes required by these browsers (comma separated: %s)" % ( ", ".join(sorted(BROWSER_TARGETS)), ), metavar="browsers")
+  arg_parser.add_argument("--mathprecision", dest="math_precision", help="Round the results of the math expressions to this number of decimals", type=int, metavar="decimals")
+  arg_parser.add_argument("--plugincache", dest="plugin_cache", help="Load the memoized results of the pure plugins from this file, and save them to it once done", metavar="cachefile")
+  arg_parser.add_argument("--pluginworkers", dest="plugin_workers", help="Number of threads evaluating the calls of the batch plugins (default: %d, 0 to disable)" % ( PLUGIN_WORKERS, ), type=int, default=PLUGIN_WORKERS, metavar="threads")
+  arg_parser.add_argument("--gradients", dest="gradient_mode", help="Output the gradients inline, or once as custom properties of the :root rule (%s, default: %s)" % ( ", ".join(GRADIENT_MODES), GRADIENT_MODE_INLINE ), choices=GRADIENT_MODES, default=GRADIENT_MODE_INLINE)
+  arg_parser.add_argument("--pluginstats", dest="plugin_stats", help="Display the number of calls and cache hits of each plugin", action="store_true")
+  arg_parser.add_argument("--prelude", dest="prelude", help="Start from the state of the prelude, a file included by the sources whose @include is then skipped (a SkidmarkCSS file, or a snapshot saved with --saveprelude)", metavar="prelude")
+  arg_parser.add_argument("--saveprelude", dest="save_prelude", help="Compile the input file as a prelude and save its snapshot (%s) to this file" % ( PRELUDE_SNAPSHOT_EXTENSION, ), metavar="snapshot")
+  arg_parser.add_argument("--worker", dest="worker", help="Compile the requests read as JSON lines from stdin, writing the results to stdout as JSON lines (the other options are the defaults of the requests)", action="store_true")
+  arg_parser.add_argument("--maxrequests", dest="max_requests", help="Worker mode: stop after this number of requests", type=int, metavar="requests")
+  arg_parser.add_argument("--idletimeout", dest="idle_timeout", help="Worker mode: stop when no request comes for this number of seconds", type=float, metavar="seconds")
+  arg_parser.add_argument("--maxselectors", dest="max_selectors", help="Reject the rules expanding to more selectors (default: %d)" % ( MAX_SELECTORS, ), type=int, default=MAX_SELECTORS, metavar="selectors")
+  arg_parser.add_argument("--maxdepth", dest="max_depth", help="Reject the templates or included files going deeper (default: %d)" % ( MAX_DEPTH, ), type=int, default=MAX_DEPTH, metavar="levels")
+  arg_parser.add_argument("--maxnesting", dest="max_nesting", help="Reject the sources whose blocks are nested deeper (default: %d)" % ( MAX_NESTING, ), type=int, default=MAX_NESTING, metavar="levels")
+  arg_parser.add_argument("--maxoutput", dest="max_output_bytes", help="Reject the sources generating more CSS", type=int, metavar="bytes")
+  arg_parser.add_argument("--maxtime", dest="max_time", help="Reject the sources taking longer to compile", type=float, metavar="seconds")
+  arg_parser.add_argument("--targetreport", dest="target_report", help="Display the size of the CSS generated for each browser target", action="store_true")
   
   return arg_parser.parse_args()
 
@@ -1308,7 +2810,7 @@ if __name__ == '__main__':
   if not args.printcss and not outfile:
     args.printcss = True
 
-  if not infile:
+  if not infile and not args.worker:
     raise Exception("An input file is required, use -h for help")
   
   config = dict(
@@ -1318,9 +2820,94 @@ if __name__ == '__main__':
     output_format=output_format,
     show_hierarchy=args.hierarchy,
     simplify_output=args.simplify_output,
-    unify_selectors=args.unify_selectors
+    unify_selectors=args.unify_selectors,
+    merge_declarations=args.merge_declarations,
+    eliminate_dead_declarations=args.eliminate_dead_declarations,
+    minify_values=args.minify_values,
+    merge_mediaqueries=args.merge_mediaqueries,
+    browser_targets=args.browser_targets,
+    streaming=args.streaming,
+    incremental=args.watch or bool(args.themes),
+    encoding=args.encoding,
+    math_precision=args.math_precision,
+    plugin_workers=args.plugin_workers,
+    gradient_mode=args.gradient_mode,
+    max_selectors=args.max_selectors,
+    max_depth=args.max_depth,
+    max_nesting=args.max_nesting,
+    max_output_bytes=args.max_output_bytes,
+    max_time=args.max_time
   )
   
+  if args.worker:
+    config["printcss"] = False
+    if args.prelude:
+      config["prelude"] = args.prelude
+    
+    SkidmarkWorker(sys.stdin, sys.stdout, config, args.max_requests, args.idle_timeout).run()
+    sys.exit(0)
+  
+  if args.save_prelude:
+    create_prelude_snapshot(infile, **config).save(args.save_prelude)
+    sys.exit(0)
+  
+  if args.prelude:
+    if args.prelude.endswith(PRELUDE_SNAPSHOT_EXTENSION):
+      config["prelude"] = PreludeSnapshot.load(args.prelude)
+    else:
+      config["prelude"] = create_prelude_snapshot(args.prelude, **config)
+  
+  if args.target_report:
+    targets = args.browser_targets and args.browser_targets.split(",") or None
+    params = dict([ (k, v) for k, v in config.iteritems() if k not in ["printcss", "browser_targets"] ])
+    
+    try:
+      report = get_target_report(open(infile).read(), targets, **params)
+    except REPORTED_ERRORS + ( IOError, InvalidArgumentException ), e:
+      print get_error_report(e)
+      sys.exit(1)
+    
+    for target, size, saved in report:
+      print "%-12s %8d bytes %8d bytes saved" % ( target, size, saved )
+    sys.exit(0)
+  
+  if args.themes:
+    import json
+    
+    config["printcss"] = False
+    sm = SkidmarkCSS(config, infile)
+    
+    outfile_pattern = outfile or "%s.css" % ( os.path.splitext(infile)[0], )
+    if "%s" not in outfile_pattern:
+      outfile_pattern = "%s-%%s%s" % os.path.splitext(outfile_pattern)
+    
+    for themefile in sm.render_themes(json.load(open(args.themes)), outfile_pattern):
+      print themefile
+    sys.exit(0)
+  
+  if args.watch:
+    sm = SkidmarkCSS(config, infile, outfile)
+    mtime = os.stat(infile).st_mtime
+    
+    while True:
+      time.sleep(WATCH_INTERVAL)
+      if os.stat(infile).st_mtime != mtime:
+        mtime = os.stat(infile).st_mtime
+        try:
+          sm.update(open(infile, "rb").read())
+        except ErrorInFile, e:
+          print "%s: %s" % ( e.__class__.__name__, str(e) )
+  
+  if args.plugin_cache and os.path.exists(args.plugin_cache):
+    SkidmarkCSS.plugin_cache.load(args.plugin_cache)
+  
   err = execute_sm(config, infile=infile, outfile=outfile)
   if err:
     print err
+  
+  if args.plugin_cache:
+    SkidmarkCSS.plugin_cache.save(args.plugin_cache)
+  
+  if args.plugin_stats:
+    for name, calls, hits, hit_rate in SkidmarkCSS.plugin_cache.get_report():
+      print "%-16s %8d calls %8d hits %5.1f%%" % ( name, calls, hits, hit_rate )
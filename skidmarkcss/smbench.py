@@ -0,0 +1,101 @@
+# -*- coding: latin-1 -*-
+
+"""Benchmarks of the palette plugins: a scale of tints and shades for many
+base colors, generated with ~scale() and with one ~lighten()/~darken() call per
+step, and the color kernel with and without NumPy"""
+
+import argparse
+import StringIO
+import time
+
+import skidmark
+from core.colorkernel import ColorKernel
+from core.htmlcolors import HTMLColors
+from core.plugincache import PluginCache
+
+def get_base_colors(count):
+  """Returns count distinct colors (#rrggbb)"""
+  
+  return [ "#%06x" % ( (idx * 0x3f5a7) % 0xffffff, ) for idx in range(count) ]
+
+def get_scale_source(colors, steps):
+  """The source defining the scales with ~scale()"""
+  
+  src = []
+  for idx, color in enumerate(colors):
+    src.append("$c%d = ~scale(%s, %d);" % ( idx, color, steps ))
+    src.append(".c%d { %s }" % ( idx, " ".join([ "--s%d: $c%d_%d;" % ( step, idx, step ) for step in range(1, steps + 1) ]) ))
+  
+  return "\n".join(src)
+
+def get_percall_source(colors, steps):
+  """The source defining the same variables with one ~lighten() or ~darken()
+  call per step"""
+  
+  src = []
+  half = steps // 2
+  for idx, color in enumerate(colors):
+    for step in range(1, steps + 1):
+      percent = abs(half - step + 1) * 100 // (half + 1)
+      src.append("$c%d_%d = ~%s(%s, %d%%);" % ( idx, step, step <= half and "lighten" or "darken", color, percent ))
+    src.append(".c%d { %s }" % ( idx, " ".join([ "--s%d: $c%d_%d;" % ( step, idx, step ) for step in range(1, steps + 1) ]) ))
+  
+  return "\n".join(src)
+
+def time_compile(src, repeat):
+  """Returns the best time (seconds) of compiling the source, without memoized
+  plugin results"""
+  
+  best = None
+  for cnt in range(repeat):
+    skidmark.SkidmarkCSS.plugin_cache = PluginCache()
+    HTMLColors.init_tables()
+    
+    start = time.time()
+    skidmark.SkidmarkCSS(dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED), StringIO.StringIO(src), StringIO.StringIO())
+    elapsed = time.time() - start
+    
+    best = best is None and elapsed or min(best, elapsed)
+  
+  return best
+
+def time_kernel(colors, steps, repeat):
+  """Returns the best time (seconds) of ColorKernel.scale() for the colors"""
+  
+  scales = [ ( HTMLColors.parse(color), steps ) for color in colors ]
+  
+  best = None
+  for cnt in range(repeat):
+    start = time.time()
+    ColorKernel.scale(scales)
+    elapsed = time.time() - start
+    
+    best = best is None and elapsed or min(best, elapsed)
+  
+  return best
+
+def get_arguments():
+  arg_parser = argparse.ArgumentParser(description="Benchmarks of the SkidmarkCSS palette plugins")
+  arg_parser.add_argument("--colors", dest="colors", help="Number of base colors (default: 50)", type=int, default=50)
+  arg_parser.add_argument("--steps", dest="steps", help="Number of steps of each scale (default: 10)", type=int, default=10)
+  arg_parser.add_argument("--repeat", dest="repeat", help="Number of runs, the best is reported (default: 5)", type=int, default=5)
+  
+  return arg_parser.parse_args()
+
+if __name__ == '__main__':
+  args = get_arguments()
+  colors = get_base_colors(args.colors)
+  
+  print "%d colors, %d steps" % ( args.colors, args.steps )
+  print "  ~lighten()/~darken() per step: %.4fs" % ( time_compile(get_percall_source(colors, args.steps), args.repeat), )
+  print "  ~scale():                      %.4fs" % ( time_compile(get_scale_source(colors, args.steps), args.repeat), )
+  
+  use_numpy = ColorKernel.has_numpy()
+  ColorKernel.use_numpy = False
+  print "  kernel, pure Python:           %.4fs" % ( time_kernel(colors, args.steps, args.repeat), )
+  
+  if use_numpy:
+    ColorKernel.use_numpy = True
+    print "  kernel, NumPy:                 %.4fs" % ( time_kernel(colors, args.steps, args.repeat), )
+  else:
+    print "  kernel, NumPy:                 not installed"
@@ -0,0 +1,357 @@
+# -*- coding: latin-1 -*-
+
+"""Compilations running in the background: compile_file() and compile_string()
+return a CompileFuture at once, the source being read and compiled by a pool of
+threads or processes (see CompileExecutor). The identical compilations
+requested while one is in progress share its future. An event loop waits for
+the result with add_done_callback() rather than result()"""
+
+import os
+import StringIO
+import threading
+
+import skidmark
+from core.plugincache import PluginCache
+
+# Guards the creation of the default executor
+EXECUTOR_LOCK = threading.Lock()
+
+class CompileTimeout(Exception):
+  """The compilation didn't complete in time"""
+  pass
+
+class CompileCancelled(Exception):
+  """The compilation was cancelled"""
+  pass
+
+class CompileFuture(object):
+  """The result of a compilation: the CSS (string), or the exception it
+  raised. A compilation with a timeout fails with CompileTimeout once it is
+  reached, the compilation itself isn't interrupted, its result is ignored.
+  Until it completes, it keeps holding skidmark.COMPILE_LOCK: the compilations
+  queued behind it (in any thread of the process) wait for it"""
+  
+  def __init__(self, key=None, timeout=None):
+    self.key = key
+    self.state = FUTURE_PENDING
+    self.value = None
+    self.error = None
+    self.callbacks = []
+    self.condition = threading.Condition()
+    self.timer = None
+    
+    if timeout is not None:
+      self.timer = threading.Timer(timeout, self._set_exception, ( CompileTimeout("The compilation took more than %s seconds" % ( timeout, )), ))
+      self.timer.daemon = True
+      self.timer.start()
+  
+  def cancel(self):
+    """Cancels the compilation, returns False if it already completed. A
+    compilation that didn't start is skipped, the result of one in progress
+    is ignored. The requests sharing the future are cancelled too"""
+    
+    return self._complete(FUTURE_CANCELLED, None, None)
+  
+  def cancelled(self):
+    return self.state == FUTURE_CANCELLED
+  
+  def running(self):
+    return self.state == FUTURE_RUNNING
+  
+  def done(self):
+    return self.state in ( FUTURE_FINISHED, FUTURE_CANCELLED )
+  
+  def result(self, timeout=None):
+    """Waits for the compilation and returns its CSS. Raises the exception of
+    the compilation, CompileCancelled, or CompileTimeout if it doesn't complete
+    within timeout seconds"""
+    
+    self.condition.acquire()
+    try:
+      if not self.done():
+        self.condition.wait(timeout)
+      
+      if not self.done():
+        raise CompileTimeout("The compilation didn't complete within %s seconds" % ( timeout, ))
+    finally:
+      self.condition.release()
+    
+    if self.state == FUTURE_CANCELLED:
+      raise CompileCancelled("The compilation was cancelled")
+    
+    if self.error is not None:
+      raise self.error
+    
+    return self.value
+  
+  def add_done_callback(self, fn):
+    """Calls fn(future) once the compilation completed (or at once if it
+    did), from the thread completing it"""
+    
+    self.condition.acquire()
+    try:
+      if not self.done():
+        self.callbacks.append(fn)
+        return
+    finally:
+      self.condition.release()
+    
+    fn(self)
+    
+    return
+  
+  def _start(self):
+    """Marks the compilation as started, returns False if it was cancelled"""
+    
+    self.condition.acquire()
+    try:
+      if self.state != FUTURE_PENDING:
+        return False
+      self.state = FUTURE_RUNNING
+    finally:
+      self.condition.release()
+    
+    return True
+  
+  def _set_result(self, value):
+    self._complete(FUTURE_FINISHED, value, None)
+  
+  def _set_exception(self, error):
+    self._complete(FUTURE_FINISHED, None, error)
+  
+  def _complete(self, state, value, error):
+    """Completes the future, unless it already is. Returns True if it was"""
+    
+    self.condition.acquire()
+    try:
+      if self.done():
+        return False
+      
+      self.state = state
+      self.value = value
+      self.error = error
+      self.condition.notify_all()
+      
+      callbacks, self.callbacks = self.callbacks, []
+    finally:
+      self.condition.release()
+    
+    if self.timer is not None:
+      self.timer.cancel()
+    
+    for fn in callbacks:
+      fn(self)
+    
+    return True
+
+class CompileExecutor(object):
+  """Runs the compilations with a pool of worker threads, or processes when
+  processes is True. The threads of a process compile one source at a time
+  (see skidmark.COMPILE_LOCK), they only free the caller: the processes
+  compile in parallel. The pool is started by the first compilation.
+  The outcome of a process that dies is never delivered: the compilations of
+  a process pool always have a timeout (EXECUTOR_PROCESS_TIMEOUT by default)"""
+  
+  def __init__(self, workers=None, processes=False):
+    self.workers = workers or EXECUTOR_WORKERS
+    self.processes = processes
+    self.pool = None
+    self.in_flight = {}
+    self.lock = threading.Lock()
+  
+  def submit(self, infile=None, source=None, timeout=None, **config):
+    """Compiles the file (path) or the source (string), returns its
+    CompileFuture. The config parameters are those of SkidmarkCSS. The future
+    fails after timeout seconds, but the compilation goes on holding the
+    compiler lock, blocking the queued compilations (see CompileFuture)"""
+    
+    if self.processes and timeout is None:
+      timeout = EXECUTOR_PROCESS_TIMEOUT
+    
+    key = self._get_key(infile, source, config)
+    
+    self.lock.acquire()
+    try:
+      future = key is not None and self.in_flight.get(key) or None
+      if future is not None:
+        return future
+      
+      future = CompileFuture(key, timeout)
+      if key is not None:
+        self.in_flight[key] = future
+      
+      if self.pool is None:
+        # Only imported when something is compiled in the background
+        import multiprocessing.pool
+        
+        if self.processes:
+          self.pool = multiprocessing.pool.Pool(self.workers)
+        else:
+          self.pool = multiprocessing.pool.ThreadPool(self.workers)
+      
+      pool = self.pool
+    finally:
+      self.lock.release()
+    
+    future.add_done_callback(self._remove_in_flight)
+    
+    if self.processes:
+      # Whether the task was cancelled is only known to this process
+      future._start()
+      async_result = pool.apply_async(compile_task, ( infile, source, config ))
+      
+      thread = threading.Thread(target=self._wait_outcome, args=( future, async_result ))
+      thread.daemon = True
+      thread.start()
+    else:
+      pool.apply_async(self._run_task, ( future, infile, source, config ))
+    
+    return future
+  
+  def shutdown(self, wait=True):
+    """Stops the pool, after the pending compilations if wait is True"""
+    
+    self.lock.acquire()
+    try:
+      pool, self.pool = self.pool, None
+    finally:
+      self.lock.release()
+    
+    if pool is not None:
+      if wait:
+        pool.close()
+      else:
+        pool.terminate()
+      pool.join()
+    
+    return
+  
+  def _run_task(self, future, infile, source, config):
+    """Runs a compilation in a thread of the pool, unless it was cancelled"""
+    
+    if future._start():
+      self._set_outcome(future, compile_task(infile, source, config))
+    
+    return
+  
+  @classmethod
+  def _wait_outcome(cls, future, async_result):
+    """Completes the future with the outcome of a compilation run by a process,
+    or the exception raised delivering it (an outcome that can't be pickled).
+    Returns once the future is done, by its timeout if the process died"""
+    
+    while not future.done():
+      async_result.wait(EXECUTOR_POLL_INTERVAL)
+      if async_result.ready():
+        try:
+          outcome = async_result.get()
+        except Exception, e:
+          outcome = ( False, e )
+        cls._set_outcome(future, outcome)
+    
+    return
+  
+  @classmethod
+  def _set_outcome(cls, future, outcome):
+    ok, value = outcome
+    if ok:
+      future._set_result(value)
+    else:
+      future._set_exception(value)
+    
+    return
+  
+  def _remove_in_flight(self, future):
+    self.lock.acquire()
+    try:
+      if self.in_flight.get(future.key) is future:
+        del self.in_flight[future.key]
+    finally:
+      self.lock.release()
+    
+    return
+  
+  @classmethod
+  def _get_key(cls, infile, source, config):
+    """Returns the key identifying identical compilations, None if the config
+    can't be hashed"""
+    
+    if source is not None:
+      key = ( "source", source, PluginCache.get_key(config) )
+    else:
+      key = ( "infile", os.path.abspath(infile), PluginCache.get_key(config) )
+    
+    try:
+      hash(key)
+    except TypeError:
+      return None
+    
+    return key
+
+def compile_task(infile, source, config):
+  """Compiles the file or the source, returns a tuple: ( True, css ), or
+  ( False, exception ) if it raised"""
+  
+  skidmark.COMPILE_LOCK.acquire()
+  try:
+    skidmark.reset_global_state(config.get("prelude"))
+    
+    if source is not None:
+      infile = StringIO.StringIO(source)
+    
+    outfile = StringIO.StringIO()
+    skidmark.SkidmarkCSS(dict(config, printcss=False), infile, outfile)
+  except Exception, e:
+    return ( False, e )
+  finally:
+    skidmark.COMPILE_LOCK.release()
+  
+  return ( True, outfile.getvalue() )
+
+def get_executor():
+  """Returns the executor used when none is given, created on first use"""
+  
+  global DEFAULT_EXECUTOR
+  
+  EXECUTOR_LOCK.acquire()
+  try:
+    if DEFAULT_EXECUTOR is None:
+      DEFAULT_EXECUTOR = CompileExecutor()
+  finally:
+    EXECUTOR_LOCK.release()
+  
+  return DEFAULT_EXECUTOR
+
+def compile_file(path, executor=None, timeout=None, **config):
+  """Compiles the file in the background, returns its CompileFuture (see
+  CompileExecutor.submit for the timeout)"""
+  
+  return (executor or get_executor()).submit(infile=path, timeout=timeout, **config)
+
+def compile_string(src, executor=None, timeout=None, **config):
+  """Compiles the source (string) in the background, returns its
+  CompileFuture (see CompileExecutor.submit for the timeout)"""
+  
+  return (executor or get_executor()).submit(source=src, timeout=timeout, **config)
+
+
+#
+# Constants
+#
+
+FUTURE_PENDING = "pending"
+FUTURE_RUNNING = "running"
+FUTURE_FINISHED = "finished"
+FUTURE_CANCELLED = "cancelled"
+
+# Number of threads (or processes) of an executor
+EXECUTOR_WORKERS = 4
+
+# Default timeout (seconds) of the compilations of a process pool
+EXECUTOR_PROCESS_TIMEOUT = 60
+
+# Number of seconds between the checks of the outcome of a process
+EXECUTOR_POLL_INTERVAL = 0.1
+
+# The executor of compile_file() and compile_string(), see get_executor()
+DEFAULT_EXECUTOR = None
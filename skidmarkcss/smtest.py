@@ -5,6 +5,31 @@ import unittest
 from tests.singleselector import TestSingleSelector
 from tests.pseudo import TestPseudo
 from tests.inheritance import TestInheritance
+from tests.unification import TestUnification
+from tests.deaddeclarations import TestDeadDeclarations
+from tests.minifier import TestMinifier
+from tests.mediaqueries import TestMediaQueries
+from tests.targets import TestTargets
+from tests.output import TestOutput
+from tests.streaming import TestStreaming
+from tests.encoding import TestEncoding
+from tests.incremental import TestIncremental
+from tests.themes import TestThemes
+from tests.dependencies import TestDependencies
+from tests.prelude import TestPrelude
+from tests.mathematics import TestMathematics
+from tests.plugincache import TestPluginCache
+from tests.pluginbatch import TestPluginBatch
+from tests.pluginargs import TestPluginArgs
+from tests.gradients import TestGradients
+from tests.colors import TestColors
+from tests.palette import TestPalette
+from tests.pluginregistry import TestPluginRegistry
+from tests.worker import TestWorker
+from tests.stylesheetserver import TestStylesheetServer
+from tests.compilefutures import TestCompileFutures
+from tests.compilecache import TestCompileCache
+from tests.budgets import TestBudgets
   
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,246 @@
+# -*- coding: latin-1 -*-
+
+"""Serving the stylesheets of a web application: a WSGI application that
+compiles the SkidmarkCSS source of a requested stylesheet (/path/name.css ->
+root/path/name.sm) on its first request, and a middleware serving them in front
+of another WSGI application. The CSS is kept in an LRU cache keyed by the hash
+of every file the stylesheet was compiled from (includes included), so a
+change to any of them is picked up on the next request"""
+
+import hashlib
+import os
+import StringIO
+
+import skidmark
+from core.lrucache import LRUCache
+from core.prelude import PreludeSnapshot
+from core.sourcereader import SourceReader
+
+class SkidmarkApp(object):
+  """The WSGI application compiling the stylesheets of the root directory.
+  The responses have an ETag (the hash of the inputs) and the Cache-Control
+  header given, a request whose If-None-Match matches gets a 304 without the
+  stylesheet being compiled again. Concurrent requests for a stylesheet that
+  is not cached compile it once, the compilations are serialized (see
+  skidmark.COMPILE_LOCK) as the compiler state (variables, templates) is
+  global. A stylesheet whose files are modified while it is compiled is served
+  without an ETag, and not cached"""
+  
+  def __init__(self, root, config=None, cache_size=None, cache_control=None):
+    self.root = PreludeSnapshot.get_path(root)
+    self.config = dict(config or {})
+    self.config["printcss"] = False
+    self.cache_control = cache_control or WSGI_CACHE_CONTROL
+    self.stylesheets = LRUCache(cache_size or WSGI_CACHE_SIZE)
+    self.dependencies = LRUCache(cache_size or WSGI_CACHE_SIZE)
+    self.digests = LRUCache(WSGI_DIGEST_CACHE_SIZE)
+    self.compiles = 0
+  
+  def __call__(self, environ, start_response):
+    if environ.get("REQUEST_METHOD", "GET") not in ( "GET", "HEAD" ):
+      return self._respond(start_response, "405 Method Not Allowed", [ ( "Allow", "GET, HEAD" ) ], "")
+    
+    filename = self.get_source(environ.get("PATH_INFO", ""))
+    if filename is None or not os.path.isfile(filename):
+      return self._respond(start_response, "404 Not Found", [], "Not Found")
+    
+    try:
+      etag, css, content_type = self.get_stylesheet(filename, environ.get("HTTP_IF_NONE_MATCH"))
+    except Exception, e:
+      message = u"%s: %s" % ( e.__class__.__name__, skidmark.get_error_message(e) )
+      return self._respond(start_response, "500 Internal Server Error", [], message.encode("utf-8"))
+    
+    headers = [ ( "Cache-Control", self.cache_control ) ]
+    if etag is not None:
+      headers.insert(0, ( "ETag", etag ))
+    if css is None:
+      return self._respond(start_response, "304 Not Modified", headers, None)
+    
+    if environ.get("REQUEST_METHOD") == "HEAD":
+      start_response("200 OK", headers + [ ( "Content-Type", content_type ), ( "Content-Length", str(len(css)) ) ])
+      return []
+    
+    return self._respond(start_response, "200 OK", headers, css, content_type)
+  
+  def get_source(self, path):
+    """Returns the source file of the stylesheet path of a request, or None if
+    it isn't a stylesheet of the root directory"""
+    
+    if not path.endswith(".css"):
+      return None
+    
+    filename = PreludeSnapshot.get_path(os.path.join(self.root, path[:-4].lstrip("/") + ".sm"))
+    if not filename.startswith(self.root + os.sep):
+      return None
+    
+    return filename
+  
+  def get_stylesheet(self, filename, if_none_match=None):
+    """Returns a tuple: ( etag, css, content type ) of the stylesheet compiled
+    from the file, css being None when the etag is one of if_none_match. The
+    etag is None when the stylesheet couldn't be cached"""
+    
+    key = self._get_key(filename)
+    if key is not None and self._etag_matches(self._get_etag(key), if_none_match):
+      return self._get_etag(key), None, None
+    
+    stylesheet = key is not None and self.stylesheets.get(key) or None
+    if stylesheet is None:
+      skidmark.COMPILE_LOCK.acquire()
+      try:
+        # The concurrent requests for the stylesheet waited for its compilation
+        key = self._get_key(filename)
+        stylesheet = key is not None and self.stylesheets.get(key) or None
+        if stylesheet is None:
+          key, stylesheet = self._compile(filename)
+      finally:
+        skidmark.COMPILE_LOCK.release()
+    
+    if key is None:
+      return ( None, ) + stylesheet
+    
+    etag = self._get_etag(key)
+    if self._etag_matches(etag, if_none_match):
+      return etag, None, None
+    
+    return ( etag, ) + stylesheet
+  
+  def _compile(self, filename):
+    """Compiles the stylesheet, returns a tuple: ( key, ( css, content type ) ).
+    The files it was compiled from become its dependencies. The key is None
+    when one of them was modified after the compilation read it"""
+    
+    self.compiles += 1
+    
+    skidmark.reset_global_state(self.config.get("prelude"))
+    
+    outfile = StringIO.StringIO()
+    sm = skidmark.SkidmarkCSS(self.config, filename, outfile)
+    
+    self.dependencies.set(filename, sorted(sm.source_files))
+    key = self._get_key(filename, sm.source_files)
+    
+    content_type = "text/css; charset=%s" % ( SourceReader.get_output_encoding(sm.source_encoding), )
+    stylesheet = ( outfile.getvalue(), content_type )
+    if key is not None:
+      self.stylesheets.set(key, stylesheet)
+    
+    return key, stylesheet
+  
+  def _get_key(self, filename, mtimes=None):
+    """Returns the cache key of the stylesheet: the hash of the files it was
+    last compiled from, or None if it wasn't compiled yet (or a file is gone).
+    With mtimes (dict: path -> modification time of the file when it was
+    compiled), None as well if a file was modified since"""
+    
+    dependencies = self.dependencies.get(filename)
+    if dependencies is None:
+      return None
+    
+    key = hashlib.md5(filename.encode("utf-8") if isinstance(filename, unicode) else filename)
+    for path in dependencies:
+      digest = self._get_digest(path, mtimes is not None and mtimes.get(path) or None)
+      if digest is None:
+        return None
+      key.update(digest)
+    
+    return key.hexdigest()
+  
+  def _get_digest(self, path, mtime=None):
+    """Returns the hash of the content of a file, computed again only when its
+    modification time or size changed. None if the file doesn't exist, or if
+    its modification time is not mtime (when given)"""
+    
+    try:
+      stat = os.stat(path)
+    except OSError:
+      return None
+    
+    if mtime is not None and stat.st_mtime != mtime:
+      return None
+    
+    signature = ( stat.st_mtime, stat.st_size )
+    cached = self.digests.get(path)
+    if cached is not None and cached[0] == signature:
+      return cached[1]
+    
+    f = open(path, "rb")
+    try:
+      digest = hashlib.md5(f.read()).digest()
+    finally:
+      f.close()
+    
+    self.digests.set(path, ( signature, digest ))
+    
+    return digest
+  
+  @classmethod
+  def _get_etag(cls, key):
+    """Returns the ETag header of a cache key"""
+    
+    return '"%s"' % ( key, )
+  
+  @classmethod
+  def _etag_matches(cls, etag, if_none_match):
+    """Returns True if the etag is one of the If-None-Match header (weak
+    comparison)"""
+    
+    if not if_none_match:
+      return False
+    
+    for tag in if_none_match.split(","):
+      tag = tag.strip()
+      if tag.startswith("W/"):
+        tag = tag[2:]
+      if tag == "*" or tag == etag:
+        return True
+    
+    return False
+  
+  @classmethod
+  def _respond(cls, start_response, status, headers, body, content_type="text/plain; charset=utf-8"):
+    """Starts the response and returns its body, without Content-Type when the
+    body is None"""
+    
+    if body is None:
+      start_response(status, headers)
+      return []
+    
+    start_response(status, headers + [ ( "Content-Type", content_type ), ( "Content-Length", str(len(body)) ) ])
+    
+    return [ body ]
+
+class SkidmarkMiddleware(object):
+  """Serves the stylesheets whose path starts with the prefix (see SkidmarkApp,
+  the prefix is removed from the path), the other requests and the stylesheets
+  without a source go to the application"""
+  
+  def __init__(self, application, root, prefix="/", **kw):
+    self.application = application
+    self.prefix = prefix.strip("/") and "/" + prefix.strip("/") or ""
+    self.stylesheet_app = SkidmarkApp(root, **kw)
+  
+  def __call__(self, environ, start_response):
+    path = environ.get("PATH_INFO", "")
+    
+    if path.startswith(self.prefix + "/"):
+      filename = self.stylesheet_app.get_source(path[len(self.prefix):])
+      if filename is not None and os.path.isfile(filename):
+        environ = dict(environ, SCRIPT_NAME=environ.get("SCRIPT_NAME", "") + self.prefix, PATH_INFO=path[len(self.prefix):])
+        return self.stylesheet_app(environ, start_response)
+    
+    return self.application(environ, start_response)
+
+
+#
+# Constants
+#
+
+# Number of compiled stylesheets kept
+WSGI_CACHE_SIZE = 100
+
+# Number of file hashes kept
+WSGI_DIGEST_CACHE_SIZE = 1000
+
+# Default Cache-Control of the stylesheets: revalidated (If-None-Match) on use
+WSGI_CACHE_CONTROL = "no-cache"
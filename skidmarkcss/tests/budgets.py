@@ -0,0 +1,65 @@
+# -*- coding: latin-1 -*-
+
+import os
+import StringIO
+import unittest
+
+import skidmark
+
+SOURCE_BUDGETS_SELECTORS = "a, b, c, d { " * 6 + "color: red; " + "}" * 6
+SOURCE_BUDGETS_TEMPLATES = "@@template loop() { color: red; @@use loop(); }\nb { @@use loop(); }"
+SOURCE_BUDGETS_PARSE = "a { color: red; }\n" * 200 + "b { color red; }"
+SOURCE_BUDGETS_NESTING = "a { " * 100 + "color: red; " + "}" * 100
+
+class TestBudgets(unittest.TestCase):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    return
+  
+  def compile(self, src, **kw):
+    return skidmark.compile_bytes(src, **dict(self.config, **kw))
+  
+  def test_budgets_selectors(self):
+    self.assertTrue(self.compile(SOURCE_BUDGETS_SELECTORS).count(",") == 4 ** 6 - 1)
+    self.assertRaises(skidmark.SelectorBudgetExceeded, self.compile, SOURCE_BUDGETS_SELECTORS, max_selectors=1000)
+    
+    return
+  
+  def test_budgets_depth(self):
+    self.assertRaises(skidmark.DepthBudgetExceeded, self.compile, SOURCE_BUDGETS_TEMPLATES)
+    self.assertRaises(skidmark.DepthBudgetExceeded, skidmark.SkidmarkCSS, self.config, os.path.join("tests", "testfiles", "budgets_include.sm"), StringIO.StringIO())
+    
+    return
+  
+  def test_budgets_nesting(self):
+    self.assertRaises(skidmark.NestingBudgetExceeded, self.compile, SOURCE_BUDGETS_NESTING)
+    self.assertRaises(skidmark.NestingBudgetExceeded, self.compile, SOURCE_BUDGETS_NESTING, streaming=True)
+    self.assertTrue(self.compile(SOURCE_BUDGETS_NESTING, max_nesting=100) == "%s{color:red}\n" % ( " ".join([ "a" ] * 100), ))
+    
+    return
+  
+  def test_budgets_output_time(self):
+    self.assertRaises(skidmark.OutputBudgetExceeded, self.compile, SOURCE_BUDGETS_SELECTORS, max_output_bytes=1000)
+    self.assertRaises(skidmark.TimeBudgetExceeded, self.compile, SOURCE_BUDGETS_SELECTORS, max_time=0)
+    
+    # The parse is part of the budget: it is exceeded before the error at the end
+    self.assertRaises(skidmark.ErrorInFile, self.compile, SOURCE_BUDGETS_PARSE)
+    self.assertRaises(skidmark.TimeBudgetExceeded, self.compile, SOURCE_BUDGETS_PARSE, max_time=0)
+    self.assertRaises(skidmark.TimeBudgetExceeded, self.compile, SOURCE_BUDGETS_PARSE, max_time=0, streaming=True)
+    
+    # The budget errors are reported
+    err = skidmark.execute_sm(dict(self.config, max_output_bytes=1000), infile=StringIO.StringIO(SOURCE_BUDGETS_SELECTORS), outfile=StringIO.StringIO())
+    self.assertTrue(err.splitlines()[1] == "OutputBudgetExceeded: The CSS of the source is larger than 1000 bytes")
+    
+    return
+  
+  def tearDown(self):
+    pass
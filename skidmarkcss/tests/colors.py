@@ -0,0 +1,58 @@
+# -*- coding: latin-1 -*-
+
+import unittest
+
+from core.htmlcolors import HTMLColors, PackedColor, InvalidColorException
+from core.lrucache import LRUCache
+
+class TestColors(unittest.TestCase):
+  def test_colors_packed(self):
+    color = PackedColor.from_rgb(18, 52, 86)
+    
+    self.assertTrue(color.get_rgb() == ( 18, 52, 86 ) and color.a == 255)
+    self.assertTrue(color.get_hex() == "#123456")
+    self.assertTrue(HTMLColors.parse("#123456") == color)
+    self.assertTrue(HTMLColors.parse("red") == HTMLColors.parse("#f00") == PackedColor.from_rgb(255, 0, 0))
+    
+    self.assertRaises(InvalidColorException, HTMLColors.parse, "#12345")
+    self.assertRaises(InvalidColorException, HTMLColors.parse, "notacolor")
+    
+    return
+  
+  def test_colors_names(self):
+    self.assertTrue(HTMLColors.get_color_name("#ff0000") == "red")
+    self.assertTrue(HTMLColors.get_color_name("#123456") == "")
+    self.assertTrue(HTMLColors.get_color_value("Navy") == "#000080")
+    
+    self.assertTrue(HTMLColors.get_color_shortest("#FF0000") == "red")
+    self.assertTrue(HTMLColors.get_color_shortest("white") == "#FFF")
+    self.assertTrue(HTMLColors.get_color_shortest("#aabbcc") == "#abc")
+    self.assertTrue(HTMLColors.get_color_shortest("#123456") == "#123456")
+    self.assertTrue(HTMLColors.get_color_shortest("cornflowerblue") == "#6495ED")
+    
+    return
+  
+  def test_colors_operations(self):
+    self.assertTrue(HTMLColors.darken("#ff0000", 10) == "#e50000")
+    self.assertTrue(HTMLColors.darken("white", 100) == "#000")
+    self.assertTrue(HTMLColors.lighten("black", 100) == "#fff")
+    self.assertTrue(HTMLColors.lighten("#123456", 0) == "#123456")
+    self.assertTrue(HTMLColors.get_hsl("#ff0000") == ( 0, 100, 50 ))
+    self.assertTrue(HTMLColors.get_hue_from_color("lime") == 120)
+    
+    return
+  
+  def test_colors_lrucache(self):
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    
+    self.assertTrue(cache.get("a") == 1 and cache.get("b") is None and cache.get("c") == 3)
+    self.assertTrue(len(cache) == 2)
+    
+    cache.clear()
+    self.assertTrue(len(cache) == 0 and "a" not in cache)
+    
+    return
@@ -0,0 +1,82 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from core.compilecache import CompileCache
+from core.lrucache import LRUCache
+
+RESULT_COMPILECACHE = "b{margin:4px}\n"
+RESULT_COMPILECACHE_SCOPE = "a{color:red}\n"
+
+SOURCE_COMPILECACHE = "$a = 2px;\nb { margin: ($a * 2); }"
+
+class TestCompileCache(unittest.TestCase):
+  def setUp(self):
+    self.config = dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED)
+    self.compile_cache = skidmark.SkidmarkCSS.compile_cache
+    skidmark.SkidmarkCSS.compile_cache = CompileCache()
+    return
+  
+  def test_compilecache_hits(self):
+    cache = skidmark.SkidmarkCSS.compile_cache
+    
+    self.assertTrue(skidmark.processFromString(SOURCE_COMPILECACHE, **self.config) == ( RESULT_COMPILECACHE, "" ))
+    self.assertTrue(skidmark.processFromString(SOURCE_COMPILECACHE, **self.config) == ( RESULT_COMPILECACHE, "" ))
+    self.assertTrue(skidmark.compile_bytes(SOURCE_COMPILECACHE, **self.config) == RESULT_COMPILECACHE)
+    
+    # Another config is another entry
+    css, err = skidmark.processFromString(SOURCE_COMPILECACHE, output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT)
+    self.assertTrue(css != RESULT_COMPILECACHE and not err)
+    
+    outfile = StringIO.StringIO()
+    self.assertTrue(skidmark.execute_sm(self.config, infile=StringIO.StringIO(SOURCE_COMPILECACHE), outfile=outfile) == "")
+    self.assertTrue(outfile.getvalue() == RESULT_COMPILECACHE)
+    
+    stats = cache.get_stats()
+    self.assertTrue(stats["hits"] == 3 and stats["misses"] == 2 and stats["entries"] == 2)
+    self.assertTrue(stats["bytes"] == len(RESULT_COMPILECACHE) + len(css) and stats["evictions"] == 0)
+    
+    return
+  
+  def test_compilecache_uncached(self):
+    cache = skidmark.SkidmarkCSS.compile_cache
+    
+    css, err = skidmark.processFromString("b { color: $undefined; }", **self.config)
+    self.assertTrue(css == "" and err.splitlines()[1] == "VariableNotFound: Variable '$undefined' is undefined")
+    self.assertRaises(skidmark.VariableNotFound, skidmark.compile_bytes, "b { color: $undefined; }", **self.config)
+    self.assertTrue(len(cache) == 0)
+    
+    return
+  
+  def test_compilecache_global_scope(self):
+    # The variables left by another compilation are not part of the key
+    skidmark.VARIABLE_STACK[:] = [ { u"color": u"blue" } ]
+    self.assertRaises(skidmark.VariableNotFound, skidmark.compile_bytes, "a { color: $color; }", **self.config)
+    
+    self.assertTrue(skidmark.compile_bytes("$color = red;\na { color: $color; }", **self.config) == RESULT_COMPILECACHE_SCOPE)
+    skidmark.VARIABLE_STACK[:] = [ { u"color": u"blue" } ]
+    self.assertTrue(skidmark.compile_bytes("$color = red;\na { color: $color; }", **self.config) == RESULT_COMPILECACHE_SCOPE)
+    self.assertRaises(skidmark.VariableNotFound, skidmark.compile_bytes, "a { color: $color; }", **self.config)
+    
+    return
+  
+  def test_compilecache_limits(self):
+    cache = skidmark.SkidmarkCSS.compile_cache = CompileCache(size=2)
+    for idx in range(3):
+      skidmark.compile_bytes("b { margin: %dpx; }" % ( idx, ), **self.config)
+    self.assertTrue(len(cache) == 2 and cache.get_stats()["evictions"] == 1)
+    
+    entries = LRUCache(10, max_bytes=10)
+    entries.set("a", "12345")
+    entries.set("b", "12345")
+    entries.set("c", "123")
+    entries.set("d", "12345678901")
+    self.assertTrue("a" not in entries and "b" in entries and "c" in entries and "d" not in entries)
+    self.assertTrue(entries.get_stats()["bytes"] == 8 and entries.get_stats()["evictions"] == 1)
+    
+    return
+  
+  def tearDown(self):
+    skidmark.SkidmarkCSS.compile_cache = self.compile_cache
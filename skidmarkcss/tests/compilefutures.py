@@ -0,0 +1,124 @@
+# -*- coding: latin-1 -*-
+
+import os
+import threading
+import unittest
+
+import skidmark
+import smfuture
+from core.pluginmanager import SkidmarkCSSPlugin
+
+RESULT_FUTURE_SOURCE = "b{margin:4px}\n"
+RESULT_FUTURE_FILE = "a{color:red;padding:2px}\n"
+
+SOURCE_FUTURE = "$a = 2px;\nb { margin: ($a * 2); }"
+
+class UnpicklableError(Exception):
+  def __init__(self, message):
+    Exception.__init__(self, message)
+    self.callback = lambda: None
+
+class PluginUnpicklable(SkidmarkCSSPlugin):
+  """Raises an exception that can't be sent back by a process"""
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'unpicklable')
+  
+  def eval(self, *args):
+    raise UnpicklableError("unpicklable")
+
+class TestCompileFutures(unittest.TestCase):
+  def setUp(self):
+    self.config = dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED)
+    self.executor = smfuture.CompileExecutor(workers=1)
+    return
+  
+  def test_future_compile(self):
+    future = smfuture.compile_string(SOURCE_FUTURE, self.executor, **self.config)
+    self.assertTrue(future.result(5) == RESULT_FUTURE_SOURCE and future.done())
+    
+    future = smfuture.compile_file(os.path.join("tests", "testfiles", "prelude_main.sm"), self.executor, **self.config)
+    self.assertTrue(future.result(5) == RESULT_FUTURE_FILE)
+    
+    done = []
+    future = smfuture.compile_string("b { color: $undefined; }", self.executor, **self.config)
+    future.add_done_callback(done.append)
+    self.assertRaises(skidmark.VariableNotFound, future.result, 5)
+    self.assertTrue(done == [ future ])
+    
+    return
+  
+  def test_future_in_flight(self):
+    # Nothing completes while the compiler is held
+    skidmark.COMPILE_LOCK.acquire()
+    try:
+      future = smfuture.compile_string(SOURCE_FUTURE, self.executor, **self.config)
+      pending = smfuture.compile_string("c { padding: 1px; }", self.executor, **self.config)
+      timeout = smfuture.compile_string("d { padding: 1px; }", self.executor, timeout=0.05, **self.config)
+      
+      self.assertTrue(smfuture.compile_string(SOURCE_FUTURE, self.executor, **self.config) is future)
+      self.assertTrue(pending is not future and pending.cancel() and not pending.cancel())
+      self.assertRaises(smfuture.CompileTimeout, future.result, 0.01)
+      self.assertRaises(smfuture.CompileTimeout, timeout.result, 5)
+    finally:
+      skidmark.COMPILE_LOCK.release()
+    
+    self.assertTrue(future.result(5) == RESULT_FUTURE_SOURCE)
+    self.assertRaises(smfuture.CompileCancelled, pending.result)
+    
+    # Completed compilations aren't shared
+    self.assertTrue(smfuture.compile_string(SOURCE_FUTURE, self.executor, **self.config) is not future)
+    
+    return
+  
+  def test_future_shared_lock(self):
+    # The compilations started elsewhere wait for the compiler too
+    results = []
+    thread = threading.Thread(target=lambda: results.append(skidmark.processFromString(SOURCE_FUTURE, **self.config)))
+    
+    skidmark.COMPILE_LOCK.acquire()
+    try:
+      thread.start()
+      thread.join(0.05)
+      self.assertTrue(thread.is_alive() and results == [])
+    finally:
+      skidmark.COMPILE_LOCK.release()
+    
+    thread.join(5)
+    self.assertTrue(results == [ ( RESULT_FUTURE_SOURCE, "" ) ])
+    
+    return
+  
+  def test_future_processes(self):
+    executor = smfuture.CompileExecutor(workers=2, processes=True)
+    try:
+      futures = [ smfuture.compile_string(SOURCE_FUTURE, executor, **self.config), smfuture.compile_string("b { color: $undefined; }", executor, **self.config) ]
+      self.assertTrue(futures[0].result(10) == RESULT_FUTURE_SOURCE)
+      self.assertRaises(skidmark.VariableNotFound, futures[1].result, 10)
+    finally:
+      executor.shutdown()
+    
+    return
+  
+  def test_future_processes_undelivered(self):
+    # Registered before the processes are started
+    skidmark.SkidmarkCSS.add_plugin(PluginUnpicklable)
+    executor = smfuture.CompileExecutor(workers=1, processes=True)
+    try:
+      future = smfuture.compile_string("a { color: ~unpicklable(red); }", executor, **self.config)
+      self.assertTrue(future.timer is not None)
+      
+      try:
+        future.result(10)
+      except Exception, e:
+        self.assertTrue(e.__class__.__name__ == "MaybeEncodingError")
+      else:
+        self.fail("The compilation didn't fail")
+    finally:
+      executor.shutdown(wait=False)
+      skidmark.SkidmarkCSS.plugins.pop("unpicklable", None)
+    
+    return
+  
+  def tearDown(self):
+    self.executor.shutdown()
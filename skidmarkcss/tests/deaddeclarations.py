@@ -0,0 +1,53 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_DEAD_SIMPLE = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{color:blue;margin:0}\n.x.y{color:green}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { color: blue; margin: 0; }\n.x.y { color: green; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\scolor: blue;\n\\smargin: 0;\n}\n\n.x.y {\n\\scolor: green;\n}"
+}
+
+RESULT_DEAD_GUARDED = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{color:red !important}\nb{background:red}\na{color:blue}\nb{background:blue;background:-webkit-gradient(linear, left top, left bottom, from(red), to(blue))}\n@media print {a{color:black}}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { color: red !important; }\nb { background: red; }\na { color: blue; }\nb { background: blue; background: -webkit-gradient(linear, left top, left bottom, from(red), to(blue)); }\n@media print  { a { color: black; } }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\scolor: red !important;\n}\n\nb {\n\\sbackground: red;\n}\n\na {\n\\scolor: blue;\n}\n\nb {\n\\sbackground: blue;\n\\sbackground: -webkit-gradient(linear, left top, left bottom, from(red), to(blue));\n}\n\n@media print  {\n\\sa {\n\\s\\scolor: black;\n\\s}\n}"
+}
+
+class TestDeadDeclarations(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      eliminate_dead_declarations=True
+    )
+    return
+  
+  def test_dead_simple(self):
+    results = self.get_test_results(self.config, "deaddeclarations_simple.sm")
+    
+    for style, expected_result in RESULT_DEAD_SIMPLE.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_dead_guarded(self):
+    results = self.get_test_results(self.config, "deaddeclarations_guarded.sm")
+    
+    for style, expected_result in RESULT_DEAD_GUARDED.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def tearDown(self):
+    pass
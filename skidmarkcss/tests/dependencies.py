@@ -0,0 +1,63 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_DEPENDENCIES_COLOR = "a{color:blue;margin:4px}\nb{padding:4px;border-color:blue}\ni{margin:1px}"
+RESULT_DEPENDENCIES_SIZE = "a{color:blue;margin:2em}\nb{padding:2em;border-color:blue}\ni{margin:1px}"
+
+class TestDependencies(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      incremental=True,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    return
+  
+  def get_css(self, sm):
+    sio_file = StringIO.StringIO()
+    sm.render({}, sio_file)
+    return self.get_result(sio_file)
+  
+  def test_dependencies_override(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("dependencies_variables.sm"))
+    
+    # The template reads $color too, 'i' reads the $double defined after 'b'
+    self.assertTrue(sm.override({ "color": "blue" }) == [ 4, 5 ])
+    self.assertTrue(self.get_css(sm) == RESULT_DEPENDENCIES_COLOR)
+    
+    self.assertTrue(sm.override({ "$size": "1em" }) == [ 2, 4, 5 ])
+    self.assertTrue(self.get_css(sm) == RESULT_DEPENDENCIES_SIZE)
+    
+    return
+  
+  def test_dependencies_update(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("dependencies_variables.sm"))
+    sm.override({ "color": "blue" })
+    
+    # The overrides are kept by the following compilations
+    sm.update(self.load_file("dependencies_variables.sm").read() + "u { color: $color; }")
+    self.assertTrue(self.get_css(sm) == RESULT_DEPENDENCIES_COLOR + "\nu{color:blue}")
+    
+    return
+  
+  def test_dependencies_empty(self):
+    sm = skidmark.SkidmarkCSS(self.config, StringIO.StringIO('$color = red;\n$empty = "";\na { color: $color; content: $empty; }'))
+    
+    # The empty value read from the global scope is replayed
+    self.assertTrue(sm.override({ "color": "blue" }) == [ 2 ])
+    self.assertTrue(self.get_css(sm) == "a{color:blue;content:}")
+    
+    return
+  
+  def tearDown(self):
+    pass
@@ -0,0 +1,52 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_ENCODING_CHARSET = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "@charset \"iso-8859-1\";\na:before{content:\"\xe9\"}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "@charset \"iso-8859-1\";\na:before { content: \"\xe9\"; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "@charset \"iso-8859-1\";\na:before {\n\\scontent: \"\xe9\";\n}"
+}
+
+RESULT_ENCODING_BOM = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a:before{content:\"\xc3\xa9\"}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a:before { content: \"\xc3\xa9\"; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a:before {\n\\scontent: \"\xc3\xa9\";\n}"
+}
+
+class TestEncoding(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False
+    )
+    return
+  
+  def test_encoding_charset(self):
+    results = self.get_test_results(self.config, "encoding_charset.sm")
+    
+    for style, expected_result in RESULT_ENCODING_CHARSET.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_encoding_bom(self):
+    results = self.get_test_results(self.config, "encoding_bom.sm")
+    
+    for style, expected_result in RESULT_ENCODING_BOM.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def tearDown(self):
+    pass
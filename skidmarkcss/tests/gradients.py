@@ -0,0 +1,82 @@
+# -*- coding: latin-1 -*-
+
+import unittest
+
+import skidmark
+from core.plugindefaults import PropertyGradient
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_GRADIENTS_SHARED = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{background:red;background:var(--grad-smcss-c469fe51ad4b)}\nb{background:red;background:var(--grad-smcss-c469fe51ad4b)}\nc{background:red;background:var(--grad-smcss-d118004eb6e8)}\n:root{--grad-smcss-c469fe51ad4b:linear-gradient(to bottom, red 0%,blue 100%);--grad-smcss-d118004eb6e8:linear-gradient(to right, red 0%,blue 100%)}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { background: red; background: var(--grad-smcss-c469fe51ad4b); }\nb { background: red; background: var(--grad-smcss-c469fe51ad4b); }\nc { background: red; background: var(--grad-smcss-d118004eb6e8); }\n:root { --grad-smcss-c469fe51ad4b: linear-gradient(to bottom, red 0%,blue 100%); --grad-smcss-d118004eb6e8: linear-gradient(to right, red 0%,blue 100%); }"
+}
+
+RESULT_GRADIENTS_STANDARD = [
+  ( "vertical", "linear-gradient(to bottom, red 0%,blue 100%)" ),
+  ( "horizontal", "linear-gradient(to right, red 0%,blue 100%)" ),
+  ( "diag-down", "linear-gradient(135deg, red 0%,blue 100%)" ),
+  ( "diag-up", "linear-gradient(45deg, red 0%,blue 100%)" ),
+  ( "radial", "radial-gradient(ellipse farthest-corner at center, red 0%,blue 100%)" )
+]
+
+class TestGradients(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False
+    )
+    return
+  
+  def test_gradients_deterministic(self):
+    results = self.get_test_results(self.config, "gradients_shared.sm")
+    
+    PropertyGradient.SVG_CACHE.clear()
+    skidmark.SkidmarkCSS.plugin_cache.clear()
+    
+    self.assertTrue(results == self.get_test_results(self.config, "gradients_shared.sm"))
+    
+    res = self.get_style_result(skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED, results)
+    self.assertTrue(res.count("data:image/svg+xml") == 3)
+    
+    return
+  
+  def test_gradients_ids(self):
+    vertical = PropertyGradient.get_gradient_id("top", [ ( "red", "0%" ), ( "blue", "100%" ) ])
+    
+    self.assertTrue(vertical == PropertyGradient.get_gradient_id("top", [ ( "red", "0%" ), ( "blue", "100%" ) ]))
+    self.assertTrue(vertical != PropertyGradient.get_gradient_id("left", [ ( "red", "0%" ), ( "blue", "100%" ) ]))
+    self.assertTrue(vertical != PropertyGradient.get_gradient_id("top", [ ( "red", "0%" ), ( "blue", "50%" ) ]))
+    
+    return
+  
+  def test_gradients_custom_property(self):
+    self.config["gradient_mode"] = "custom-property"
+    results = self.get_test_results(self.config, "gradients_shared.sm")
+    
+    for style, expected_result in RESULT_GRADIENTS_SHARED.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result))
+    
+    return
+  
+  def test_gradients_standard(self):
+    gradient = PropertyGradient()
+    
+    for direction, expected_result in RESULT_GRADIENTS_STANDARD:
+      fallback, shared = gradient.eval(direction, "red", "blue", gradient_mode="custom-property")
+      self.assertTrue(fallback == "red" and shared.definition[1] == expected_result)
+    
+    return
+  
+  def test_gradients_unknown_mode(self):
+    self.config["gradient_mode"] = "svg"
+    self.assertRaises(skidmark.InvalidArgumentException, self.get_test_results, self.config, "gradients_shared.sm")
+    
+    return
+  
+  def tearDown(self):
+    pass
@@ -0,0 +1,71 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_INCREMENTAL_ITEMS = "a{color:red}\nb{padding:2px}\ni{margin:0}"
+RESULT_INCREMENTAL_RULE = "a{color:red}\nb{padding:2px}\ni{margin:1px}"
+RESULT_INCREMENTAL_VARIABLE = "a{color:blue}\nb{padding:2px}\ni{margin:0}"
+RESULT_INCREMENTAL_TEMPLATE = "a{color:red}\nb{margin:2px}\ni{margin:0}"
+
+class TestIncremental(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      incremental=True,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.src = self.load_file("incremental_items.sm").getvalue()
+    return
+  
+  def update(self, sm, src):
+    sm.s_outfile = StringIO.StringIO()
+    items_processed = sm.update(src)
+    return items_processed, self.get_result(sm.s_outfile)
+  
+  def test_incremental_compile(self):
+    sio_file = StringIO.StringIO()
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("incremental_items.sm"), sio_file)
+    
+    self.assertTrue(self.get_result(sio_file) == RESULT_INCREMENTAL_ITEMS)
+    self.assertTrue(sm.items_processed == 5)
+    self.assertTrue(self.update(sm, self.src) == ( 0, RESULT_INCREMENTAL_ITEMS ))
+    
+    return
+  
+  def test_incremental_rule(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("incremental_items.sm"))
+    
+    self.assertTrue(self.update(sm, self.src.replace("margin: 0", "margin: 1px")) == ( 1, RESULT_INCREMENTAL_RULE ))
+    
+    return
+  
+  def test_incremental_dependencies(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("incremental_items.sm"))
+    
+    # The variable and the rule that reads it
+    self.assertTrue(self.update(sm, self.src.replace("red", "blue")) == ( 2, RESULT_INCREMENTAL_VARIABLE ))
+    
+    # The template and the rule that uses it, along with the variable changed back
+    self.assertTrue(self.update(sm, self.src.replace("padding", "margin")) == ( 4, RESULT_INCREMENTAL_TEMPLATE ))
+    
+    return
+  
+  def test_incremental_required(self):
+    self.config["incremental"] = False
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("incremental_items.sm"))
+    
+    self.assertRaises(skidmark.InvalidArgumentException, sm.update, self.src)
+    
+    return
+  
+  def tearDown(self):
+    pass
@@ -0,0 +1,48 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.dimension import Dimension
+
+RESULT_MATHEMATICS_DEFAULT = "a{width:3.33333333333px;height:7.5px}\nb{margin:0.25px;padding:25}"
+RESULT_MATHEMATICS_PRECISION = "a{width:3.33px;height:7.5px}\nb{margin:0.25px;padding:25}"
+
+class TestMathematics(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    return
+  
+  def compile(self, config):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(config, self.load_file("mathematics_dimensions.sm"), sio_file)
+    return self.get_result(sio_file)
+  
+  def test_mathematics_dimensions(self):
+    self.assertTrue(Dimension.parse("1.50px") == Dimension(1.5, "px"))
+    self.assertTrue(Dimension.parse("-2") == Dimension(-2))
+    self.assertTrue(Dimension(-0.0001, "em").format(2) == "0em")
+    
+    self.assertTrue(self.compile(self.config) == RESULT_MATHEMATICS_DEFAULT)
+    self.assertTrue(self.compile(dict(self.config, math_precision=2)) == RESULT_MATHEMATICS_PRECISION)
+    
+    return
+  
+  def test_mathematics_constants(self):
+    self.compile(self.config)
+    
+    # The constant groups are kept, the group reading $size is not
+    self.assertTrue(skidmark.MathOperations.get_constant(( u"10px", u"/", u"3" )) == Dimension(10 / 3.0, "px"))
+    self.assertTrue(skidmark.MathOperations.get_constant(( ( u"1", u"+", u"2" ), u"*", u"$size", u"-", u"6px", u"/", u"4" )) is None)
+    
+    return
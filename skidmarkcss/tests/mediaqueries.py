@@ -0,0 +1,38 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_MEDIAQUERIES_MERGE = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "p{padding:0}\np{margin-top:1px}\n@media print {a{color:blue}\n\\si{padding:1px}\n\\sem{margin:1px}}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "p { padding: 0; }\np { margin-top: 1px; }\n@media print  { a { color: blue; }\n\\si { padding: 1px; }\n\\sem { margin: 1px; } }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "p {\n\\spadding: 0;\n}\n\np {\n\\smargin-top: 1px;\n}\n\n@media print  {\n\\sa {\n\\s\\scolor: blue;\n\\s}\n\\s\n\\si {\n\\s\\spadding: 1px;\n\\s}\n\\s\n\\sem {\n\\s\\smargin: 1px;\n\\s}\n}"
+}
+
+class TestMediaQueries(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      merge_mediaqueries=True
+    )
+    return
+  
+  def test_mediaqueries_merge(self):
+    results = self.get_test_results(self.config, "mediaqueries_merge.sm")
+    
+    for style, expected_result in RESULT_MEDIAQUERIES_MERGE.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def tearDown(self):
+    pass
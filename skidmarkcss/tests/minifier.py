@@ -0,0 +1,46 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.valueminifier import ValueMinifier
+
+RESULT_MINIFIER_VALUES = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{color:red;margin:0 .5em -.5px 10px;font-weight:700}\nb{width:3.33333px;font-family:Tan;background:#FFF url(white.png)}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { color: #FF0000; margin: 0px 0.50em -0.5px 10.0px; font-weight: bold; }\nb { width: 3.33333333333px; font-family: Tan; background: white url(white.png); }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\scolor: #FF0000;\n\\smargin: 0px 0.50em -0.5px 10.0px;\n\\sfont-weight: bold;\n}\n\nb {\n\\swidth: 3.33333333333px;\n\\sfont-family: Tan;\n\\sbackground: white url(white.png);\n}"
+}
+
+class TestMinifier(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      minify_values=True
+    )
+    return
+  
+  def test_minifier_values(self):
+    results = self.get_test_results(self.config, "minifier_values.sm")
+    
+    for style, expected_result in RESULT_MINIFIER_VALUES.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_minifier_exceptions(self):
+    self.assertTrue(ValueMinifier.minify("unicode-range", "U+0025-00FF, U+4??") == "U+0025-00FF, U+4??")
+    self.assertTrue(ValueMinifier.minify("width", "calc(0px + 1em) 0px") == "calc(0px + 1em) 0")
+    self.assertTrue(ValueMinifier.minify("margin", "-webkit-calc(100% - (0.50em * 2)) 0.0px") == "-webkit-calc(100% - (.5em * 2)) 0")
+    
+    return
+  
+  def tearDown(self):
+    pass
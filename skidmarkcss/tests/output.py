@@ -0,0 +1,73 @@
+# -*- coding: latin-1 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_OUTPUT_CHUNKS = [ "a{color:red}", "\n", "b{color:blue}", "\n" ]
+
+class ChunkSink(object):
+  def __init__(self):
+    self.chunks = []
+  
+  def write(self, s):
+    self.chunks.append(s)
+
+class TestOutput(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.tmp_dir = tempfile.mkdtemp()
+    return
+  
+  def test_output_sink(self):
+    sink = ChunkSink()
+    skidmark.SkidmarkCSS(self.config, self.load_file("output_rules.sm"), sink)
+    
+    self.assertTrue(sink.chunks == RESULT_OUTPUT_CHUNKS)
+    
+    return
+  
+  def test_output_file(self):
+    path = os.path.join(self.tmp_dir, "output.css")
+    
+    skidmark.SkidmarkCSS(self.config, self.load_file("output_rules.sm"), path)
+    self.assertTrue(open(path).read() == "".join(RESULT_OUTPUT_CHUNKS))
+    
+    # An identical output leaves the file untouched
+    inode = os.stat(path).st_ino
+    skidmark.SkidmarkCSS(self.config, self.load_file("output_rules.sm"), path)
+    self.assertTrue(os.stat(path).st_ino == inode)
+    
+    # A different output replaces it
+    self.config["output_format"] = skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT
+    skidmark.SkidmarkCSS(self.config, self.load_file("output_rules.sm"), path)
+    self.assertTrue(open(path).read() == "a { color: red; }\nb { color: blue; }\n")
+    self.assertTrue(os.listdir(self.tmp_dir) == [ "output.css" ])
+    
+    return
+  
+  def test_output_file_error(self):
+    # The output can't replace a directory, which is left as is
+    path = os.path.join(self.tmp_dir, "output.css")
+    os.mkdir(path)
+    open(os.path.join(path, "keep"), "w").close()
+    
+    self.assertRaises(OSError, skidmark.SkidmarkCSS, self.config, self.load_file("output_rules.sm"), path)
+    self.assertTrue(os.listdir(self.tmp_dir) == [ "output.css" ] and os.listdir(path) == [ "keep" ])
+    
+    return
+  
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
@@ -0,0 +1,85 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.colorkernel import ColorKernel
+from core.htmlcolors import HTMLColors, PackedColor
+from core.plugincache import PluginCache
+from core.plugindefaults import PaletteScale
+from core.pluginmanager import SkidmarkCSSPlugin
+
+class PluginSteps(PaletteScale):
+  """A list result that doesn't define variables"""
+  
+  defines_variables = False
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'steps')
+
+RESULT_PALETTE_SCALE = "a{color:#bcd;border-color:#123;background:#bf0040}\nb{color:#369;outline-color:gray}"
+
+class TestPalette(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.plugin_cache = skidmark.SkidmarkCSS.plugin_cache
+    skidmark.SkidmarkCSS.plugin_cache = PluginCache()
+    return
+  
+  def compile(self, config):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(config, self.load_file("palette_scale.sm"), sio_file)
+    return self.get_result(sio_file)
+  
+  def test_palette_variables(self):
+    self.assertTrue(self.compile(self.config) == RESULT_PALETTE_SCALE)
+    
+    self.config["plugin_workers"] = 0
+    self.assertTrue(self.compile(self.config) == RESULT_PALETTE_SCALE)
+    
+    return
+  
+  def test_palette_not_expanded(self):
+    skidmark.SkidmarkCSS.add_plugin(PluginSteps)
+    try:
+      sio_file = StringIO.StringIO()
+      self.assertRaises(skidmark.Unimplemented, skidmark.SkidmarkCSS, self.config, StringIO.StringIO("$blue = ~steps(#336699, 5);\na { color: $blue_1; }"), sio_file)
+    finally:
+      skidmark.SkidmarkCSS.plugins.pop("steps", None)
+    
+    return
+  
+  def test_palette_kernel(self):
+    color = HTMLColors.parse("#336699")
+    scale = ColorKernel.scale([ ( color, 3 ), ( color, 1 ) ])
+    
+    self.assertTrue([ [ HTMLColors.format(c) for c in colors ] for colors in scale ] == [ [ "#99b3cc", "#369", "#1a334d" ], [ "#369" ] ])
+    
+    white = PackedColor.from_rgb(255, 255, 255)
+    self.assertTrue(ColorKernel.mix([ color, color ], [ white, white ], [ 0.0, 1.0 ]) == [ color, white ])
+    self.assertTrue(ColorKernel.mix([], [], []) == [])
+    
+    return
+  
+  def test_palette_batch(self):
+    calls = [ ( ( "#336699", "3" ), {} ), ( ( "red", ), {} ) ]
+    scales = PaletteScale().eval_batch(calls)
+    
+    self.assertTrue(scales == [ PaletteScale().eval("#336699", "3"), PaletteScale().eval("red") ])
+    self.assertTrue(len(scales[1]) == 10)
+    self.assertRaises(Exception, PaletteScale().eval, "#336699", "0")
+    
+    return
+  
+  def tearDown(self):
+    skidmark.SkidmarkCSS.plugin_cache = self.plugin_cache
@@ -0,0 +1,82 @@
+# -*- coding: latin-1 -*-
+
+import threading
+import unittest
+
+from core.pluginmanager import SkidmarkCSSPlugin, PluginArg, PluginValue, Color, String, Unit, pluginargs
+from core.plugindefaults import PropertyDarken
+
+class PluginSize(SkidmarkCSSPlugin):
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'size')
+  
+  @pluginargs(Unit(10, type='px'), String("auto"))
+  def eval(self, size, mode):
+    return "%s %s" % ( size, mode.value )
+
+class Even(PluginArg):
+  """An argument defining validate() only"""
+  
+  def validate(self, value):
+    if int(value) % 2:
+      raise Exception("%s is not even" % ( value, ))
+    self.value = int(value)
+
+class Stripped(PluginArg):
+  """An argument extending the validate() of PluginArg"""
+  
+  def validate(self, value):
+    return super(Stripped, self).validate(value.strip())
+
+class EvenString(String):
+  """An argument extending the validate() of String"""
+  
+  def validate(self, value):
+    if len(value) % 2:
+      raise Exception("%s is not of even length" % ( value, ))
+    return super(EvenString, self).validate(value)
+
+class TestPluginArgs(unittest.TestCase):
+  def test_pluginargs_values(self):
+    unit = Unit(type='%', cast=int)
+    
+    value = unit.coerce("25%")
+    self.assertTrue(value == PluginValue(25, "%") and str(value) == "25%")
+    self.assertTrue(unit.coerce("25%") is value)
+    self.assertTrue(unit.value is None)
+    
+    self.assertRaises(Exception, unit.coerce, "25px")
+    self.assertRaises(Exception, Color().coerce, "notacolor")
+    self.assertTrue(String().coerce("text").value == "text")
+    self.assertTrue(Even().coerce("4").value == 4)
+    self.assertTrue(Stripped().coerce(" text ").value == "text")
+    self.assertTrue(EvenString().coerce("text").value == "text")
+    self.assertRaises(Exception, EvenString().coerce, "txt")
+    
+    unit = Unit(type="px", cast=int)
+    unit.validate("5px")
+    self.assertTrue(unit.value == 5 and str(unit) == "5px")
+    
+    self.assertTrue(PluginSize().eval() == "10px auto")
+    self.assertTrue(PluginSize().eval("5", "fixed") == "5px fixed")
+    
+    return
+  
+  def test_pluginargs_threads(self):
+    plugin = PropertyDarken()
+    colors = [ "#ff0000", "#00ff00", "#0000ff", "#ffffff" ] * 50
+    expected = [ plugin.eval(color, "10%") for color in colors ]
+    results = {}
+    
+    def darken(thread_idx):
+      results[thread_idx] = [ plugin.eval(color, "10%") for color in colors ]
+    
+    threads = [ threading.Thread(target=darken, args=( idx, )) for idx in range(4) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    
+    self.assertTrue([ results[idx] for idx in range(4) ] == [ expected ] * 4)
+    
+    return
@@ -0,0 +1,71 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import threading
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.plugincache import PluginCache
+from core.pluginmanager import SkidmarkCSSPlugin
+
+RESULT_PLUGINBATCH = "a{width:10px}\nb{width:20px;height:10px}\ni{width:30px;height:40px}"
+
+class PluginMeasure(SkidmarkCSSPlugin):
+  """Records its calls and the threads evaluating them"""
+  
+  batch = True
+  calls = []
+  threads = []
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'measure')
+  
+  def eval(self, size):
+    PluginMeasure.calls.append(size)
+    PluginMeasure.threads.append(threading.current_thread().name)
+    return "%spx" % ( size, )
+
+class TestPluginBatch(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.plugin_cache = skidmark.SkidmarkCSS.plugin_cache
+    skidmark.SkidmarkCSS.plugin_cache = PluginCache()
+    PluginMeasure.calls = []
+    PluginMeasure.threads = []
+    return
+  
+  def compile(self, config):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(config, self.load_file("pluginbatch_calls.sm"), sio_file, plugins=[ PluginMeasure ])
+    return self.get_result(sio_file)
+  
+  def test_pluginbatch_prefetch(self):
+    self.assertTrue(self.compile(self.config) == RESULT_PLUGINBATCH)
+    
+    # The constant calls are deduplicated and evaluated first, the call reading
+    # $width is evaluated while processing
+    self.assertTrue(sorted(PluginMeasure.calls[:3]) == [ "10", "20", "40" ])
+    self.assertTrue(PluginMeasure.calls[3:] == [ "30" ])
+    self.assertTrue(threading.current_thread().name not in PluginMeasure.threads[:3])
+    self.assertTrue(skidmark.SkidmarkCSS.plugin_cache.prefetched == {})
+    
+    return
+  
+  def test_pluginbatch_disabled(self):
+    self.assertTrue(self.compile(dict(self.config, plugin_workers=0)) == RESULT_PLUGINBATCH)
+    self.assertTrue(PluginMeasure.calls == [ "10", "20", "10", "30", "40" ])
+    
+    return
+  
+  def tearDown(self):
+    skidmark.SkidmarkCSS.plugin_cache = self.plugin_cache
+    skidmark.SkidmarkCSS.plugins.pop("measure", None)
@@ -0,0 +1,91 @@
+# -*- coding: latin-1 -*-
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.plugincache import PluginCache
+from core.pluginmanager import SkidmarkCSSPlugin
+
+RESULT_PLUGINCACHE = "a{color:#e50000}\nb{color:#e50000;background:1}\ni{color:#c00;border-color:2}"
+
+class PluginCounter(SkidmarkCSSPlugin):
+  """Returns the number of times it was evaluated (not pure)"""
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'counter')
+    self.count = 0
+  
+  def eval(self, *args):
+    self.count += 1
+    return str(self.count)
+
+class PluginDarken(SkidmarkCSSPlugin):
+  """Replaces the built-in darken plugin (pure)"""
+  
+  pure = True
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'darken')
+  
+  def eval(self, *args):
+    return "dark"
+
+class TestPluginCache(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.plugin_cache = skidmark.SkidmarkCSS.plugin_cache
+    skidmark.SkidmarkCSS.plugin_cache = PluginCache()
+    self.tmp_dir = tempfile.mkdtemp()
+    return
+  
+  def compile(self):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(self.config, self.load_file("plugincache_calls.sm"), sio_file, plugins=[ PluginCounter ])
+    return self.get_result(sio_file)
+  
+  def test_plugincache_stats(self):
+    self.assertTrue(self.compile() == RESULT_PLUGINCACHE)
+    
+    report = skidmark.SkidmarkCSS.plugin_cache.get_report()
+    self.assertTrue(report == [ ( "counter", 2, 0, 0.0 ), ( "darken", 3, 1, 100.0 / 3 ) ])
+    
+    return
+  
+  def test_plugincache_persisted(self):
+    self.compile()
+    cache_file = os.path.join(self.tmp_dir, "plugins.cache")
+    skidmark.SkidmarkCSS.plugin_cache.save(cache_file)
+    
+    skidmark.SkidmarkCSS.plugin_cache = PluginCache()
+    skidmark.SkidmarkCSS.plugin_cache.load(cache_file)
+    self.assertTrue(self.compile() == RESULT_PLUGINCACHE)
+    self.assertTrue(skidmark.SkidmarkCSS.plugin_cache.stats["darken"] == [ 3, 3 ])
+    
+    return
+  
+  def test_plugincache_replaced(self):
+    src = "a { color: ~darken(red, 10%); }"
+    self.assertTrue(skidmark.compile_bytes(src, **self.config) == "a{color:#e50000}\n")
+    
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(self.config, StringIO.StringIO(src), sio_file, plugins=[ PluginDarken ])
+    self.assertTrue(self.get_result(sio_file) == "a{color:dark}")
+    
+    return
+  
+  def tearDown(self):
+    skidmark.SkidmarkCSS.plugin_cache = self.plugin_cache
+    shutil.rmtree(self.tmp_dir)
@@ -0,0 +1,86 @@
+# -*- coding: latin-1 -*-
+
+import os
+import StringIO
+import unittest
+
+import pkg_resources
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+from core.pluginmanager import SkidmarkCSSPlugin
+
+RESULT_PLUGINREGISTRY = "a{content:HELLO;color:red}"
+RESULT_PLUGINREGISTRY_LOCAL = "a{content:HELLO}"
+
+class PluginShout(SkidmarkCSSPlugin):
+  """Registered by the entry point of tests/testfiles/plugins"""
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'shout')
+  
+  def eval(self, text):
+    return text.upper()
+
+class PluginDarken(SkidmarkCSSPlugin):
+  """Replaces the built-in darken plugin of a compilation"""
+  
+  def __init__(self):
+    SkidmarkCSSPlugin.__init__(self, 'darken')
+  
+  def eval(self, text):
+    return text.upper()
+
+class TestPluginRegistry(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.working_set = pkg_resources.working_set.__getstate__()
+    return
+  
+  def compile(self):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(self.config, self.load_file("pluginregistry_entrypoint.sm"), sio_file)
+    return self.get_result(sio_file)
+  
+  def test_pluginregistry_builtins(self):
+    skidmark.SkidmarkCSS.load_plugins()
+    darken = skidmark.SkidmarkCSS.plugins["darken"]
+    
+    skidmark.SkidmarkCSS(self.config, StringIO.StringIO("a { color: red; }"), StringIO.StringIO())
+    self.assertTrue(skidmark.SkidmarkCSS.plugins["darken"] is darken)
+    
+    return
+  
+  def test_pluginregistry_entry_points(self):
+    self.assertTrue(skidmark.SkidmarkCSS.get_plugin("shout") is None)
+    
+    pkg_resources.working_set.add_entry(os.path.join("tests", "testfiles", "plugins"))
+    
+    self.assertTrue(self.compile() == RESULT_PLUGINREGISTRY)
+    self.assertTrue(isinstance(skidmark.SkidmarkCSS.plugins["shout"], PluginShout))
+    
+    return
+  
+  def test_pluginregistry_local(self):
+    skidmark.SkidmarkCSS.load_plugins()
+    darken = skidmark.SkidmarkCSS.plugins["darken"]
+    
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(self.config, StringIO.StringIO("a { content: ~darken(hello); }"), sio_file, plugins=[ PluginDarken ])
+    
+    self.assertTrue(self.get_result(sio_file) == RESULT_PLUGINREGISTRY_LOCAL)
+    self.assertTrue(skidmark.SkidmarkCSS.plugins["darken"] is darken)
+    
+    return
+  
+  def tearDown(self):
+    skidmark.SkidmarkCSS.plugins.pop("shout", None)
+    pkg_resources.working_set.__setstate__(self.working_set)
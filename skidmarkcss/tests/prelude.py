@@ -0,0 +1,57 @@
+# -*- coding: latin-1 -*-
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_PRELUDE = "a{color:red;padding:2px}"
+
+class TestPrelude(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.tmp_dir = tempfile.mkdtemp()
+    return
+  
+  def compile(self, config, filename):
+    sio_file = StringIO.StringIO()
+    skidmark.SkidmarkCSS(config, os.path.join("tests", "testfiles", filename), sio_file)
+    return self.get_result(sio_file)
+  
+  def test_prelude_snapshot(self):
+    snapshot = skidmark.create_prelude_snapshot(os.path.join("tests", "testfiles", "prelude_vars.sm"), **self.config)
+    
+    self.assertTrue(snapshot.includes(os.path.join("tests", "testfiles", "prelude_vars.sm")))
+    self.assertTrue(self.compile(dict(prelude=snapshot), "prelude_main.sm") == RESULT_PRELUDE)
+    
+    # The state of the snapshot is restored by every compilation
+    skidmark.VARIABLE_STACK[:] = []
+    skidmark.TEMPLATES.clear()
+    self.assertTrue(self.compile(dict(prelude=snapshot), "prelude_main.sm") == RESULT_PRELUDE)
+    
+    return
+  
+  def test_prelude_serialized(self):
+    snapshot_file = os.path.join(self.tmp_dir, "prelude.smp")
+    skidmark.create_prelude_snapshot(os.path.join("tests", "testfiles", "prelude_vars.sm"), **self.config).save(snapshot_file)
+    
+    snapshot = skidmark.PreludeSnapshot.load(snapshot_file)
+    self.assertTrue(snapshot.is_current())
+    self.assertTrue(self.compile(dict(self.config, prelude=snapshot), "prelude_main.sm") == RESULT_PRELUDE)
+    
+    return
+  
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
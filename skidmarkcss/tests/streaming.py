@@ -0,0 +1,44 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_STREAMING_ITEMS = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{color:#ff0000;padding:2px}\n@media print {a{color:black}}\nul li{margin:0}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { color: #ff0000; padding: 2px; }\n@media print  { a { color: black; } }\nul li { margin: 0; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\scolor: #ff0000;\n\\spadding: 2px;\n}\n\n@media print  {\n\\sa {\n\\s\\scolor: black;\n\\s}\n}\n\nul li {\n\\smargin: 0;\n}"
+}
+
+class TestStreaming(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      streaming=True
+    )
+    return
+  
+  def test_streaming_items(self):
+    results = self.get_test_results(self.config, "streaming_items.sm")
+    
+    for style, expected_result in RESULT_STREAMING_ITEMS.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_streaming_incompatible(self):
+    self.config["unify_selectors"] = True
+    self.assertRaises(skidmark.InvalidArgumentException, self.get_test_results, self.config, "streaming_items.sm")
+    
+    return
+  
+  def tearDown(self):
+    pass
@@ -0,0 +1,139 @@
+# -*- coding: latin-1 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import wsgiref.util
+
+import smwsgi
+import skidmark
+
+RESULT_WSGI_CSS = "a{color:red;padding:2px}\n"
+RESULT_WSGI_CSS_CHANGED = "a{color:blue;padding:2px}\n"
+
+class TestStylesheetServer(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self.tmp_dir, "css"))
+    for filename in ( "prelude_main.sm", "prelude_vars.sm" ):
+      shutil.copy(os.path.join("tests", "testfiles", filename), os.path.join(self.tmp_dir, "css", filename))
+    
+    self.app = smwsgi.SkidmarkApp(self.tmp_dir, dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED))
+    return
+  
+  def request(self, app, path, method="GET", **headers):
+    environ = dict(PATH_INFO=path, REQUEST_METHOD=method)
+    environ.update(headers)
+    wsgiref.util.setup_testing_defaults(environ)
+    
+    response = {}
+    def start_response(status, headers):
+      response["status"] = status
+      response["headers"] = dict(headers)
+    
+    body = "".join(app(environ, start_response))
+    
+    return response["status"], response["headers"], body
+  
+  def test_wsgi_app(self):
+    status, headers, body = self.request(self.app, "/css/prelude_main.css")
+    
+    self.assertTrue(status == "200 OK" and body == RESULT_WSGI_CSS)
+    self.assertTrue(headers["Content-Type"] == "text/css; charset=utf-8")
+    self.assertTrue(headers["Cache-Control"] == "no-cache" and headers["ETag"])
+    
+    # Served from the cache, or not at all when the client has it
+    self.assertTrue(self.request(self.app, "/css/prelude_main.css")[2] == RESULT_WSGI_CSS)
+    status, headers_304, body = self.request(self.app, "/css/prelude_main.css", HTTP_IF_NONE_MATCH=headers["ETag"])
+    self.assertTrue(status == "304 Not Modified" and body == "" and headers_304["ETag"] == headers["ETag"])
+    self.assertTrue(self.app.compiles == 1)
+    
+    self.assertTrue(self.request(self.app, "/css/prelude_vars.sm")[0] == "404 Not Found")
+    self.assertTrue(self.request(self.app, "/css/missing.css")[0] == "404 Not Found")
+    self.assertTrue(self.request(self.app, "/../prelude_main.css")[0] == "404 Not Found")
+    self.assertTrue(self.request(self.app, "/css/prelude_main.css", "POST")[0] == "405 Method Not Allowed")
+    
+    return
+  
+  def test_wsgi_included_change(self):
+    status, headers, body = self.request(self.app, "/css/prelude_main.css")
+    
+    # The included file changes: the ETag doesn't match anymore
+    f = open(os.path.join(self.tmp_dir, "css", "prelude_vars.sm"), "ab")
+    f.write("$color = blue;\n")
+    f.close()
+    
+    status, headers_changed, body = self.request(self.app, "/css/prelude_main.css", HTTP_IF_NONE_MATCH=headers["ETag"])
+    self.assertTrue(status == "200 OK" and body == RESULT_WSGI_CSS_CHANGED)
+    self.assertTrue(headers_changed["ETag"] != headers["ETag"] and self.app.compiles == 2)
+    
+    return
+  
+  def test_wsgi_changed_during_compile(self):
+    vars_file = os.path.join(self.tmp_dir, "css", "prelude_vars.sm")
+    
+    # The included file changes once the compiler read it
+    def change(filename, dependencies):
+      f = open(vars_file, "ab")
+      f.write("$color = blue;\n")
+      f.close()
+      os.utime(vars_file, ( time.time() + 10, time.time() + 10 ))
+      del self.app.dependencies.set
+      self.app.dependencies.set(filename, dependencies)
+    
+    self.app.dependencies.set = change
+    status, headers, body = self.request(self.app, "/css/prelude_main.css")
+    self.assertTrue(status == "200 OK" and body == RESULT_WSGI_CSS and "ETag" not in headers)
+    
+    status, headers, body = self.request(self.app, "/css/prelude_main.css")
+    self.assertTrue(body == RESULT_WSGI_CSS_CHANGED and headers["ETag"] and self.app.compiles == 2)
+    
+    return
+  
+  def test_wsgi_error(self):
+    f = open(os.path.join(self.tmp_dir, "css", "error.sm"), "wb")
+    f.write(u"a { color: ~d\xe9ja(red); }\n".encode("utf-8"))
+    f.close()
+    
+    status, headers, body = self.request(self.app, "/css/error.css")
+    self.assertTrue(status == "500 Internal Server Error" and headers["Content-Type"] == "text/plain; charset=utf-8")
+    self.assertTrue(body.decode("utf-8") == u"Unimplemented: No suitable plugins found for 'd\xe9ja'")
+    
+    return
+  
+  def test_wsgi_concurrent(self):
+    compile = self.app._compile
+    def slow_compile(filename):
+      time.sleep(0.05)
+      return compile(filename)
+    self.app._compile = slow_compile
+    
+    bodies = []
+    threads = [ threading.Thread(target=lambda: bodies.append(self.request(self.app, "/css/prelude_main.css")[2])) for cnt in range(8) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    
+    self.assertTrue(bodies == [ RESULT_WSGI_CSS ] * 8 and self.app.compiles == 1)
+    
+    return
+  
+  def test_wsgi_middleware(self):
+    def application(environ, start_response):
+      start_response("200 OK", [ ( "Content-Type", "text/plain" ) ])
+      return [ "app" ]
+    
+    middleware = smwsgi.SkidmarkMiddleware(application, os.path.join(self.tmp_dir, "css"), "/static", config=dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED))
+    
+    self.assertTrue(self.request(middleware, "/static/prelude_main.css")[2] == RESULT_WSGI_CSS)
+    self.assertTrue(self.request(middleware, "/static/other.css")[2] == "app")
+    self.assertTrue(self.request(middleware, "/prelude_main.css")[2] == "app")
+    
+    return
+  
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
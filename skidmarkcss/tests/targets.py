@@ -0,0 +1,68 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_TARGETS_MODERN = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{opacity:0.5;border-radius:2px}\nb{background:red;background:linear-gradient(top, red 0%,blue 100%)}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { opacity: 0.5; border-radius: 2px; }\nb { background: red; background: linear-gradient(top, red 0%,blue 100%); }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\sopacity: 0.5;\n\\sborder-radius: 2px;\n}\n\nb {\n\\sbackground: red;\n\\sbackground: linear-gradient(top, red 0%,blue 100%);\n}"
+}
+
+RESULT_TARGETS_FIREFOX_IE = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{opacity:0.5;-moz-opacity:0.5;filter:alpha(opacity=50);border-radius:2px;-moz-border-radius:2px}\nb{background:red;background:-moz-linear-gradient(top, red 0%,blue 100%);background:linear-gradient(top, red 0%,blue 100%);filter:progid:DXImageTransform.Microsoft.gradient(startColorstr='red',endColorstr='blue',GradientType=0)}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { opacity: 0.5; -moz-opacity: 0.5; filter: alpha(opacity=50); border-radius: 2px; -moz-border-radius: 2px; }\nb { background: red; background: -moz-linear-gradient(top, red 0%,blue 100%); background: linear-gradient(top, red 0%,blue 100%); filter: progid:DXImageTransform.Microsoft.gradient(startColorstr='red',endColorstr='blue',GradientType=0); }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\sopacity: 0.5;\n\\s-moz-opacity: 0.5;\n\\sfilter: alpha(opacity=50);\n\\sborder-radius: 2px;\n\\s-moz-border-radius: 2px;\n}\n\nb {\n\\sbackground: red;\n\\sbackground: -moz-linear-gradient(top, red 0%,blue 100%);\n\\sbackground: linear-gradient(top, red 0%,blue 100%);\n\\sfilter: progid:DXImageTransform.Microsoft.gradient(startColorstr='red',endColorstr='blue',GradientType=0);\n}"
+}
+
+class TestTargets(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False
+    )
+    return
+  
+  def test_targets_modern(self):
+    self.config["browser_targets"] = "modern"
+    results = self.get_test_results(self.config, "targets_prefixes.sm")
+    
+    for style, expected_result in RESULT_TARGETS_MODERN.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_targets_firefox_ie(self):
+    self.config["browser_targets"] = "firefox3,ie8"
+    results = self.get_test_results(self.config, "targets_prefixes.sm")
+    
+    for style, expected_result in RESULT_TARGETS_FIREFOX_IE.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_targets_unknown(self):
+    self.config["browser_targets"] = "ie99"
+    self.assertRaises(skidmark.InvalidArgumentException, self.get_test_results, self.config, "targets_prefixes.sm")
+    
+    return
+  
+  def test_targets_report(self):
+    report = skidmark.get_target_report(self.load_file("targets_prefixes.sm").read(), [ "modern" ], **self.config)
+    self.assertTrue(len(report) == 1 and report[0][0] == "modern" and report[0][2] > 0)
+    
+    self.assertRaises(skidmark.ErrorInFile, skidmark.get_target_report, "a { color red; }", [ "modern" ], **self.config)
+    
+    return
+  
+  def tearDown(self):
+    pass
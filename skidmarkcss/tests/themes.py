@@ -0,0 +1,59 @@
+# -*- coding: latin-1 -*-
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_THEMES_DEFAULT = "a{color:red;margin:4px}\nb{padding:2px}\ni{margin:0}"
+RESULT_THEMES_COLOR = "a{color:blue;margin:4px}\nb{padding:2px}\ni{margin:0}"
+RESULT_THEMES_SIZE = "a{color:red;margin:2em}\nb{padding:1em}\ni{margin:0}"
+
+class TestThemes(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=False,
+      incremental=True,
+      output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED
+    )
+    self.tmp_dir = tempfile.mkdtemp()
+    return
+  
+  def render(self, sm, variables):
+    sio_file = StringIO.StringIO()
+    items_rendered = sm.render(variables, sio_file)
+    return items_rendered, self.get_result(sio_file)
+  
+  def test_themes_render(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("themes_variables.sm"))
+    
+    self.assertTrue(self.render(sm, {}) == ( 0, RESULT_THEMES_DEFAULT ))
+    self.assertTrue(self.render(sm, { "color": "blue" }) == ( 1, RESULT_THEMES_COLOR ))
+    
+    # $double is computed from $size
+    self.assertTrue(self.render(sm, { "$size": "1em" }) == ( 3, RESULT_THEMES_SIZE ))
+    self.assertTrue(self.render(sm, {}) == ( 0, RESULT_THEMES_DEFAULT ))
+    
+    return
+  
+  def test_themes_files(self):
+    sm = skidmark.SkidmarkCSS(self.config, self.load_file("themes_variables.sm"))
+    outfiles = sm.render_themes({ "blue": { "color": "blue" }, "large": { "size": "1em" } }, os.path.join(self.tmp_dir, "site-%s.css"))
+    
+    self.assertTrue(outfiles == [ os.path.join(self.tmp_dir, "site-blue.css"), os.path.join(self.tmp_dir, "site-large.css") ])
+    self.assertTrue(self.normalize_string(open(outfiles[0]).read()) == RESULT_THEMES_COLOR)
+    self.assertTrue(self.normalize_string(open(outfiles[1]).read()) == RESULT_THEMES_SIZE)
+    
+    return
+  
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
@@ -0,0 +1,53 @@
+# -*- coding: latin-1 -*-
+
+import StringIO
+import unittest
+
+import skidmark
+from skidmarktestloader import SkidmarkTestLoader
+
+RESULT_UNIFY = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "a{color:red;padding:1px}\nb{margin:0}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "a { color: red; padding: 1px; }\nb { margin: 0; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "a {\n\\scolor: red;\n\\spadding: 1px;\n}\n\nb {\n\\smargin: 0;\n}"
+}
+
+RESULT_MERGE = {
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED: "i,em{color:blue}\nb{margin:0}\np{margin-top:2px}\nspan{margin:0}",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_COMPACT: "i, em { color: blue; }\nb { margin: 0; }\np { margin-top: 2px; }\nspan { margin: 0; }",
+  skidmark.skidmarkoutputs.CSS_OUTPUT_CLEAN: "i,\nem {\n\\scolor: blue;\n}\n\nb {\n\\smargin: 0;\n}\n\np {\n\\smargin-top: 2px;\n}\n\nspan {\n\\smargin: 0;\n}"
+}
+
+class TestUnification(unittest.TestCase, SkidmarkTestLoader):
+  def setUp(self):
+    self.config = dict(
+      verbose=False,
+      timer=False,
+      printcss=False,
+      show_hierarchy=False,
+      simplify_output=True,
+      unify_selectors=True,
+      merge_declarations=True
+    )
+    return
+  
+  def test_unify(self):
+    results = self.get_test_results(self.config, "unification_unify.sm")
+    
+    for style, expected_result in RESULT_UNIFY.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def test_merge(self):
+    results = self.get_test_results(self.config, "unification_merge.sm")
+    
+    for style, expected_result in RESULT_MERGE.iteritems():
+      res = self.get_style_result(style, results)
+      self.assertTrue(res == self.normalize_string(expected_result).replace("\\s", " " * skidmark.skidmarkoutputs.SPACING_CLEAN))
+    
+    return
+  
+  def tearDown(self):
+    pass
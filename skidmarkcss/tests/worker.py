@@ -0,0 +1,99 @@
+# -*- coding: latin-1 -*-
+
+import json
+import os
+import StringIO
+import unittest
+
+import skidmark
+
+REQUESTS_WORKER = [
+  dict(id=1, infile=os.path.join("tests", "testfiles", "prelude_main.sm")),
+  dict(id=2, source="$a = 2px;\nb { margin: ($a * 2); }"),
+  dict(id=3, source="a { color: $a; }"),
+  dict(id=4, infile=os.path.join("tests", "testfiles", "prelude_main.sm"), config=dict(prelude=os.path.join("tests", "testfiles", "prelude_vars.sm")))
+]
+
+RESULT_WORKER_CSS = "a{color:red;padding:2px}\n"
+
+class TestWorker(unittest.TestCase):
+  def setUp(self):
+    self.config = dict(output_format=skidmark.skidmarkoutputs.CSS_OUTPUT_COMPRESSED)
+    return
+  
+  def run_worker(self, lines, **kw):
+    outstream = StringIO.StringIO()
+    worker = skidmark.SkidmarkWorker(StringIO.StringIO("\n".join(lines) + "\n"), outstream, self.config, **kw)
+    count = worker.run()
+    return count, [ json.loads(line) for line in outstream.getvalue().splitlines() ]
+  
+  def test_worker_requests(self):
+    count, results = self.run_worker([ json.dumps(request) for request in REQUESTS_WORKER ])
+    
+    self.assertTrue(count == 4 and [ result["id"] for result in results ] == [ 1, 2, 3, 4 ])
+    self.assertTrue(results[0]["ok"] and results[0]["css"] == RESULT_WORKER_CSS)
+    self.assertTrue(results[1]["ok"] and results[1]["css"] == "b{margin:4px}\n")
+    self.assertTrue(results[3]["ok"] and results[3]["css"] == RESULT_WORKER_CSS)
+    self.assertTrue("total" in results[3]["timings"] and "ast" in results[3]["timings"])
+    
+    # The variables of a request are not seen by the next one
+    self.assertTrue(not results[2]["ok"] and results[2]["error"]["type"] == "VariableNotFound")
+    
+    return
+  
+  def test_worker_invalid(self):
+    count, results = self.run_worker([ "not json", "", json.dumps(dict(id=5)) ])
+    
+    self.assertTrue(count == 2)
+    self.assertTrue(results[0]["error"]["type"] == "ValueError")
+    self.assertTrue(results[1]["id"] == 5 and results[1]["error"]["type"] == "InvalidArgumentException")
+    
+    return
+  
+  def test_worker_unicode_error(self):
+    count, results = self.run_worker([ json.dumps(dict(id=1, source=u"a { color: ~d\xe9ja(red); }")), json.dumps(dict(id=2, source="a { color: red; }")) ])
+    
+    self.assertTrue(count == 2 and [ result["id"] for result in results ] == [ 1, 2 ])
+    self.assertTrue(results[0]["error"]["type"] == "Unimplemented" and u"d\xe9ja" in results[0]["error"]["message"])
+    self.assertTrue(results[1]["ok"] and results[1]["css"] == "a{color:red}\n")
+    
+    return
+  
+  def test_worker_limits(self):
+    count, results = self.run_worker([ json.dumps(request) for request in REQUESTS_WORKER ], max_requests=2)
+    self.assertTrue(count == 2 and len(results) == 2)
+    
+    # A request followed by nothing, the pipe is not closed
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, json.dumps(REQUESTS_WORKER[1]) + "\n")
+    instream = os.fdopen(read_fd, "rb")
+    outstream = StringIO.StringIO()
+    
+    try:
+      worker = skidmark.SkidmarkWorker(instream, outstream, self.config, idle_timeout=0.1)
+      self.assertTrue(worker.run() == 1)
+    finally:
+      instream.close()
+      os.close(write_fd)
+    
+    self.assertTrue(json.loads(outstream.getvalue())["css"] == "b{margin:4px}\n")
+    
+    return
+  
+  def test_worker_ast_cache(self):
+    src = "c { padding: 1px; }"
+    request = json.dumps(dict(source=src)) + "\n"
+    
+    worker = skidmark.SkidmarkWorker(StringIO.StringIO(request * 2), StringIO.StringIO(), self.config)
+    self.assertTrue(worker.run() == 2)
+    self.assertTrue(worker.ast_cache.get_stats()["hits"] == 1)
+    self.assertTrue(worker.ast_cache.get_stats()["bytes"] == len(src))
+    
+    self.assertTrue(skidmark.SkidmarkCSS.ast_cache is None)
+    skidmark.processFromString(src)
+    self.assertTrue(worker.ast_cache.get_stats()["hits"] == 1)
+    
+    return
+  
+  def tearDown(self):
+    pass